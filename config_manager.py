@@ -53,11 +53,13 @@ def guardar_ruta_base(ruta_base):
     with open(USER_BASE_FILE, "w", encoding="utf-8") as f:
         f.write(ruta_base)
 
-def obtener_ruta(nombre_ruta):
+def obtener_ruta(nombre_ruta, config=None):
     """
     Obtiene una ruta específica del archivo de configuración + la carpeta principal.
+    'config' permite reutilizar una configuración ya cargada (evita releer el JSON).
     """
-    config = cargar_configuracion()
+    if config is None:
+        config = cargar_configuracion()
     relativa = config.get(nombre_ruta)
     
     if not relativa:
@@ -79,3 +81,12 @@ def obtener_ruta(nombre_ruta):
         os.makedirs(path, exist_ok=True)
     
     return path
+
+def obtener_opcion(nombre_opcion, valor_por_defecto=None, config=None):
+    """
+    Obtiene una opción (no ruta) del archivo de configuración.
+    Si la clave no existe se devuelve el valor por defecto.
+    """
+    if config is None:
+        config = cargar_configuracion()
+    return config.get(nombre_opcion, valor_por_defecto)
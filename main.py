@@ -1,3 +1,4 @@
+import multiprocessing
 import tkinter as tk
 from views.vista1_bienvenida import VistaBienvenida
 from views.vista3_resultados import VistaResultados
@@ -72,5 +73,7 @@ class AgilePredictApp(tk.Tk):
         self.show_frame(VistaExportar)
 
 if __name__ == "__main__":
+    # Necesario para el ETL en paralelo (ProcessPoolExecutor) en el ejecutable de Windows
+    multiprocessing.freeze_support()
     app = AgilePredictApp()
     app.mainloop()
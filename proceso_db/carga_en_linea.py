@@ -0,0 +1,141 @@
+import os
+import queue
+import threading
+from proceso_db import cargar_bd
+from proceso_db.scripts.contexto_carga import ContextoCarga
+from proceso_db.scripts.fact import cargar_factAccident, cargar_factTraffic, cargar_factVehicleAccident
+from proceso_etl import deteccion_auto
+
+# --- Carga en línea ('carga_en_linea' en config.json) ---
+# La transformación (Excel -> DataFrame) y la carga a la base corren a la vez: cada DataFrame
+# limpio pasa por una cola acotada directo a su cargador de hechos, sin volver a leer el CSV,
+# que se escribe en segundo plano como registro (y para identificar la carga por su hash).
+
+# Tipo de archivo del ETL -> (título de la etapa, cargador de hechos)
+CARGADORES_EN_LINEA = {
+    'trafico': ("Cargando datos de Tráfico", cargar_factTraffic),
+    'siniestralidad': ("Cargando datos de Siniestralidad (Accidentes)", cargar_factAccident),
+    'vehiculos': ("Cargando datos de Vehículos", cargar_factVehicleAccident),
+}
+
+# Archivos transformados que pueden esperar en memoria a que la carga los tome
+# (además del que se está cargando y del que se está transformando)
+TAMANO_COLA = 1
+
+def ejecutar_en_linea(callback_etl, callback_db, cancel_event):
+    """
+    Función llamada desde la GUI en lugar de ejecutar_proceso_etl_completo seguido de
+    ejecutar_carga_db_completa. La transformación corre en un hilo propio y la carga en el
+    hilo actual (dueño de la conexión). Si la carga falla se detiene la transformación y se
+    relanza el error.
+    Devuelve (resumen_etl, resumen_db, cancelado).
+    """
+    cola = queue.Queue(maxsize=TAMANO_COLA)
+    detener = threading.Event() # Cancelación del usuario o falla de la carga
+    resultado_etl = {}
+
+    def transformar():
+        try:
+            resultado_etl['resumen'] = deteccion_auto.ejecutar_proceso_etl_en_linea(cola, callback_etl, detener)
+        except Exception as e:
+            # ejecutar_proceso_etl_en_linea ya puso el fin de la cola: la carga no queda esperando
+            resultado_etl['error'] = e
+
+    hilo_etl = threading.Thread(target=transformar, name="etl_en_linea", daemon=True)
+    hilo_etl.start()
+    try:
+        resumen_db = _cargar_desde_cola(cola, callback_db, cancel_event, detener)
+    except Exception:
+        detener.set()
+        raise
+    finally:
+        hilo_etl.join()
+
+    if 'error' in resultado_etl:
+        raise resultado_etl['error']
+    resumen_etl, _, cancelado_etl = resultado_etl['resumen']
+    return resumen_etl, resumen_db, cancelado_etl or cancel_event.is_set()
+
+def _cargar_desde_cola(cola, callback_progreso, cancel_event, detener):
+    """
+    Consumidor de la cola: crea estructura y dimensiones (mientras se transforma el primer
+    archivo), carga cada archivo apenas llega y, al final, repasa las carpetas con la carga
+    normal para los CSV que no pasaron por la cola (cargas con errores o Ficha 1 invalidada
+    por reemplazos de Ficha 0) y ejecuta la post-carga.
+    """
+    contexto = None
+    try:
+        callback_progreso("Iniciando carga en línea a la Base de Datos...")
+        contexto = ContextoCarga()
+
+        callback_progreso("\n--- FASE 1: CREANDO ESTRUCTURA Y DIMENSIONES ---")
+        for titulo, modulo in cargar_bd.scripts_creacion:
+            if cancel_event.is_set():
+                return _cancelar(callback_progreso, detener)
+            cargar_bd.ejecutar_etapa(contexto, titulo, modulo, callback_progreso)
+
+        callback_progreso("\n--- FASE 2: CARGANDO DATOS DE HECHOS (EN LÍNEA) ---")
+        while True:
+            try:
+                entrega = cola.get(timeout=0.5)
+            except queue.Empty:
+                if cancel_event.is_set():
+                    return _cancelar(callback_progreso, detener)
+                continue
+            if entrega is None:
+                break
+            if cancel_event.is_set():
+                return _cancelar(callback_progreso, detener)
+
+            ruta_csv = entrega['ruta_csv']
+            nombre_csv = os.path.basename(ruta_csv)
+            try:
+                # El libro de cargas identifica el archivo por el hash del CSV escrito
+                entrega['guardado'].result()
+            except Exception as e:
+                callback_progreso(f"ERROR: No se pudo guardar '{nombre_csv}' ({e}). No se cargará.")
+                continue
+
+            titulo, modulo = CARGADORES_EN_LINEA[entrega['tipo']]
+            contexto.entregar_limpio(ruta_csv, entrega.pop('df'))
+            cargar_bd.ejecutar_etapa(contexto, f"{titulo}: {nombre_csv}", modulo, callback_progreso, archivos_csv=[ruta_csv])
+            contexto.descartar_limpios()
+
+        # Repaso y post-carga, igual que la carga normal
+        scripts_finales = cargar_bd.scripts_carga_hechos + cargar_bd.scripts_post_carga
+        callback_progreso("\n--- FASE 3: REPASANDO PENDIENTES Y ENRIQUECIENDO DATOS (POST-CARGA) ---")
+        for scripts_completados, (titulo, modulo) in enumerate(scripts_finales, start=1):
+            if cancel_event.is_set():
+                return _cancelar(callback_progreso, detener)
+            cargar_bd.ejecutar_etapa(contexto, titulo, modulo, callback_progreso)
+            callback_progreso("", scripts_completados, len(scripts_finales))
+
+        cargar_bd.reportar_tiempos(contexto, callback_progreso)
+
+        resumen = "Carga a la Base de Datos completada con éxito."
+        callback_progreso(f"\n\n--- {resumen} ---")
+        return resumen
+
+    except Exception as e:
+        error_msg = f"El proceso de carga a DB se interrumpió: {e}"
+        callback_progreso(error_msg)
+        raise e
+    finally:
+        if contexto is not None:
+            contexto.cerrar()
+
+def _cancelar(callback_progreso, detener):
+    detener.set()
+    callback_progreso("Carga a DB cancelada por el usuario.")
+    return "Carga de Base de Datos cancelada."
+
+# --- Esto permite probar el script de forma independiente ---
+if __name__ == "__main__":
+
+    # Un 'callback' falso que solo imprime a consola
+    def simple_print_callback(mensaje, actual=0, total=0):
+        print(mensaje)
+
+    print("Ejecutando carga_en_linea.py en modo de prueba...")
+    resumen_etl, resumen_db, _ = ejecutar_en_linea(lambda *args: None, simple_print_callback, threading.Event())
+    print(f"ETL 1: {resumen_etl}\nETL 2: {resumen_db}")
@@ -1,7 +1,8 @@
-import time
+from proceso_db.scripts.contexto_carga import ContextoCarga
+from utils.memoria import texto_memoria_maxima
 
 # --- 0. Importar directamente los módulos ---
-from proceso_db.scripts import crear_tablas
+from proceso_db.scripts import crear_tablas, optimizar_bd
 from proceso_db.scripts.dim import cargar_dimDateTime, cargar_dimensiones, cargar_dimKm
 from proceso_db.scripts.fact import cargar_factAccident, cargar_factAccident_conteo, cargar_factTraffic, cargar_factVehicleAccident
 
@@ -20,17 +21,37 @@ scripts_carga_hechos = [
 ]
 
 scripts_post_carga = [
+    ("Creando índices y actualizando estadísticas...", optimizar_bd),
     ("Calculando totales y estadísticas...", cargar_factAccident_conteo)
 ]
 
 # --- 2. Lógica Principal como función ---
+def ejecutar_etapa(contexto, titulo, modulo, callback_progreso, **opciones):
+    """Ejecuta un script (modulo.run) como etapa del contexto, informando inicio y duración."""
+    callback_progreso(f"\n>>> {titulo}")
+    with contexto.etapa(titulo):
+        modulo.run(callback_progreso, contexto, **opciones)
+    callback_progreso(f"--- Finalizado: {titulo} (Duración: {contexto.tiempos[titulo]:.2f}s) ---")
+
+def reportar_tiempos(contexto, callback_progreso):
+    callback_progreso("\nResumen de tiempos por etapa:")
+    for titulo, duracion in contexto.tiempos.items():
+        callback_progreso(f"  {duracion:>8.2f}s  {titulo}")
+    callback_progreso(f"  {sum(contexto.tiempos.values()):>8.2f}s  Total")
+    memoria = texto_memoria_maxima()
+    if memoria:
+        callback_progreso(memoria)
+
 def ejecutar_carga_db_completa(callback_progreso, cancel_event):
     """
     Función principal llamada desde la GUI.
     Acepta un callback para enviar logs.
     """
+    # Un único contexto (configuración, conexión y mapas en caché) para todas las etapas
+    contexto = None
     try:
         callback_progreso("Iniciando proceso de carga a la Base de Datos...")
+        contexto = ContextoCarga()
         
         all_scripts = [
             ("--- FASE 1: CREANDO ESTRUCTURA Y DIMENSIONES ---", scripts_creacion),
@@ -49,17 +70,15 @@ def ejecutar_carga_db_completa(callback_progreso, cancel_event):
                     callback_progreso("Carga a DB cancelada por el usuario.")
                     return "Carga de Base de Datos cancelada."
                 
-                callback_progreso(f"\n>>> {titulo}")
-                start_time = time.time()
-                modulo.run(callback_progreso)
-                end_time = time.time()
-                callback_progreso(f"--- Finalizado: {titulo} (Duración: {end_time - start_time:.2f}s) ---")
+                ejecutar_etapa(contexto, titulo, modulo, callback_progreso)
 
                 # --- Actualizar progreso ---
                 scripts_completados += 1
                 # Enviamos mensaje vacío para no ensuciar el log, pero pasamos los números
                 callback_progreso("", scripts_completados, total_scripts)
         
+        reportar_tiempos(contexto, callback_progreso)
+
         resumen = "Carga a la Base de Datos completada con éxito."
         callback_progreso(f"\n\n--- {resumen} ---")
         return resumen
@@ -69,6 +88,9 @@ def ejecutar_carga_db_completa(callback_progreso, cancel_event):
         callback_progreso(error_msg)
         # Re-lanzar la excepción para que el hilo de la GUI la capture
         raise e
+    finally:
+        if contexto is not None:
+            contexto.cerrar()
 
 # --- Esto permite probar el script de forma independiente ---
 if __name__ == "__main__":
@@ -0,0 +1,169 @@
+import numpy as np
+import pandas as pd
+
+# Formato de la columna DateTime en dim_DateTime
+FORMATO_DATETIME = '%Y-%m-%d %H:%M:%S'
+
+
+def _como_serie(valores):
+    """Convierte arrays/listas a Series conservando el índice si ya es Series."""
+    if isinstance(valores, pd.Series):
+        return valores
+    return pd.Series(valores)
+
+
+def parsear_fechas(valores, formatos=None):
+    """
+    Convierte una columna de texto a datetime64 de forma vectorizada.
+    Sólo se parsean los valores únicos (un mes de tráfico tiene ~30 fechas
+    distintas para cientos de miles de filas) y luego se expanden por código.
+    'formatos' es una lista de formatos a probar en orden; None usa la inferencia de pandas.
+    Los valores que no calzan con ningún formato quedan como NaT.
+    Una columna que ya es datetime64 (copia columnar del CSV limpio) se devuelve sin parsear.
+    """
+    serie = _como_serie(valores)
+    if pd.api.types.is_datetime64_dtype(serie):
+        return serie.astype('datetime64[ns]')
+    codigos, unicos = pd.factorize(serie)
+    unicos = pd.Series(unicos)
+
+    if not formatos:
+        parseados = pd.to_datetime(unicos, errors='coerce')
+    else:
+        parseados = pd.Series(pd.NaT, index=unicos.index, dtype='datetime64[ns]')
+        for formato in formatos:
+            pendientes = parseados.isna()
+            if not pendientes.any():
+                break
+            parseados[pendientes] = pd.to_datetime(unicos[pendientes], format=formato, errors='coerce')
+
+    # El código -1 (NaN en la entrada) se traduce a NaT
+    resultado = np.full(len(codigos), np.datetime64('NaT'), dtype='datetime64[ns]')
+    validos = codigos != -1
+    resultado[validos] = parseados.to_numpy(dtype='datetime64[ns]')[codigos[validos]]
+    return pd.Series(resultado, index=serie.index)
+
+
+def construir_timestamp(fechas, horas=None, minutos=None, formatos=None):
+    """
+    Combina las columnas Fecha + Hora (+ Minuto) en un único timestamp por fila.
+    Horas y minutos vacíos se consideran 0, igual que en los cargadores originales.
+    """
+    timestamps = parsear_fechas(fechas, formatos)
+    if horas is not None:
+        horas_int = pd.to_numeric(_como_serie(horas), errors='coerce').fillna(0).astype('int64')
+        timestamps = timestamps + pd.to_timedelta(horas_int.to_numpy(), unit='h')
+    if minutos is not None:
+        minutos_int = pd.to_numeric(_como_serie(minutos), errors='coerce').fillna(0).astype('int64')
+        timestamps = timestamps + pd.to_timedelta(minutos_int.to_numpy(), unit='m')
+    return timestamps
+
+
+# --- Secuencia de idDateTime ---
+# cargar_dimDateTime genera idDateTime sobre una secuencia por minuto a partir de FECHA_INICIO,
+# por lo que idDateTime = minutos desde FECHA_INICIO + 1, sea cual sea la granularidad física.
+# La tabla se genera por meses según los hechos cargados, así que no tiene una fecha final fija.
+FECHA_INICIO = '2016-01-01 00:00:00'
+
+# Granularidad física de dim_DateTime -> paso en minutos entre filas consecutivas.
+# En 'hora' sólo existen las filas con Minute = 0 (idDateTime 1, 61, 121, ...) y el minuto
+# exacto de un hecho se recupera con factAccident.MinuteOffset o la vista vw_dim_DateTimeMinute.
+GRANULARIDADES = {'minuto': 1, 'hora': 60}
+
+
+class DateTimeKey():
+    """
+    Resuelve idDateTime aritméticamente a partir de un timestamp, sin consultar dim_DateTime.
+    Antes de usarla se debe llamar a verificar(conn) una vez, que detecta la granularidad
+    de la tabla, comprueba con filas de muestra que sigue la secuencia esperada y guarda
+    el rango de IDs existente.
+    """
+    MUESTRAS_VERIFICACION = 16
+
+    def __init__(self, inicio=FECHA_INICIO):
+        self.inicio = pd.Timestamp(inicio)
+        self.id_min = None
+        self.id_max = None
+        self.paso = None
+
+    @property
+    def granularidad(self):
+        """Nombre de la granularidad detectada ('minuto' / 'hora'), None si no se ha verificado."""
+        for nombre, paso in GRANULARIDADES.items():
+            if paso == self.paso:
+                return nombre
+        return None
+
+    def id_desde_timestamp(self, timestamp):
+        """idDateTime teórico (por minuto) para un único timestamp (sin validar rango)."""
+        return int((pd.Timestamp(timestamp).floor('min') - self.inicio) // pd.Timedelta(minutes=1)) + 1
+
+    def timestamp_desde_id(self, id_datetime):
+        """Operación inversa: timestamp que corresponde a un idDateTime."""
+        return self.inicio + pd.Timedelta(minutes=int(id_datetime) - 1)
+
+    def verificar(self, conn):
+        """
+        Comprueba contra dim_DateTime que los IDs siguen la secuencia (por minuto o por hora)
+        comparando el conteo con el rango de IDs y revisando filas de muestra repartidas
+        en todo el rango. Lanza RuntimeError si la tabla no calza con el cálculo aritmético.
+        Con la tabla vacía el rango queda vacío y todas las fechas resultan "no encontradas".
+        """
+        cursor = conn.cursor()
+        cursor.execute("SELECT COUNT(*), MIN(idDateTime), MAX(idDateTime) FROM dim_DateTime")
+        total, id_min, id_max = cursor.fetchone()
+        if not total:
+            self.id_min, self.id_max, self.paso = 1, 0, GRANULARIDADES['minuto']
+            return
+
+        paso = None
+        for paso_candidato in sorted(GRANULARIDADES.values()):
+            if (id_max - id_min) == (total - 1) * paso_candidato and (id_min - 1) % paso_candidato == 0:
+                paso = paso_candidato
+                break
+        if paso is None:
+            raise RuntimeError(f"dim_DateTime no es una secuencia densa por minuto ni por hora ({total} filas para IDs {id_min}..{id_max}).")
+
+        ids_muestra = sorted({id_min + int(k) * paso for k in np.linspace(0, total - 1, self.MUESTRAS_VERIFICACION)})
+        marcadores = ",".join("?" for _ in ids_muestra)
+        cursor.execute(f"SELECT idDateTime, DateTime FROM dim_DateTime WHERE idDateTime IN ({marcadores})", ids_muestra)
+        for id_datetime, texto in cursor.fetchall():
+            esperado = self.timestamp_desde_id(id_datetime).strftime(FORMATO_DATETIME)
+            if texto != esperado:
+                raise RuntimeError(f"dim_DateTime no calza con la secuencia por minuto: idDateTime {id_datetime} es '{texto}', se esperaba '{esperado}'.")
+
+        self.id_min = id_min
+        self.id_max = id_max
+        self.paso = paso
+
+    def calcular_ids_y_offset(self, timestamps):
+        """
+        Calcula de forma vectorizada el idDateTime de la fila existente en dim_DateTime y el
+        offset en minutos hasta el minuto exacto (siempre 0 con granularidad 'minuto').
+        Los segundos se truncan. NaT y timestamps fuera del rango existente en
+        dim_DateTime quedan como NA (equivalente a "fecha no encontrada").
+        """
+        if self.id_min is None:
+            raise RuntimeError("DateTimeKey no verificada. Llame a verificar(conn) antes de calcular IDs.")
+
+        serie = _como_serie(timestamps)
+        valores = pd.to_datetime(serie, errors='coerce').to_numpy(dtype='datetime64[ns]')
+        validos = ~np.isnat(valores)
+
+        ids_minuto = np.zeros(len(valores), dtype='int64')
+        origen = np.datetime64(self.inicio.to_datetime64(), 'ns')
+        ids_minuto[validos] = (valores[validos] - origen) // np.timedelta64(1, 'm') + 1
+
+        offsets = (ids_minuto - 1) % self.paso
+        ids = ids_minuto - offsets
+        validos &= (ids >= self.id_min) & (ids <= self.id_max)
+
+        resultado_ids = pd.Series(ids, index=serie.index, dtype='Int64')
+        resultado_offsets = pd.Series(offsets, index=serie.index, dtype='Int64')
+        resultado_ids[~validos] = pd.NA
+        resultado_offsets[~validos] = pd.NA
+        return resultado_ids, resultado_offsets
+
+    def calcular_ids(self, timestamps):
+        """Como calcular_ids_y_offset, pero sólo devuelve idDateTime (hechos horarios como Tráfico)."""
+        return self.calcular_ids_y_offset(timestamps)[0]
@@ -0,0 +1,23 @@
+import sqlite3
+
+# --- Perfil de PRAGMAs para ruta_algarrobo.db ---
+# journal_mode=WAL queda guardado en el archivo; el resto se aplica en cada conexión.
+PRAGMAS_CONEXION = [
+    ("journal_mode", "WAL"),        # Power BI / ML pueden leer mientras se carga
+    ("synchronous", "NORMAL"),      # Seguro con WAL y con menos fsync por commit
+    ("cache_size", -65536),         # ~64 MB de caché de páginas (negativo = KiB)
+    ("mmap_size", 268435456),       # 256 MB de lectura por memoria mapeada
+    ("temp_store", "MEMORY"),       # Ordenamientos e índices temporales en RAM
+]
+
+def conectar(ruta_db, foreign_keys=True):
+    """
+    Abre una conexión a la base de datos aplicando el perfil de PRAGMAs del proyecto.
+    'foreign_keys' activa la validación de llaves foráneas (lo habitual en los cargadores).
+    """
+    conn = sqlite3.connect(ruta_db)
+    for pragma, valor in PRAGMAS_CONEXION:
+        conn.execute(f"PRAGMA {pragma} = {valor};")
+    if foreign_keys:
+        conn.execute("PRAGMA foreign_keys = ON;")
+    return conn
@@ -0,0 +1,217 @@
+import os
+import time
+from contextlib import contextmanager
+import pandas as pd
+from config_manager import cargar_configuracion, obtener_ruta, obtener_opcion
+from proceso_db.scripts.conexion import conectar
+from proceso_db.scripts.clave_datetime import DateTimeKey
+from utils.gestion_archivos import ManifiestoArchivos
+from utils.formato_limpio import leer_columnar, leer_columnar_por_partes, como_leido
+
+class ContextoCarga():
+    """
+    Estado compartido por las etapas de cargar_bd:
+    - configuración y rutas resueltas una sola vez,
+    - una única conexión con el perfil de PRAGMAs del proyecto,
+    - mapas de dimensiones en caché (catálogos que no cambian durante la carga),
+    - la clave de dim_DateTime verificada,
+    - el manifiesto de archivos (sección 'carga_db': caché de hashes de los CSV limpios),
+    - los DataFrames limpios entregados en memoria por la carga en línea (ver leer_limpio()),
+    - los CSV ya cargados en esta ejecución (RegistroCargas.planificar no los vuelve a cargar),
+    - tiempos por etapa.
+    Cada etapa confirma su trabajo o se revierte si falla (ver etapa()).
+    Los scripts también se pueden ejecutar solos: si run() no recibe contexto crea uno propio.
+    """
+    def __init__(self):
+        self.config = cargar_configuracion()
+        self.rutas = {}
+        self.mapas = {}
+        self.tiempos = {}
+        self.__conn = None
+        self.__clave_datetime = None
+        self.__manifiesto = None
+        self.__limpios = {}
+        self.archivos_cargados = set()
+
+    # --- Configuración ---
+    def ruta(self, nombre_ruta):
+        """Ruta de config.json resuelta una vez por carga."""
+        if nombre_ruta not in self.rutas:
+            self.rutas[nombre_ruta] = obtener_ruta(nombre_ruta, self.config)
+        return self.rutas[nombre_ruta]
+
+    def opcion(self, nombre_opcion, valor_por_defecto=None):
+        return obtener_opcion(nombre_opcion, valor_por_defecto, self.config)
+
+    # --- Conexión ---
+    def conexion(self):
+        """Conexión compartida (se abre al primer uso, con foreign_keys activado)."""
+        if self.__conn is None:
+            self.__conn = conectar(self.ruta("ruta_database"))
+        return self.__conn
+
+    def cerrar(self):
+        if self.__conn is not None:
+            self.__conn.close()
+            self.__conn = None
+            print("Conexión cerrada.")
+
+    # --- Cachés ---
+    def mapa(self, nombre, constructor):
+        """
+        Devuelve el mapa 'nombre' construyéndolo con constructor(conn) sólo la primera vez.
+        Usar únicamente para catálogos que no cambian durante la carga.
+        """
+        if nombre not in self.mapas:
+            self.mapas[nombre] = constructor(self.conexion())
+        return self.mapas[nombre]
+
+    def invalidar_mapas(self, *nombres):
+        """Descarta mapas en caché (todos si no se indican nombres)."""
+        if not nombres:
+            self.mapas.clear()
+        for nombre in nombres:
+            self.mapas.pop(nombre, None)
+
+    def mapa_ids(self, tabla, id_col, callback=None, en_cache=True):
+        """
+        Set de IDs válidos de una tabla (validación de FKs).
+        Con en_cache=False se lee siempre de la base (tablas que cambian durante la carga).
+        """
+        def construir(conn):
+            try:
+                return set(pd.read_sql(f"SELECT {id_col} FROM {tabla}", conn)[id_col])
+            except Exception as e:
+                if callback:
+                    callback(f"Error al cargar mapa de IDs para {tabla}: {e}")
+                return {0} # Retorna un set con el ID 'Sin dato' como mínimo
+        if not en_cache:
+            return construir(self.conexion())
+        return self.mapa(("ids", tabla, id_col), construir)
+
+    def mapa_simple(self, tabla, id_col, col1, en_cache=True):
+        """
+        Mapa valor -> ID (ej. LaneValue -> idLane). Claves int si la columna es numérica.
+        Con en_cache=False se lee siempre de la base (tablas que cambian durante la carga).
+        """
+        def construir(conn):
+            df_mapa = pd.read_sql(f"SELECT {id_col}, {col1} FROM {tabla}", conn)
+            if pd.api.types.is_numeric_dtype(df_mapa[col1]):
+                return {int(k): v for k, v in zip(df_mapa[col1], df_mapa[id_col])}
+            return {str(k): v for k, v in zip(df_mapa[col1], df_mapa[id_col])}
+        if not en_cache:
+            return construir(self.conexion())
+        return self.mapa(("simple", tabla, id_col, col1), construir)
+
+    def mapa_doble(self, tabla, id_col, col1, col2):
+        """Mapa (texto, valor int) -> ID para dimensiones con clave compuesta."""
+        def construir(conn):
+            df_mapa = pd.read_sql(f"SELECT {id_col}, {col1}, {col2} FROM {tabla}", conn)
+            return {(str(k1), int(k2)): v for k1, k2, v in zip(df_mapa[col1], df_mapa[col2], df_mapa[id_col])}
+        return self.mapa(("doble", tabla, id_col, col1, col2), construir)
+
+    def mapa_normalizado(self, tabla, campo_nombre, campo_id):
+        """Mapa nombre -> ID con nombres en minúsculas y sin espacios (búsqueda robusta)."""
+        def construir(conn):
+            df_mapa = pd.read_sql(f"SELECT {campo_id}, {campo_nombre} FROM {tabla}", conn)
+            return {str(k).strip().lower(): v for k, v in zip(df_mapa[campo_nombre], df_mapa[campo_id])}
+        return self.mapa(("normalizado", tabla, campo_nombre, campo_id), construir)
+
+    def clave_datetime(self):
+        """DateTimeKey verificada una sola vez contra dim_DateTime."""
+        if self.__clave_datetime is None:
+            clave = DateTimeKey()
+            clave.verificar(self.conexion())
+            self.__clave_datetime = clave
+        return self.__clave_datetime
+
+    def invalidar_clave_datetime(self):
+        """Se llama cuando dim_DateTime cambia de granularidad."""
+        self.__clave_datetime = None
+
+    # --- Manifiesto de archivos (sección 'carga_db') ---
+    def manifiesto(self):
+        """Manifiesto de archivos compartido (se guarda al planificar cada carga)."""
+        if self.__manifiesto is None:
+            self.__manifiesto = ManifiestoArchivos(self.ruta("ruta_manifiesto"))
+        return self.__manifiesto
+
+    # --- CSV limpios ---
+    def entregar_limpio(self, ruta_csv, df):
+        """
+        Deja en memoria el DataFrame transformado de un CSV limpio ya escrito (carga en línea),
+        para que el cargador lo use en lugar de volver a leer el archivo. Si el CSV tiene tablas
+        relacionadas (Ficha 0) 'df' es un dict {ruta CSV: DataFrame} con todas ellas.
+        """
+        tablas = df if isinstance(df, dict) else {ruta_csv: df}
+        for ruta, df_tabla in tablas.items():
+            self.__limpios[os.path.abspath(ruta)] = df_tabla
+
+    def descartar_limpios(self):
+        """Libera los DataFrames entregados que no se usaron (archivos omitidos por el libro de cargas)."""
+        self.__limpios.clear()
+
+    def leer_limpio(self, archivo, esquema):
+        """
+        DataFrame de un CSV limpio planificado por RegistroCargas: el entregado en memoria, la
+        copia columnar vigente (según 'hash_csv', el hash del CSV solo, no el de la carga) o,
+        si no hay ninguno, el CSV. En los tres casos con el encabezado validado y las columnas
+        tipadas según 'esquema' (EsquemaCSV de esquemas_csv).
+        """
+        df = self.__limpios.pop(os.path.abspath(archivo['ruta']), None)
+        if df is not None:
+            return esquema.tipar(como_leido(df), archivo['ruta'])
+        df = leer_columnar(archivo['ruta'], archivo['hash_csv'])
+        if df is not None:
+            return esquema.tipar(df, archivo['ruta'])
+        return esquema.leer(archivo['ruta'])
+
+    def leer_limpio_por_partes(self, archivo, esquema, filas_por_parte=None):
+        """
+        Como leer_limpio, pero entrega el archivo de a 'filas_por_parte' filas (iterador de
+        DataFrames) para acotar la memoria con archivos grandes. Sin 'filas_por_parte' (o 0)
+        entrega el archivo completo en una sola parte.
+        """
+        if not filas_por_parte:
+            yield self.leer_limpio(archivo, esquema)
+            return
+        df = self.__limpios.pop(os.path.abspath(archivo['ruta']), None)
+        if df is not None:
+            for inicio in range(0, len(df), filas_por_parte):
+                yield esquema.tipar(como_leido(df.iloc[inicio:inicio + filas_por_parte]), archivo['ruta'])
+            return
+        partes = leer_columnar_por_partes(archivo['ruta'], archivo['hash_csv'], filas_por_parte)
+        if partes is not None:
+            for parte in partes:
+                yield esquema.tipar(parte, archivo['ruta'])
+            return
+        yield from esquema.leer_por_partes(archivo['ruta'], filas_por_parte)
+
+    def filas_por_lote(self):
+        """
+        'filas_por_lote_carga' de config.json: filas que los cargadores leen y procesan de una
+        vez dentro de cada archivo (0 = el archivo completo).
+        """
+        try:
+            return max(0, int(self.opcion('filas_por_lote_carga', 0) or 0))
+        except (TypeError, ValueError):
+            return 0
+
+    # --- Etapas ---
+    @contextmanager
+    def etapa(self, titulo):
+        """
+        Ejecuta una etapa midiendo su duración. Si la etapa falla se revierte lo que
+        haya quedado sin confirmar en la conexión compartida y se relanza el error.
+        """
+        inicio = time.time()
+        try:
+            yield self
+            if self.__conn is not None:
+                self.__conn.commit()
+        except Exception:
+            if self.__conn is not None:
+                self.__conn.rollback()
+            raise
+        finally:
+            self.tiempos[titulo] = time.time() - inicio
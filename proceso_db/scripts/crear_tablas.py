@@ -1,24 +1,85 @@
-import sqlite3
-from config_manager import obtener_ruta
+from proceso_db.scripts.contexto_carga import ContextoCarga
+from proceso_db.scripts.registro_cargas import migrar_logs_anteriores
 
-def run(callback):
+# --- Índices secundarios administrados (nombre, tabla, columnas) ---
+# No se crean junto con las tablas: los de una tabla de hechos se eliminan sólo antes de
+# una carga masiva en ella (preparar_indices) y los que falten se recrean en la etapa
+# post-carga (optimizar_bd), seguido de ANALYZE.
+INDICES_SECUNDARIOS = [
+    ("idx_factTraffic_idDateTime", "factTraffic", "idDateTime, trafficVolume"),
+    ("idx_factTraffic_idPlaza", "factTraffic", "idPlaza"),
+    ("idx_factTraffic_idCarga", "factTraffic", "idCarga"),
+    ("idx_factAccident_idDateTime", "factAccident", "idDateTime"),
+    ("idx_factAccident_idCarga", "factAccident", "idCarga"),
+    ("idx_factVehicleAccident_idAccident", "factVehicleAccident", "idAccident"),
+    ("idx_factVehicleAccident_idCarga", "factVehicleAccident", "idCarga"),
+    ("idx_dim_DateTime_HourMinuteDate", "dim_DateTime", "Hour, Minute, Date"),
+]
+
+# Proporción por defecto del tamaño ya cargado en una tabla de hechos a partir de la cual
+# una carga se considera masiva ('proporcion_carga_masiva' en config.json)
+PROPORCION_CARGA_MASIVA = 0.5
+
+def crear_indices(conn, callback):
+    """Crea los índices secundarios que falten. Devuelve cuántos se crearon."""
+    cursor = conn.cursor()
+    existentes = {fila[0] for fila in cursor.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+    creados = 0
+    for nombre, tabla, columnas in INDICES_SECUNDARIOS:
+        if nombre in existentes:
+            continue
+        cursor.execute(f"CREATE INDEX {nombre} ON {tabla} ({columnas})")
+        callback(f"  Índice {nombre} creado.")
+        creados += 1
+    conn.commit()
+    return creados
+
+def eliminar_indices(conn, callback, tabla=None):
+    """
+    Elimina los índices secundarios (sólo los de 'tabla' si se indica) para que la carga
+    masiva no tenga que mantenerlos.
+    """
+    cursor = conn.cursor()
+    nombres = [nombre for nombre, tabla_indice, _ in INDICES_SECUNDARIOS if tabla is None or tabla_indice == tabla]
+    for nombre in nombres:
+        cursor.execute(f"DROP INDEX IF EXISTS {nombre}")
+    conn.commit()
+    callback(f"{len(nombres)} índices secundarios{f' de {tabla}' if tabla else ''} eliminados antes de la carga (se recrean al final).")
+
+def preparar_indices(ctx, registro, plan, callback):
+    """
+    Antes de cargar los hechos planificados: si la carga es masiva respecto de lo ya cargado
+    en la tabla (ver RegistroCargas.es_carga_masiva) elimina sus índices secundarios, que
+    optimizar_bd recrea al final. Si no, los deja: una carga incremental de pocos archivos no
+    debe pagar la reconstrucción de los índices de toda la tabla.
+    """
+    try:
+        proporcion = max(0.0, float(ctx.opcion('proporcion_carga_masiva', PROPORCION_CARGA_MASIVA)))
+    except (TypeError, ValueError):
+        proporcion = PROPORCION_CARGA_MASIVA
+    if registro.es_carga_masiva(plan, proporcion):
+        eliminar_indices(ctx.conexion(), callback, registro.tabla_hechos)
+    else:
+        callback(f"Carga incremental: se mantienen los índices de {registro.tabla_hechos}.")
+
+def run(callback, contexto=None):
     """
     Función principal para crear las tablas.
-    Recibe un callback para enviar mensajes de log.
+    Recibe un callback para enviar mensajes de log y, opcionalmente, el ContextoCarga
+    compartido del pipeline (si no se entrega se usa uno propio).
     """
     try:
-        ruta_db = obtener_ruta("ruta_database")
+        ctx = contexto or ContextoCarga()
+        ruta_db = ctx.ruta("ruta_database")
         print(f"DEBUG: 'crear_tablas.py' intentará conectarse a: {ruta_db}")
     except Exception as e:
         print(f"Error al cargar ruta_database desde config_manager: {e}")
         raise
 
-    conn = sqlite3.connect(ruta_db)
+    # Conexión del contexto (perfil de PRAGMAs, claves foráneas activadas)
+    conn = ctx.conexion()
     cursor = conn.cursor()
 
-    # Activar claves foráneas
-    cursor.execute("PRAGMA foreign_keys = ON;")
-
     cursor.executescript("""
 
     /* ============================================= */
@@ -192,6 +253,8 @@ def run(callback):
         InfrastructureDamage TEXT,
         Description TEXT,
         totalVehicles INTEGER,
+        MinuteOffset INTEGER DEFAULT 0, /* Minutos a sumar a idDateTime si dim_DateTime es por hora */
+        idCarga INTEGER, /* Carga (archivo CSV) de la que proviene la fila, ver etl_log_cargas */
         FOREIGN KEY (idDateTime) REFERENCES dim_DateTime(idDateTime),
         FOREIGN KEY (idSection) REFERENCES dim_Section(idSection),
         FOREIGN KEY (idAccidentType) REFERENCES dim_AccidentType(idAccidentType),
@@ -207,6 +270,7 @@ def run(callback):
         idVehicleAccident INTEGER PRIMARY KEY AUTOINCREMENT,
         idAccident TEXT,
         idVehicleDescription INTEGER,
+        idCarga INTEGER,
         FOREIGN KEY (idAccident) REFERENCES factAccident(idAccident) ON DELETE CASCADE,
         FOREIGN KEY (idVehicleDescription) REFERENCES dim_VehicleDescription(idVehicleDescription)
     );
@@ -219,6 +283,7 @@ def run(callback):
         idDirection INTEGER,
         idCategory INTEGER,
         trafficVolume INTEGER,
+        idCarga INTEGER,
         FOREIGN KEY (idDateTime) REFERENCES dim_DateTime(idDateTime),
         FOREIGN KEY (idPlaza) REFERENCES dim_Plaza(idPlaza),
         FOREIGN KEY (idDirection) REFERENCES dim_Direction(idDirection),
@@ -323,22 +388,67 @@ def run(callback):
     /* --- 5. CREAR TABLAS DE LOG ETL --- */
     /* ================================= */
 
-    CREATE TABLE IF NOT EXISTS etl_log_ficha0 (
-        FileName TEXT PRIMARY KEY,
-        LoadedTimestamp TEXT
-    );
-    CREATE TABLE IF NOT EXISTS etl_log_ficha1_vehiculos (
-        FileName TEXT PRIMARY KEY,
-        LoadedTimestamp TEXT
-    );
-    CREATE TABLE IF NOT EXISTS etl_log_trafico (
-        FileName TEXT PRIMARY KEY,
-        LoadedTimestamp TEXT
-    ); 
+    /* Libro de cargas: una fila por versión (hash de contenido) de cada CSV cargado.
+       Las filas de factTraffic / factAccident / factVehicleAccident guardan su idCarga. */
+    CREATE TABLE IF NOT EXISTS etl_log_cargas (
+        idCarga INTEGER PRIMARY KEY AUTOINCREMENT,
+        Tipo TEXT NOT NULL,           /* trafico / ficha0 / ficha1 */
+        FileName TEXT NOT NULL,
+        RelativePath TEXT,            /* Relativa a la carpeta de CSV limpios */
+        ContentHash TEXT,
+        FileSize INTEGER,
+        RowsRead INTEGER,
+        RowsLoaded INTEGER,
+        RowsRejected INTEGER,
+        DurationSeconds REAL,
+        Status TEXT NOT NULL,         /* cargado / con_errores / reemplazado / invalidado */
+        LoadedTimestamp TEXT,
+        ReplacedBy INTEGER
+    );
+    CREATE INDEX IF NOT EXISTS idx_etl_log_cargas_Tipo ON etl_log_cargas (Tipo, Status);
+
+
+    /* ================================= */
+    /* --- 6. CREAR VISTAS --- */
+    /* ================================= */
+
+    /* dim_DateTime a nivel de minuto, independiente de la granularidad física de la tabla.
+       El minuto exacto de un accidente es idDateTime + MinuteOffset. */
+    CREATE VIEW IF NOT EXISTS vw_dim_DateTimeMinute AS
+    WITH RECURSIVE minutos(n) AS (
+        SELECT 0
+        UNION ALL
+        SELECT n + 1 FROM minutos WHERE n < 59
+    )
+    SELECT
+        DT.idDateTime + minutos.n AS idDateTime,
+        strftime('%Y-%m-%d %H:%M:%S', DT.DateTime, '+' || minutos.n || ' minutes') AS DateTime,
+        DT.Date, DT.Year, DT.Month, DT.Day, DT.Hour,
+        minutos.n AS Minute,
+        DT.MonthName, DT.WeekDay, DT.WeekNumber, DT.Period
+    FROM dim_DateTime DT
+    CROSS JOIN minutos
+    WHERE DT.Minute = 0;
 
     """)
 
+    # --- Migración de bases existentes: columnas añadidas después de la versión inicial ---
+    columnas_accident = {fila[1] for fila in cursor.execute("PRAGMA table_info(factAccident)")}
+    if 'MinuteOffset' not in columnas_accident:
+        cursor.execute("ALTER TABLE factAccident ADD COLUMN MinuteOffset INTEGER DEFAULT 0")
+        callback("Columna MinuteOffset agregada a factAccident.")
+
+    for tabla in ("factTraffic", "factAccident", "factVehicleAccident"):
+        columnas = {fila[1] for fila in cursor.execute(f"PRAGMA table_info({tabla})")}
+        if 'idCarga' not in columnas:
+            cursor.execute(f"ALTER TABLE {tabla} ADD COLUMN idCarga INTEGER")
+            callback(f"Columna idCarga agregada a {tabla}.")
+
+    # Los logs por nombre de archivo (etl_log_*) pasan al libro de cargas
+    migrar_logs_anteriores(conn, callback)
+
     conn.commit()
-    conn.close()
+    if contexto is None:
+        ctx.cerrar()
 
     print("Tablas creadas correctamente.")
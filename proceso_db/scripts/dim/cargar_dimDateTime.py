@@ -1,14 +1,15 @@
-import sqlite3
 import pandas as pd
 import numpy as np
 import time
 import os
-import sys
-from config_manager import obtener_ruta
+from config_manager import obtener_opcion
+from proceso_db.scripts.contexto_carga import ContextoCarga
+from proceso_db.scripts.clave_datetime import FECHA_INICIO, GRANULARIDADES, DateTimeKey
 
 # --- Configuración ---
-start_date = '2016-01-01 00:00:00'
-end_date = '2036-12-31 23:00:00'
+# La tabla no se pre-genera completa: asegurar_rango la extiende por meses
+# según las fechas de los hechos que se van cargando.
+start_date = FECHA_INICIO
 
 # --- Mapas para español ---
 meses_map = {
@@ -20,75 +21,238 @@ dias_map = {
     4: 'Viernes', 5: 'Sábado', 6: 'Domingo'
 }
 
-def run(callback):
+# Frecuencia de pandas para cada granularidad física de la tabla
+frecuencias_map = {'minuto': 'min', 'hora': 'h'}
+
+# Columnas de dim_DateTime en el orden en que se generan e insertan
+COLUMNAS_DIM_DATETIME = [
+    'idDateTime', 'DateTime', 'Date', 'Year', 'Month', 'Day', 'Hour', 'Minute',
+    'MonthName', 'WeekDay', 'WeekNumber', 'Period'
+]
+
+def tamano_db_mb(ruta_db):
+    """Tamaño del archivo de base de datos en MB (0 si aún no existe)."""
+    if not os.path.exists(ruta_db):
+        return 0.0
+    return os.path.getsize(ruta_db) / (1024 * 1024)
+
+def generar_dim_datetime(inicio, fin, granularidad='minuto'):
+    """
+    Genera las filas de dim_DateTime entre 'inicio' y 'fin' con la granularidad indicada.
+    idDateTime siempre sigue la secuencia por minuto desde start_date, también con
+    granularidad 'hora' (1, 61, 121, ...), para que los IDs no cambien entre modos.
+    """
+    fechas = pd.date_range(start=inicio, end=fin, freq=frecuencias_map[granularidad])
+    df = pd.DataFrame(fechas, columns=['DateTime_dt'])
+
+    df['idDateTime'] = (df['DateTime_dt'] - pd.Timestamp(start_date)) // pd.Timedelta(minutes=1) + 1
+    df['DateTime'] = df['DateTime_dt'].dt.strftime('%Y-%m-%d %H:%M:%S')
+    df['Date'] = df['DateTime_dt'].dt.strftime('%Y-%m-%d')
+    df['Year'] = df['DateTime_dt'].dt.year
+    df['Month'] = df['DateTime_dt'].dt.month
+    df['Day'] = df['DateTime_dt'].dt.day
+    df['Hour'] = df['DateTime_dt'].dt.hour
+    df['Minute'] = df['DateTime_dt'].dt.minute
+    df['MonthName'] = df['Month'].map(meses_map)
+    df['WeekDay'] = df['DateTime_dt'].dt.dayofweek.map(dias_map)
+    df['WeekNumber'] = df['DateTime_dt'].dt.isocalendar().week.astype(int)
+
+    df['date_int'] = df['Month'] * 100 + df['Day']
+    conditions = [
+        (df['date_int'] >= 321) & (df['date_int'] <= 620), # Otoño
+        (df['date_int'] >= 621) & (df['date_int'] <= 920), # Invierno
+        (df['date_int'] >= 921) & (df['date_int'] <= 1220) # Primavera
+    ]
+    choices = ['Otoño', 'Invierno', 'Primavera']
+    df['Period'] = np.select(conditions, choices, default='Verano')
+
+    return df[COLUMNAS_DIM_DATETIME]
+
+def obtener_granularidad(config=None):
+    """Granularidad configurada en config.json ('minuto' por defecto)."""
+    granularidad = obtener_opcion("granularidad_dim_datetime", "minuto", config)
+    if granularidad not in GRANULARIDADES:
+        raise ValueError(f"granularidad_dim_datetime '{granularidad}' no es válida. Use: {', '.join(GRANULARIDADES)}.")
+    return granularidad
+
+def insertar_por_meses(conn, inicio, fin, granularidad, callback, solo_minutos=False):
+    """
+    Genera e inserta dim_DateTime entre 'inicio' y 'fin' de a un mes por vez, para que
+    la memoria no dependa del largo del rango. Inserta con executemany sobre la conexión
+    del llamador y no hace commit (DataFrame.to_sql confirma por su cuenta, por eso no se usa):
+    el llamador decide la transacción. 'solo_minutos' omite las filas Minute = 0 (ya
+    existentes por hora). Devuelve la cantidad de filas insertadas.
+    """
+    inicio = pd.Timestamp(inicio)
+    fin = pd.Timestamp(fin)
+    cursor = conn.cursor()
+    sql_insert = (f"INSERT INTO dim_DateTime ({', '.join(COLUMNAS_DIM_DATETIME)}) "
+                  f"VALUES ({', '.join('?' * len(COLUMNAS_DIM_DATETIME))})")
+    filas = 0
+    for inicio_mes in pd.date_range(inicio.to_period('M').start_time, fin, freq='MS'):
+        fin_mes = inicio_mes + pd.offsets.MonthBegin(1) - pd.Timedelta(minutes=1)
+        df_mes = generar_dim_datetime(max(inicio_mes, inicio), min(fin_mes, fin), granularidad)
+        if solo_minutos:
+            df_mes = df_mes[df_mes['Minute'] != 0]
+        cursor.executemany(sql_insert, df_mes.astype(object).to_numpy().tolist())
+        filas += len(df_mes)
+        if inicio_mes.month == 12 or fin_mes >= fin:
+            callback(f"  ... dim_DateTime generada hasta {min(fin_mes, fin):%Y-%m} ({filas} registros nuevos)")
+    return filas
+
+def asegurar_rango(conn, inicio, fin, callback, clave=None, confirmar=True):
+    """
+    Garantiza que dim_DateTime cubra [inicio, fin], generando sólo los meses que faltan.
+    La tabla se extiende por los extremos, así que siempre queda como un rango continuo
+    (requisito de DateTimeKey). Fechas anteriores a start_date no se generan.
+    Los cargadores de hechos la llaman antes de resolver idDateTime. Si reciben una
+    DateTimeKey ya verificada (la del ContextoCarga) se reutiliza y se actualiza su rango.
+    Con confirmar=False los meses nuevos quedan en la transacción abierta del llamador
+    (si éste la revierte debe volver a verificar la clave).
+    Devuelve la cantidad de filas nuevas.
+    """
+    if pd.isna(inicio) or pd.isna(fin):
+        return 0
+    inicio = max(pd.Timestamp(inicio), pd.Timestamp(start_date))
+    fin = pd.Timestamp(fin)
+    if fin < inicio:
+        return 0
+
+    if clave is None:
+        clave = DateTimeKey()
+        clave.verificar(conn)
+    existe = clave.id_max >= clave.id_min
+    granularidad = clave.granularidad if existe else obtener_granularidad()
+    paso = pd.Timedelta(minutes=GRANULARIDADES[granularidad])
+
+    # Siempre por meses completos
+    inicio = inicio.to_period('M').start_time
+    fin = (fin.to_period('M') + 1).start_time - paso
+
+    tramos = []
+    if not existe:
+        tramos.append((inicio, fin))
+    else:
+        actual_inicio = clave.timestamp_desde_id(clave.id_min)
+        actual_fin = clave.timestamp_desde_id(clave.id_max)
+        if inicio < actual_inicio:
+            tramos.append((inicio, actual_inicio - paso))
+        if fin > actual_fin:
+            tramos.append((actual_fin + paso, fin))
+
+    if not tramos:
+        return 0
+
+    start_gen = time.time()
+    nuevas = 0
+    try:
+        for tramo_inicio, tramo_fin in tramos:
+            callback(f"Extendiendo dim_DateTime (por {granularidad}): {tramo_inicio:%Y-%m-%d} a {tramo_fin:%Y-%m-%d}...")
+            nuevas += insertar_por_meses(conn, tramo_inicio, tramo_fin, granularidad, callback)
+        if confirmar:
+            conn.commit()
+    except Exception:
+        if confirmar:
+            conn.rollback()
+        raise
+    callback(f"dim_DateTime extendida con {nuevas} registros en {time.time() - start_gen:.2f}s.")
+    clave.verificar(conn) # Actualizar el rango de IDs de la clave
+    return nuevas
+
+def migrar_granularidad(conn, ruta_db, clave, granularidad, callback):
+    """
+    Convierte una dim_DateTime ya poblada a otra granularidad sin cambiar los idDateTime
+    de las horas. factAccident se ajusta para que idDateTime + MinuteOffset siga
+    apuntando al mismo minuto. Al final se compacta la base con VACUUM.
+    """
+    conn.commit()
+    cursor = conn.cursor()
+    # Sin foreign_keys durante la migración: ningún hecho apunta a los minutos que se borran
+    # y así se evita revisar las tablas de hechos por cada una de las filas eliminadas.
+    fk_activas = cursor.execute("PRAGMA foreign_keys").fetchone()[0]
+    cursor.execute("PRAGMA foreign_keys = OFF;")
+    try:
+        _migrar(conn, ruta_db, clave, granularidad, callback)
+    finally:
+        if fk_activas:
+            cursor.execute("PRAGMA foreign_keys = ON;")
+
+def _migrar(conn, ruta_db, clave, granularidad, callback):
+    cursor = conn.cursor()
+    filas_antes = cursor.execute("SELECT COUNT(*) FROM dim_DateTime").fetchone()[0]
+    tamano_antes = tamano_db_mb(ruta_db)
+    callback(f"Migrando dim_DateTime de '{clave.granularidad}' a '{granularidad}' ({filas_antes} registros, BD de {tamano_antes:.1f} MB)...")
+    start_mig = time.time()
+
+    if granularidad == 'hora':
+        cursor.execute("SELECT COUNT(*) FROM factTraffic WHERE (idDateTime - 1) % 60 != 0")
+        if cursor.fetchone()[0] > 0:
+            raise RuntimeError("factTraffic tiene registros a nivel de minuto. No se puede compactar dim_DateTime por hora.")
+
+        # Los accidentes pasan a apuntar a la fila de la hora y guardan el minuto en MinuteOffset
+        cursor.execute("""
+            UPDATE factAccident
+            SET MinuteOffset = COALESCE(MinuteOffset, 0) + (idDateTime - 1) % 60,
+                idDateTime = idDateTime - (idDateTime - 1) % 60
+            WHERE (idDateTime - 1) % 60 != 0
+        """)
+        callback(f"{cursor.rowcount} accidentes ajustados a idDateTime por hora + MinuteOffset.")
+        cursor.execute("DELETE FROM dim_DateTime WHERE Minute != 0")
+    else:
+        # Regenerar los minutos que faltan dentro del rango existente
+        fin_minutos = clave.timestamp_desde_id(clave.id_max) + pd.Timedelta(minutes=59)
+        insertados = insertar_por_meses(conn, clave.timestamp_desde_id(clave.id_min), fin_minutos, 'minuto', callback, solo_minutos=True)
+        callback(f"Se insertaron {insertados} registros por minuto.")
+
+        cursor.execute("""
+            UPDATE factAccident
+            SET idDateTime = idDateTime + MinuteOffset, MinuteOffset = 0
+            WHERE MinuteOffset != 0
+        """)
+        callback(f"{cursor.rowcount} accidentes ajustados a idDateTime por minuto.")
+
+    conn.commit()
+    callback("Compactando la base de datos (VACUUM)...")
+    conn.execute("VACUUM")
+
+    filas_despues = cursor.execute("SELECT COUNT(*) FROM dim_DateTime").fetchone()[0]
+    tamano_despues = tamano_db_mb(ruta_db)
+    callback(f"Éxito: dim_DateTime migrada a '{granularidad}' en {time.time() - start_mig:.2f}s. "
+             f"Registros: {filas_antes} -> {filas_despues}. Tamaño BD: {tamano_antes:.1f} MB -> {tamano_despues:.1f} MB.")
+
+def run(callback, contexto=None):
     """
     Carga la dimensión DateTime en la base de datos.
-    Recibe un callback para enviar mensajes de log.
+    La tabla se genera bajo demanda (ver asegurar_rango); aquí sólo se revisa que la
+    granularidad física ('minuto' u 'hora', 'granularidad_dim_datetime' en config.json)
+    coincida con la existente y, si no, se migra.
+    Recibe un callback para enviar mensajes de log y, opcionalmente, el ContextoCarga compartido.
     """
+    ctx = None
     try:
+        ctx = contexto or ContextoCarga()
+        granularidad = obtener_granularidad(ctx.config)
+
         # --- 1. Conectar a la base de datos ---
-        ruta_db = obtener_ruta("ruta_database")
+        ruta_db = ctx.ruta("ruta_database")
         print(f"Conectando a la base de datos en: {ruta_db}")
-        conn = sqlite3.connect(ruta_db)
+        conn = ctx.conexion()
         cursor = conn.cursor()
 
         cursor.execute("SELECT COUNT(*) FROM dim_DateTime")
         count = cursor.fetchone()[0]
         
         if count > 0:
-            callback(f"dim_DateTime ya está poblada con {count} registros. No se necesita carga.")
-            conn.close()
+            clave = ctx.clave_datetime()
+            if clave.granularidad == granularidad:
+                callback(f"dim_DateTime ya está poblada con {count} registros (por {granularidad}). No se necesita carga.")
+                return
+            migrar_granularidad(conn, ruta_db, clave, granularidad, callback)
+            ctx.invalidar_clave_datetime()
             return
 
-        # --- 2. Si count es 0, proceder con la generación ---
-        callback(f"Tabla dim_DateTime vacía. Generando {end_date} registros (por minuto)...")
-        callback("Esto puede tardar varios minutos.")
-        start_gen = time.time()
-        
-        try:
-            minute_dates = pd.date_range(start=start_date, end=end_date, freq='min')
-        except ImportError:
-            minute_dates = pd.date_range(start=start_date, end=end_date, freq='T') # Fallback para versiones antiguas
-
-        df = pd.DataFrame(minute_dates, columns=['DateTime_dt'])
-        end_gen = time.time()
-        callback(f"Se generaron {len(df)} filas en {end_gen - start_gen:.2f}s. Creando columnas...")
-
-        # 3. Extraer todas las columnas necesarias
-        df['idDateTime'] = range(1, len(df) + 1)
-        df['DateTime'] = df['DateTime_dt'].dt.strftime('%Y-%m-%d %H:%M:%S')
-        df['Date'] = df['DateTime_dt'].dt.strftime('%Y-%m-%d')
-        df['Year'] = df['DateTime_dt'].dt.year
-        df['Month'] = df['DateTime_dt'].dt.month
-        df['Day'] = df['DateTime_dt'].dt.day
-        df['Hour'] = df['DateTime_dt'].dt.hour
-        df['Minute'] = df['DateTime_dt'].dt.minute
-        df['MonthName'] = df['Month'].map(meses_map)
-        df['WeekDay'] = df['DateTime_dt'].dt.dayofweek.map(dias_map)
-        df['WeekNumber'] = df['DateTime_dt'].dt.isocalendar().week.astype(int)
-
-        df['date_int'] = df['Month'] * 100 + df['Day']
-        conditions = [
-            (df['date_int'] >= 321) & (df['date_int'] <= 620), # Otoño
-            (df['date_int'] >= 621) & (df['date_int'] <= 920), # Invierno
-            (df['date_int'] >= 921) & (df['date_int'] <= 1220) # Primavera
-        ]
-        choices = ['Otoño', 'Invierno', 'Primavera']
-        df['Period'] = np.select(conditions, choices, default='Verano')
-
-        columnas_finales = [
-            'idDateTime', 'DateTime', 'Date', 'Year', 'Month', 'Day', 'Hour', 'Minute',
-            'MonthName', 'WeekDay', 'WeekNumber', 'Period'
-        ]
-        df_final = df[columnas_finales]
-
-        # 4. Cargar a SQLite
-        callback(f"Cargando {len(df_final)} registros en la base de datos...")
-        start_load = time.time()
-        df_final.to_sql("dim_DateTime", conn, if_exists="append", index=False)
-        conn.commit()
-        end_load = time.time()
-        callback(f"Éxito: Se cargaron {len(df_final)} registros en {end_load - start_load:.2f}s.")
+        # --- 2. Tabla vacía: se generará por meses al cargar los hechos ---
+        callback(f"dim_DateTime vacía. Se generará por {granularidad} según el rango de fechas de los hechos cargados.")
 
     except Exception as e:
         callback(f"Error al cargar dim_DateTime: {e}")
@@ -97,6 +261,5 @@ def run(callback):
             conn.rollback()
         raise
     finally:
-        # Asegurar si 'conn' existe
-        if 'conn' in locals():
-            conn.close()
+        if contexto is None and ctx is not None:
+            ctx.cerrar()
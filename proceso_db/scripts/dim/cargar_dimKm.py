@@ -1,7 +1,6 @@
-import sqlite3
 import pandas as pd
 import numpy as np
-from config_manager import obtener_ruta
+from proceso_db.scripts.contexto_carga import ContextoCarga
 
 # --- Configuración ---
 km_start = 473.000
@@ -42,14 +41,16 @@ map_places = [
 # Ordenar el mapa por Km para un procesamiento correcto
 map_places.sort(key=lambda x: x[0])
 
-def run(callback):
+def run(callback, contexto=None):
     """
     Carga la dimensión Km en la base de datos.
-    Recibe un callback para enviar mensajes de log.
+    Recibe un callback para enviar mensajes de log y, opcionalmente, el ContextoCarga compartido
+    del pipeline (si no se entrega se usa uno propio).
     """
 
+    ctx = None
     try:
-        ruta_db = obtener_ruta("ruta_database")
+        ctx = contexto or ContextoCarga()
         callback("Generando rango de Kms (por metro)...")
 
         # 1. Generar todos los Kms
@@ -84,7 +85,7 @@ def run(callback):
 
         # 4. Conectar y cargar a SQLite
         print("Conectando a la base de datos...")
-        conn = sqlite3.connect(ruta_db)
+        conn = ctx.conexion()
         cursor = conn.cursor()
 
         cursor.execute("SELECT COUNT(*) FROM dim_Km")
@@ -104,5 +105,5 @@ def run(callback):
             conn.rollback()
         raise
     finally:
-        if 'conn' in locals():
-            conn.close()
+        if contexto is None and ctx is not None:
+            ctx.cerrar()
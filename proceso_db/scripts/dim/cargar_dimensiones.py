@@ -1,5 +1,4 @@
-import sqlite3
-from config_manager import obtener_ruta
+from proceso_db.scripts.contexto_carga import ContextoCarga
 
 # --- MAPAS CON JERARQUÍA ---
 
@@ -179,17 +178,19 @@ map_consequence_type = {
     2: "Sin daños"
 }
 
-def run(callback):
+def run(callback, contexto=None):
     """
     Carga todas las dimensiones en la base de datos.
-    Recibe un callback para enviar mensajes de log.
+    Recibe un callback para enviar mensajes de log y, opcionalmente, el ContextoCarga compartido
+    del pipeline (si no se entrega se usa uno propio).
     """
+    ctx = None
     try:
-        ruta_db = obtener_ruta("ruta_database")
+        ctx = contexto or ContextoCarga()
+        ruta_db = ctx.ruta("ruta_database")
         print(f"Conectando a la base de datos en: {ruta_db}")
-        conn = sqlite3.connect(ruta_db)
+        conn = ctx.conexion()
         cursor = conn.cursor()
-        cursor.execute("PRAGMA foreign_keys = ON;")
 
         # ==========================================================
         # --- CONECTAR Y CARGAR TODAS LAS DIMENSIONES ---
@@ -343,5 +344,5 @@ def run(callback):
             conn.rollback()
         raise
     finally:
-        if 'conn' in locals():
-            conn.close()
+        if contexto is None and ctx is not None:
+            ctx.cerrar()
@@ -0,0 +1,213 @@
+import csv
+import os
+import numpy as np
+import pandas as pd
+from proceso_db.scripts.clave_datetime import parsear_fechas
+from utils.formato_limpio import VALORES_NULOS, pyarrow_disponible
+
+# --- Tipos de columna de los CSV limpios ---
+TEXTO = 'texto'          # str (object), nulos como NaN: lo mismo que dtype=str
+CATEGORIA = 'categoria'  # Texto muy repetido: category (un código por fila + valores distintos)
+ENTERO = 'entero'        # int64; float64 si la columna tiene vacíos o decimales
+DECIMAL = 'decimal'      # float64
+FECHA = 'fecha'          # datetime64 con los formatos del esquema (texto si algún valor no calza)
+
+# Formatos posibles de la columna FECHA/HORA de Ficha 0, en orden de prioridad
+FORMATOS_FECHA_HORA = ['%d/%m/%Y %H:%M', '%Y-%m-%d %H:%M:%S']
+
+class EsquemaCSV():
+    """
+    Disposición de un CSV limpio: separador, filas previas al encabezado (ej. 'sep=|') y tipo
+    de cada columna. Las columnas declaradas son obligatorias salvo las de 'opcionales'; las
+    que no se declaran se leen como texto. 'formatos_fecha' da los formatos (en orden) de
+    cada columna FECHA (None = inferencia de pandas).
+    leer() valida el encabezado antes de leer el archivo y entrega las columnas ya tipadas:
+    con pyarrow usa su lector de CSV (tipos por columna, sin pasar por str de Python) y si no
+    está instalado, o el archivo tiene valores que no calzan con el tipo, lee con pd.read_csv
+    (numéricas inferidas por el parser de C, el resto como str) y convierte (los valores no
+    numéricos quedan como nulo, igual que pd.to_numeric(errors='coerce') en los cargadores).
+    """
+    def __init__(self, nombre, columnas, sep=',', skiprows=0, formatos_fecha=None, opcionales=()):
+        self.nombre = nombre
+        self.columnas = columnas
+        self.sep = sep
+        self.skiprows = skiprows
+        self.formatos_fecha = formatos_fecha or {}
+        self.opcionales = set(opcionales)
+
+    def validar_encabezado(self, columnas, origen):
+        """Lanza ValueError si faltan columnas obligatorias ('origen' sólo se usa en el mensaje)."""
+        faltantes = [c for c in self.columnas if c not in self.opcionales and c not in set(columnas)]
+        if faltantes:
+            raise ValueError(f"Encabezado inválido en '{os.path.basename(origen)}' ({self.nombre}): "
+                             f"faltan las columnas {', '.join(faltantes)}.")
+
+    def leer(self, ruta_csv):
+        """DataFrame tipado del CSV (ver la descripción de la clase)."""
+        encabezado = self.__leer_encabezado(ruta_csv)
+        self.validar_encabezado(encabezado, ruta_csv)
+        if pyarrow_disponible():
+            import pyarrow as pa
+            try:
+                return self.tipar(self.__leer_pyarrow(ruta_csv, encabezado), ruta_csv)
+            except pa.ArrowInvalid as e:
+                print(f"Advertencia: '{os.path.basename(ruta_csv)}' no calza con los tipos de {self.nombre} ({e}). Se leerá con pandas.")
+        return self.tipar(self.__leer_pandas(ruta_csv, encabezado), ruta_csv)
+
+    def leer_por_partes(self, ruta_csv, filas_por_parte):
+        """Como leer(), pero de a 'filas_por_parte' filas (iterador de DataFrames tipados)."""
+        encabezado = self.__leer_encabezado(ruta_csv)
+        self.validar_encabezado(encabezado, ruta_csv)
+        with self.__leer_pandas(ruta_csv, encabezado, chunksize=filas_por_parte) as lector:
+            for parte in lector:
+                yield self.tipar(parte, ruta_csv)
+
+    def tipar(self, df, origen):
+        """
+        Valida las columnas y convierte las declaradas a su tipo. Sirve también para los
+        DataFrames que no vienen del CSV (en memoria o copia columnar): las columnas que ya
+        tienen el tipo se dejan tal cual.
+        """
+        self.validar_encabezado(df.columns, origen)
+        for columna, tipo in self.columnas.items():
+            if columna not in df.columns:
+                continue
+            serie = df[columna]
+            if tipo == CATEGORIA:
+                if not isinstance(serie.dtype, pd.CategoricalDtype):
+                    df[columna] = serie.astype('category')
+            elif tipo in (ENTERO, DECIMAL):
+                if not pd.api.types.is_numeric_dtype(serie) or pd.api.types.is_bool_dtype(serie):
+                    serie = pd.to_numeric(serie, errors='coerce')
+                serie = serie.astype('float64') if not pd.api.types.is_integer_dtype(serie) or serie.hasnans else serie
+                df[columna] = _como_entero(serie) if tipo == ENTERO else serie.astype('float64')
+            elif tipo == FECHA and not pd.api.types.is_datetime64_dtype(serie):
+                fechas = parsear_fechas(serie, self.formatos_fecha.get(columna))
+                # Un valor que no calza se deja como texto: el cargador informa el valor original
+                if not (fechas.isna() & serie.notna()).any():
+                    df[columna] = fechas
+        return df
+
+    # --- Métodos privados ---
+    def __leer_encabezado(self, ruta_csv):
+        with open(ruta_csv, 'r', encoding='utf-8-sig', newline='') as f:
+            for _ in range(self.skiprows):
+                f.readline()
+            return next(csv.reader(f, delimiter=self.sep), [])
+
+    def __leer_pyarrow(self, ruta_csv, encabezado):
+        import pyarrow as pa
+        import pyarrow.csv as pa_csv
+        tipos_arrow = {
+            CATEGORIA: pa.dictionary(pa.int32(), pa.string()),
+            ENTERO: pa.float64(), # Los vacíos se leen como nulo; tipar() deja int64 si no hay
+            DECIMAL: pa.float64(),
+        }
+        # Fechas y columnas no declaradas se leen como texto (pyarrow no infiere tipos propios)
+        tipos = {columna: tipos_arrow.get(self.columnas.get(columna), pa.string()) for columna in encabezado}
+        tabla = pa_csv.read_csv(
+            ruta_csv,
+            read_options=pa_csv.ReadOptions(skip_rows=self.skiprows),
+            parse_options=pa_csv.ParseOptions(delimiter=self.sep),
+            convert_options=pa_csv.ConvertOptions(column_types=tipos, null_values=list(VALORES_NULOS),
+                                                  strings_can_be_null=True),
+        )
+        return tabla.to_pandas()
+
+    def __leer_pandas(self, ruta_csv, encabezado, **opciones):
+        # Las numéricas las infiere el parser de C (int64/float64, u object si hay texto, que
+        # tipar() convierte); el resto se lee como str, igual que antes
+        dtype = {columna: str for columna in encabezado if self.columnas.get(columna) not in (ENTERO, DECIMAL)}
+        return pd.read_csv(ruta_csv, encoding="utf-8", dtype=dtype, sep=self.sep, skiprows=self.skiprows, **opciones)
+
+def _como_entero(serie):
+    """int64 si la columna no tiene vacíos ni decimales; si no, float64."""
+    if pd.api.types.is_integer_dtype(serie):
+        return serie.astype('int64')
+    valores = serie.to_numpy(dtype='float64')
+    if np.isnan(valores).any() or not np.array_equal(valores, np.trunc(valores)):
+        return serie
+    return serie.astype('int64')
+
+# --- Registro de los CSV limpios (claves = tipos del libro de cargas) ---
+ESQUEMAS = {
+    'trafico': EsquemaCSV("Tráfico Mensual", {
+        'Plaza': CATEGORIA,
+        'Categoria': CATEGORIA,
+        'TipoVehiculo': CATEGORIA,
+        'Fecha': FECHA,
+        'Anio': ENTERO,
+        'Mes': ENTERO,
+        'Dia': ENTERO,
+        'Hora': ENTERO,
+        'Direccion': CATEGORIA,
+        'Contar': ENTERO,
+    }, formatos_fecha={'Fecha': ['%Y-%m-%d']}, opcionales=['TipoVehiculo', 'Anio', 'Mes', 'Dia']),
+
+    # Ficha 0: un accidente por fila (sus relaciones están en ESQUEMAS_FICHA0)
+    'ficha0': EsquemaCSV("Siniestralidad Ficha 0", {
+        'ID Accidente': TEXTO,
+        'Fecha': CATEGORIA,
+        'Hora': CATEGORIA,
+        'Tramo': ENTERO,
+        'Tipo Accidente': ENTERO,
+        'Ubicación Relativa': ENTERO,
+        'Condición calzada': ENTERO,
+        'Luminosidad': ENTERO,
+        'Estado Atmosférico': ENTERO,
+        'Luz artificial': ENTERO,
+        'Daños Ocasionados a la Infraestructura vial': CATEGORIA,
+        'Descripción del Accidente': TEXTO,
+        'FECHA/HORA': FECHA,
+    }, sep='|', skiprows=1, formatos_fecha={'FECHA/HORA': FORMATOS_FECHA_HORA}, opcionales=['Fecha', 'Hora']),
+
+    'ficha1': EsquemaCSV("Siniestralidad Ficha 1", {
+        'Código Accidente': TEXTO,
+        'Tipo Vehículo': ENTERO,
+        'Servicio': ENTERO,
+        'Maniobra': ENTERO,
+        'Consecuencia': ENTERO,
+        'Pista/Vía': ENTERO,
+        'Patente': TEXTO,
+        'Marca': CATEGORIA,
+        'ID Accidente': TEXTO,
+    }, opcionales=['Código Accidente', 'Tipo Vehículo', 'Servicio', 'Maniobra', 'Consecuencia', 'Pista/Vía']),
+}
+
+# --- Tablas relacionadas de Ficha 0 (TABLAS_FICHA0 de utils/formato_limpio), una por relación ---
+ESQUEMAS_FICHA0 = {
+    'Entorno': EsquemaCSV("Ficha 0 - Entorno", {
+        'ID Accidente': TEXTO,
+        'Condiciones del Entorno': CATEGORIA,
+        'Valor Condiciones del Entorno': ENTERO,
+    }, sep='|', skiprows=1),
+
+    'Concurrencia': EsquemaCSV("Ficha 0 - Concurrencia", {
+        'ID Accidente': TEXTO,
+        'Concurrencia': CATEGORIA,
+        'Valor Concurrencia': ENTERO,
+    }, sep='|', skiprows=1),
+
+    'Afectados': EsquemaCSV("Ficha 0 - Afectados", {
+        'ID Accidente': TEXTO,
+        'Consecuencia': CATEGORIA,
+        'Afectado': CATEGORIA,
+        'Cantidad Afectados': ENTERO,
+    }, sep='|', skiprows=1),
+
+    'Causas': EsquemaCSV("Ficha 0 - Causas", {
+        'ID Accidente': TEXTO,
+        'Causa Probable': CATEGORIA,
+        'Valor Causa Probable': ENTERO,
+    }, sep='|', skiprows=1),
+
+    'Pistas': EsquemaCSV("Ficha 0 - Pistas", {
+        'ID Accidente': TEXTO,
+        'Pista': ENTERO,
+    }, sep='|', skiprows=1),
+
+    'Km': EsquemaCSV("Ficha 0 - Km", {
+        'ID Accidente': TEXTO,
+        'Km': DECIMAL,
+    }, sep='|', skiprows=1),
+}
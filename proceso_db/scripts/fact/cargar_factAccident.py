@@ -1,404 +1,368 @@
 import sqlite3
 import pandas as pd
+import numpy as np
 import os
 import glob
-from datetime import datetime
 import time
-from config_manager import obtener_ruta
+from proceso_db.scripts.contexto_carga import ContextoCarga
+from proceso_db.scripts.registro_cargas import RegistroCargas
+from proceso_db.scripts.crear_tablas import preparar_indices
+from proceso_db.scripts.esquemas_csv import ESQUEMAS, ESQUEMAS_FICHA0, FORMATOS_FECHA_HORA
+from proceso_db.scripts.clave_datetime import parsear_fechas
+from proceso_db.scripts.dim.cargar_dimDateTime import asegurar_rango
+from utils.memoria import texto_memoria_maxima
 
 # --- INICIO DE INTEGRACIÓN ---
 
 # === 1. Definir rutas ===
-def get_paths():
+def get_paths(ctx):
     try:
-        ruta_db = obtener_ruta("ruta_database")
-        ruta_csv_limpio = obtener_ruta("ruta_csv_limpio")
+        ruta_db = ctx.ruta("ruta_database")
+        ruta_csv_limpio = ctx.ruta("ruta_csv_limpio")
         ruta_base_csv_ficha0 = os.path.join(ruta_csv_limpio, "Siniestralidad", "Ficha 0")
         
         return ruta_db, ruta_base_csv_ficha0
     except Exception as e:
         raise RuntimeError(f"Error al cargar rutas desde config_manager: {e}")
 
-# === 2. Función Helper ===
-def obtener_fk(cursor, row, mapa_datetime_local, callback):
-    fks = {}
-    
-    # --- Lookup dim_DateTime ---
-    try:
-        csv_timestamp_str = str(row['FECHA/HORA'])
-        if pd.isna(csv_timestamp_str) or csv_timestamp_str == 'nan':
-            callback(f"Error fatal procesando fecha: {row['FECHA/HORA']}. Se usará NULL.")
-            fks['idDateTime'] = None # Marcar como None
-        else:
-            dt_obj = None
-            try:
-                dt_obj = pd.to_datetime(csv_timestamp_str, format='%d/%m/%Y %H:%M')
-            except ValueError:
-                try:
-                    dt_obj = pd.to_datetime(csv_timestamp_str, format='%Y-%m-%d %H:%M:%S')
-                except Exception as e2:
-                    callback(f"Error procesando fecha '{csv_timestamp_str}' en ambos formatos: {e2}. Se usará NULL.")
-                    fks['idDateTime'] = None
-
-            if dt_obj is not None:
-                # Formato de búsqueda :SS (segundos)
-                search_timestamp_str = dt_obj.strftime('%Y-%m-%d %H:%M:00')
-                resultado_id = mapa_datetime_local.get(search_timestamp_str)
-                
-                if resultado_id:
-                    fks['idDateTime'] = resultado_id
-                else:
-                    callback(f"Advertencia: No se encontró la fecha/minuto {search_timestamp_str} (de {csv_timestamp_str}) en dim_DateTime. Se usará NULL.")
-                    fks['idDateTime'] = None
-
-    except Exception as e:
-        callback(f"Error fatal procesando fecha: {row['FECHA/HORA']} -> {e}. Se usará NULL.")
-        fks['idDateTime'] = None
-
-    # --- Lookups 1:N (Directos) ---
-    try:
-        def safe_int_convert(value, default=0):
-            val_num = pd.to_numeric(value, errors='coerce')
-            if pd.isna(val_num):
-                return default
-            return int(val_num)
-
-        fks['idAccidentType'] = safe_int_convert(row['Tipo Accidente'], 0)
-        fks['idRelativeLocation'] = safe_int_convert(row['Ubicación Relativa'], 0)
-        fks['idSurfaceCondition'] = safe_int_convert(row['Condición calzada'], 0)
-        fks['idWeather'] = safe_int_convert(row['Estado Atmosférico'], 0)
-        fks['idLuminosity'] = safe_int_convert(row['Luminosidad'], 0)
-        fks['idArtificialLight'] = safe_int_convert(row['Luz artificial'], 0)
-        fks['idSection'] = safe_int_convert(row['Tramo'], 0)
-
-    except Exception as e:
-        callback(f"Error inesperado en Lookups 1:N: {e}. Fila: {row}")
-        fks.update({k: 0 for k in ['idAccidentType', 'idRelativeLocation', 'idSurfaceCondition', 'idWeather', 'idLuminosity', 'idArtificialLight', 'idSection'] if k not in fks})
-
+# FKs 1:N de factAccident: (columna FK, columna del CSV, dimensión), en el orden en que se reportan
+FKS_1N = [
+    ('idAccidentType', 'Tipo Accidente', 'dim_AccidentType'),
+    ('idRelativeLocation', 'Ubicación Relativa', 'dim_RelativeLocation'),
+    ('idSurfaceCondition', 'Condición calzada', 'dim_SurfaceCondition'),
+    ('idWeather', 'Estado Atmosférico', 'dim_Weather'),
+    ('idLuminosity', 'Luminosidad', 'dim_Luminosity'),
+    ('idArtificialLight', 'Luz artificial', 'dim_ArtificialLight'),
+    ('idSection', 'Tramo', 'dim_Section'),
+]
+# Orden de validación (después de idDateTime)
+ORDEN_VALIDACION = ['idSection', 'idAccidentType', 'idRelativeLocation', 'idSurfaceCondition',
+                    'idWeather', 'idLuminosity', 'idArtificialLight']
+
+# === 2. Funciones Helper ===
+def safe_int_convert(serie, default=0):
+    """ Convierte una columna a enteros de forma segura, usando un default (ej. 0 para 'Sin Dato') """
+    return np.trunc(pd.to_numeric(serie, errors='coerce')).fillna(default).astype('int64')
+
+def obtener_fks(df_accidentes):
+    """
+    FKs de todos los accidentes como columnas (idDateTime ya calculado aritméticamente en run).
+    Devuelve un DataFrame con idDateTime (NA si la fecha es nula o no se encontró) y las FKs 1:N.
+    """
+    fks = pd.DataFrame({'idDateTime': df_accidentes['idDateTime']}, index=df_accidentes.index)
+    for columna_fk, columna_csv, _ in FKS_1N:
+        fks[columna_fk] = safe_int_convert(df_accidentes[columna_csv], 0)
     return fks
 
+def validar_fks(fks, mapas_ids):
+    """
+    Valida las FKs de todos los accidentes. Devuelve una Serie con el primer error
+    de cada accidente (None si es válido), en el mismo orden de validación de siempre.
+    """
+    dimensiones = {columna_fk: dimension for columna_fk, _, dimension in FKS_1N}
+    errores = pd.Series(None, index=fks.index, dtype=object)
+    errores[fks['idDateTime'].isna()] = "idDateTime es Nulo (fecha nan o no encontrada)"
+    for columna_fk in ORDEN_VALIDACION:
+        mascara = errores.isna() & ~fks[columna_fk].isin(mapas_ids[columna_fk])
+        if mascara.any():
+            errores[mascara] = [f"{columna_fk} {valor} no existe en {dimensiones[columna_fk]}" for valor in fks.loc[mascara, columna_fk]]
+    return errores
+
+def mensaje_error_fecha(row):
+    """ Mensaje del problema de fecha de un accidente (None si la fecha es válida) """
+    valor = row['FECHA/HORA']
+    if pd.isna(valor) or str(valor) == 'nan':
+        # Vacío del CSV (NaN) o NaT de la copia columnar
+        return "Error fatal procesando fecha: nan. Se usará NULL."
+    if pd.isna(row['__Timestamp']):
+        return f"Error procesando fecha '{valor}' en ambos formatos. Se usará NULL."
+    if pd.isna(row['idDateTime']):
+        search_timestamp_str = row['__Timestamp'].strftime('%Y-%m-%d %H:%M:00')
+        return f"Advertencia: No se encontró la fecha/minuto {search_timestamp_str} (de {valor}) en dim_DateTime. Se usará NULL."
+    return None
+
+def frame_desde_mapa(mapa, col1, col2, id_col):
+    """ DataFrame de búsqueda (texto, valor int, ID) a partir de un mapa doble en caché """
+    return pd.DataFrame([(k1, k2, v) for (k1, k2), v in mapa.items()], columns=[col1, col2, id_col])
+
+def construir_puente(df, mapa, col_tipo, col_valor, id_col):
+    """
+    Filas (idAccident, id) de un puente M:N: cruza (texto, valor) de cada fila contra la dimensión.
+    Se omiten valores vacíos/no numéricos y combinaciones que no existen en la dimensión.
+    """
+    valores = pd.to_numeric(df[col_valor], errors='coerce')
+    con_valor = valores.notna()
+    claves = pd.DataFrame({
+        'idAccident': df.loc[con_valor, 'ID Accidente'],
+        'tipo': df.loc[con_valor, col_tipo].astype(str),
+        'valor': np.trunc(valores[con_valor]).astype('int64'),
+    })
+    puente = claves.merge(frame_desde_mapa(mapa, 'tipo', 'valor', id_col), on=['tipo', 'valor'], how='inner')
+    puente = puente[puente[id_col] != 0]
+    return puente[['idAccident', id_col]].drop_duplicates()
+
+def construir_afectados(df, mapa_consequence, mapa_affected):
+    """ Filas de factAccidentAffected (idAccident, idConsequence, idAffected, AffectedCount) """
+    afectados = pd.DataFrame({
+        'idAccident': df['ID Accidente'],
+        'idConsequence': df['Consecuencia'].astype(str).map(mapa_consequence),
+        'idAffected': df['Afectado'].astype(str).map(mapa_affected),
+        'AffectedCount': np.trunc(pd.to_numeric(df['Cantidad Afectados'], errors='coerce')),
+    })
+    validos = afectados['idConsequence'].fillna(0).ne(0) & afectados['idAffected'].fillna(0).ne(0) & afectados['AffectedCount'].notna()
+    afectados = afectados[validos].astype({'idConsequence': 'int64', 'idAffected': 'int64', 'AffectedCount': 'int64'})
+    # UNIQUE(idAccident, idConsequence, idAffected): se conserva la primera aparición, como INSERT OR IGNORE
+    return afectados.drop_duplicates(subset=['idAccident', 'idConsequence', 'idAffected'])
+
+def construir_pistas(df_pistas, mapa_lane, callback):
+    """ Filas de bridge_Accident_Lane: una por cada pista marcada en el accidente (tabla Pistas) """
+    id_lane = df_pistas['Pista'].map(mapa_lane)
+    sin_lane = id_lane.fillna(0).eq(0)
+    for pista, cantidad in sorted(df_pistas.loc[sin_lane, 'Pista'].value_counts().items()):
+        callback(f"Error: No se encontró idLane para LaneValue = {pista}. Saltando ({cantidad} accidentes).")
+    return pd.DataFrame({'idAccident': df_pistas.loc[~sin_lane, 'ID Accidente'],
+                         'idLane': id_lane[~sin_lane].astype('int64')})
+
+def construir_km(df_accidentes, mapa_km, callback):
+    """ Filas de bridge_Accident_Km: Km del accidente redondeado a 3 decimales contra dim_Km """
+    km = pd.to_numeric(df_accidentes['Km'], errors='coerce').dropna()
+    redondeo = {valor: round(float(valor), 3) for valor in km.unique()}
+    km_redondeado = km.map(redondeo)
+    id_km = km_redondeado.map(mapa_km)
+    for id_acc, km_rounded in zip(df_accidentes.loc[id_km[id_km.isna()].index, 'ID Accidente'], km_redondeado[id_km.isna()]):
+        callback(f"Error: No se encontró idKm para Km = {km_rounded} (Accidente {id_acc}).")
+    encontrados = id_km.notna()
+    return pd.DataFrame({'idAccident': df_accidentes.loc[encontrados[encontrados].index, 'ID Accidente'],
+                         'idKm': id_km[encontrados].astype('int64')})
+
+def crear_mapa_km(conn):
+    """ Mapa Km -> idKm (dim_Km no cambia durante la carga) """
+    df_mapa = pd.read_sql("SELECT idKm, Km FROM dim_Km", conn)
+    return {float(k): v for k, v in zip(df_mapa['Km'], df_mapa['idKm'])}
+
+def cargar_archivo(ctx, registro, archivo, df_ficha0, relaciones, mapas, callback):
+    """
+    Carga un archivo de Ficha 0 (accidentes, puentes y detalle) y lo registra en el libro de
+    cargas dentro de la transacción abierta por el llamador, que la confirma o, si falla, la
+    revierte. dim_DateTime ya debe cubrir las fechas del archivo (asegurar_rango).
+    'df_ficha0' trae un accidente por fila y 'relaciones' sus tablas ({tabla: DataFrame}, ver
+    ESQUEMAS_FICHA0), que van casi directo a los puentes.
+    Devuelve los accidentes rechazados: {ID Accidente: (FKs, archivo)}.
+    """
+    conn = ctx.conexion()
+    cursor = conn.cursor()
+    nombre_archivo = archivo['ruta_relativa'] # Distingue archivos homónimos de distintos años
+
+    # --- Clave aritmética de DateTime (se verifica una vez contra la BD) ---
+    clave_datetime = ctx.clave_datetime()
+    start_archivo = time.time()
+
+    # --- 0. Registrar la carga; la versión reemplazada se borra en esta misma transacción ---
+    id_carga = registro.iniciar(archivo, callback)
+
+    # --- 1. Cargar factAccident (Hechos Principales) ---
+    callback("Cargando factAccident...")
+    df_ficha0['ID Accidente'] = df_ficha0['ID Accidente'].str.strip()
+    df_main_accident = df_ficha0.drop_duplicates(subset=['ID Accidente']).reset_index(drop=True)
+    df_main_accident['__Timestamp'] = parsear_fechas(df_main_accident['FECHA/HORA'], FORMATOS_FECHA_HORA)
+    # Con dim_DateTime por hora, idDateTime apunta a la hora y MinuteOffset guarda el minuto
+    df_main_accident['idDateTime'], df_main_accident['MinuteOffset'] = clave_datetime.calcular_ids_y_offset(df_main_accident['__Timestamp'])
+
+    # FKs y validación de todos los accidentes como operaciones de columna
+    fks = obtener_fks(df_main_accident)
+    errores = validar_fks(fks, mapas['ids'])
+
+    # Reporte de los accidentes rechazados (mismos mensajes que la validación fila a fila)
+    failed_accident_details = {}
+    for index in errores.index[errores.notna()]:
+        row = df_main_accident.loc[index]
+        id_acc = row['ID Accidente']
+        fks_fila = {columna: (None if pd.isna(valor) else int(valor)) for columna, valor in fks.loc[index].items()}
+        mensaje_fecha = mensaje_error_fecha(row)
+        if mensaje_fecha:
+            callback(mensaje_fecha)
+        callback(f"Error de Integridad FK al insertar {id_acc}: FOREIGN KEY no encontrada: {errores[index]}. Valores: {fks_fila}")
+        callback(f"Valores FK que fallaron: {fks_fila}")
+        failed_accident_details[id_acc] = (fks_fila, nombre_archivo)
+
+    validos = errores.isna()
+    df_validos = df_main_accident[validos]
+    fks_validos = fks[validos]
+    filas_para_fact_accident = list(zip(
+        df_validos['ID Accidente'], fks_validos['idDateTime'].astype('int64'), fks_validos['idSection'],
+        fks_validos['idAccidentType'], fks_validos['idRelativeLocation'],
+        fks_validos['idSurfaceCondition'], fks_validos['idWeather'], fks_validos['idLuminosity'], fks_validos['idArtificialLight'],
+        df_validos['Daños Ocasionados a la Infraestructura vial'].astype(str),
+        df_validos['Descripción del Accidente'].astype(object).where(df_validos['Descripción del Accidente'].notna(), None),
+        [None] * len(df_validos), # totalVehicles pendiente: lo cuenta cargar_factAccident_conteo
+        df_validos['MinuteOffset'].astype('int64'),
+        [id_carga] * len(df_validos),
+    ))
+
+    if filas_para_fact_accident:
+        callback(f"Insertando {len(filas_para_fact_accident)} filas válidas en factAccident...")
+        try:
+            cursor.executemany("""
+                INSERT OR IGNORE INTO factAccident (
+                    idAccident, idDateTime, idSection,
+                    idAccidentType, idRelativeLocation,
+                    idSurfaceCondition, idWeather, idLuminosity, idArtificialLight,
+                    InfrastructureDamage, Description, totalVehicles, MinuteOffset, idCarga
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, filas_para_fact_accident)
+        except sqlite3.IntegrityError as e:
+            callback(f"ERROR FATAL en carga por lotes de factAccident. Revisar duplicados o FKs. Error: {e}")
+            raise e
+    del filas_para_fact_accident
+
+    callback("...factAccident procesado.")
+
+    # --- 2. Cargar Tablas Puente (M:N) y Detalle (una tabla relacionada por puente) ---
+    callback("Cargando tablas puente y de detalle...")
+    for tabla, df_tabla in relaciones.items():
+        df_tabla['ID Accidente'] = df_tabla['ID Accidente'].str.strip()
+        relaciones[tabla] = df_tabla[~df_tabla['ID Accidente'].isin(failed_accident_details.keys())]
+
+    bridge_response = construir_puente(relaciones['Concurrencia'], mapas['response'], 'Concurrencia', 'Valor Concurrencia', 'idResponse')
+    bridge_probablecause = construir_puente(relaciones['Causas'], mapas['probablecause'], 'Causa Probable', 'Valor Causa Probable', 'idProbableCause')
+    bridge_environment = construir_puente(relaciones['Entorno'], mapas['environment'], 'Condiciones del Entorno', 'Valor Condiciones del Entorno', 'idEnvironment')
+    fact_affected = construir_afectados(relaciones['Afectados'], mapas['consequence'], mapas['affected'])
+    bridge_lane = construir_pistas(relaciones['Pistas'], mapas['lane'], callback)
+    bridge_km = construir_km(relaciones['Km'], mapas['km'], callback)
+    
+    print("Insertando datos en tablas puente...")
+    inserciones = [
+        ("INSERT OR IGNORE INTO bridge_Accident_Response (idAccident, idResponse) VALUES (?, ?)", bridge_response),
+        ("INSERT OR IGNORE INTO bridge_Accident_ProbableCause (idAccident, idProbableCause) VALUES (?, ?)", bridge_probablecause),
+        ("INSERT OR IGNORE INTO bridge_Accident_Environment (idAccident, idEnvironment) VALUES (?, ?)", bridge_environment),
+        ("INSERT OR IGNORE INTO factAccidentAffected (idAccident, idConsequence, idAffected, AffectedCount) VALUES (?, ?, ?, ?)", fact_affected),
+        ("INSERT OR IGNORE INTO bridge_Accident_Lane (idAccident, idLane) VALUES (?, ?)", bridge_lane),
+        ("INSERT OR IGNORE INTO bridge_Accident_Km (idAccident, idKm) VALUES (?, ?)", bridge_km),
+    ]
+    for sql, df_puente in inserciones:
+        if not df_puente.empty:
+            cursor.executemany(sql, df_puente.itertuples(index=False, name=None))
+
+    callback("...tablas puente y de detalle cargadas.")
+
+    # --- 3. Libro de cargas (en Ficha 0 se cuentan accidentes) ---
+    callback(f"Registrando {nombre_archivo} en el libro de cargas (Ficha 0)...")
+    accidentes_cargados = cursor.execute("SELECT COUNT(*) FROM factAccident WHERE idCarga = ?", (id_carga,)).fetchone()[0]
+    registro.finalizar(id_carga, len(df_main_accident), accidentes_cargados, len(failed_accident_details),
+                       time.time() - start_archivo)
+    return failed_accident_details
+
 # === 3. Proceso ETL Principal ===
 
-def run(callback):
+def run(callback, contexto=None, archivos_csv=None):
     """
     Carga los accidentes desde Ficha 0 en la tabla factAccident.
-    Recibe un callback para enviar mensajes de log.
+    Recibe un callback para enviar mensajes de log y, opcionalmente, el ContextoCarga compartido
+    del pipeline (si no se entrega se usa uno propio).
+    'archivos_csv' limita la carga a esos CSV (carga en línea); por defecto se buscan todos los
+    de la carpeta.
+    Cada archivo es el CSV de accidentes con sus tablas relacionadas (TABLAS_FICHA0); se leen y
+    cargan de a uno y cada uno se confirma en su propia transacción (un accidente abarca filas
+    de varias tablas, por eso no se parten en lotes de filas).
     """
+    ctx = None
     try:
-        ruta_db, ruta_base_csv_ficha0 = get_paths()
-        conn = sqlite3.connect(ruta_db)
+        ctx = contexto or ContextoCarga()
+        ruta_db, ruta_base_csv_ficha0 = get_paths(ctx)
+        conn = ctx.conexion()
         cursor = conn.cursor()
-        cursor.execute("PRAGMA foreign_keys = ON;")
 
         callback("--- Cargando Ficha 0: factAccident ---")
         
-        print("Consultando log de archivos ya procesados...")
-        cursor.execute("SELECT FileName FROM etl_log_ficha0")
-        processed_files = set(row[0] for row in cursor.fetchall())
-        callback(f"Se encontraron {len(processed_files)} archivos en el log.")
-
         # ... Lectura de CSVs ...
-        print(f"Buscando archivos CSV en: {ruta_base_csv_ficha0} y subcarpetas...")
-        patron_busqueda = os.path.join(ruta_base_csv_ficha0, '**', '*.csv')
-        todos_los_archivos_csv = glob.glob(patron_busqueda, recursive=True)
-        
-        nuevos_archivos_csv = []
-        for f in todos_los_archivos_csv:
-            file_name = os.path.basename(f)
-            if file_name not in processed_files:
-                nuevos_archivos_csv.append(f)
-
-        if not nuevos_archivos_csv:
-            callback("No se encontraron archivos CSV nuevos para cargar. El proceso ha finalizado.")
-            conn.close()
+        if archivos_csv is None:
+            print(f"Buscando archivos CSV en: {ruta_base_csv_ficha0} y subcarpetas...")
+            # Sólo los CSV de accidentes: las tablas relacionadas ('..._Limpio_<Tabla>.csv') van con ellos
+            patron_busqueda = os.path.join(ruta_base_csv_ficha0, '**', '*_Limpio.csv')
+            archivos_csv = glob.glob(patron_busqueda, recursive=True)
+
+        # Libro de cargas: sólo archivos nuevos, modificados o que quedaron con errores
+        registro = RegistroCargas(ctx, 'ficha0')
+        archivos_a_cargar = registro.planificar(archivos_csv, callback)
+
+        if not archivos_a_cargar:
+            callback("No se encontraron archivos CSV nuevos o modificados para cargar. El proceso ha finalizado.")
             return
         
-        callback(f"Se encontraron {len(nuevos_archivos_csv)} archivos CSV NUEVOS. Iniciando carga...")
-        
-        lista_dataframes = []
-        for archivo_csv in nuevos_archivos_csv:
-            callback(f"  Leyendo: {os.path.basename(archivo_csv)}")
-            try:
-                df_temp = pd.read_csv(archivo_csv, encoding="utf-8", dtype=str, sep='|', skiprows=1)
-                df_temp['__SourceFileName'] = os.path.basename(archivo_csv)
-                lista_dataframes.append(df_temp)
-            except Exception as e:
-                callback(f"    ERROR: No se pudo leer o procesar el archivo {archivo_csv}. Error: {e}")
-                
-        if not lista_dataframes:
-            callback("Error: Ningún archivo CSV nuevo pudo ser leído correctamente. Saliendo.")
-            conn.close()
-            return
-            
-        df_ficha0 = pd.concat(lista_dataframes, ignore_index=True)
-        print(f"\nCarga de CSVs completada. {len(df_ficha0)} filas totales leídas de {len(nuevos_archivos_csv)} archivos.")
-        
-        # --- Pre-cargar mapa de DateTime ---
-        print("Optimizando búsquedas de fecha...")
-        df_main_accident_dates = df_ficha0.drop_duplicates(subset=['ID Accidente']).copy()
-        
-        df_main_accident_dates['dt_obj'] = pd.to_datetime(df_main_accident_dates['FECHA/HORA'], format='%d/%m/%Y %H:%M', errors='coerce')
-        mask_failed = df_main_accident_dates['dt_obj'].isna()
-        df_main_accident_dates.loc[mask_failed, 'dt_obj'] = pd.to_datetime(df_main_accident_dates.loc[mask_failed, 'FECHA/HORA'], format='%Y-%m-%d %H:%M:%S', errors='coerce')
-        
-        # --- El formato de búsqueda debe coincidir con la BD ---
-        df_main_accident_dates['LookupKey'] = df_main_accident_dates['dt_obj'].dt.strftime('%Y-%m-%d %H:%M:00')
-        
-        claves_needed = tuple(df_main_accident_dates['LookupKey'].dropna().unique())
+        callback(f"Se encontraron {len(archivos_a_cargar)} archivos CSV NUEVOS o modificados. Iniciando carga...")
+
+        # Índices de la tabla de hechos: se eliminan sólo si la carga es masiva
+        preparar_indices(ctx, registro, archivos_a_cargar, callback)
         
-        mapa_datetime = {}
-        if claves_needed:
-            callback(f"Buscando {len(claves_needed)} claves de fecha únicas en la BD...")
-            df_fecha = pd.read_sql(f"SELECT idDateTime, DateTime FROM dim_DateTime WHERE DateTime IN {claves_needed}", conn)
-            mapa_datetime = dict(zip(df_fecha['DateTime'], df_fecha['idDateTime']))
-            del df_fecha
-        callback(f"Mapa de dim_DateTime creado con {len(mapa_datetime)} claves encontradas.") # Log para verificar
-
-        # --- Pre-cargar todos los mapas de puentes ---
+        # --- Pre-cargar todos los mapas de puentes (en caché del contexto) ---
         print("Creando mapas para tablas puente...")
-        def crear_mapa_doble(tabla, id_col, col1, col2):
-            df_mapa = pd.read_sql(f"SELECT {id_col}, {col1}, {col2} FROM {tabla}", conn)
-            return { (str(row[col1]), int(row[col2])): row[id_col] for index, row in df_mapa.iterrows() } # Convertir col2 a int
-
-        def crear_mapa_simple(tabla, id_col, col1):
-            df_mapa = pd.read_sql(f"SELECT {id_col}, {col1} FROM {tabla}", conn)
-            if pd.api.types.is_numeric_dtype(df_mapa[col1]):
-                return {int(k): v for k, v in zip(df_mapa[col1], df_mapa[id_col])}
-            return {str(k): v for k, v in zip(df_mapa[col1], df_mapa[id_col])}
-
-        mapa_response = crear_mapa_doble("dim_Response", "idResponse", "ResponseType", "ResponseValue")
-        mapa_probablecause = crear_mapa_doble("dim_ProbableCause", "idProbableCause", "ProbableCauseType", "CauseValue")
-        mapa_environment = crear_mapa_doble("dim_Environment", "idEnvironment", "EnvironmentCondition", "EnvironmentValue")
-        mapa_consequence = crear_mapa_simple("dim_Consequence", "idConsequence", "ConsequenceType")
-        mapa_affected = crear_mapa_simple("dim_Affected", "idAffected", "AffectedType")
-        mapa_lane = crear_mapa_simple("dim_Lane", "idLane", "LaneValue")
+        mapas = {
+            'response': ctx.mapa_doble("dim_Response", "idResponse", "ResponseType", "ResponseValue"),
+            'probablecause': ctx.mapa_doble("dim_ProbableCause", "idProbableCause", "ProbableCauseType", "CauseValue"),
+            'environment': ctx.mapa_doble("dim_Environment", "idEnvironment", "EnvironmentCondition", "EnvironmentValue"),
+            'consequence': ctx.mapa_simple("dim_Consequence", "idConsequence", "ConsequenceType"),
+            'affected': ctx.mapa_simple("dim_Affected", "idAffected", "AffectedType"),
+            'lane': ctx.mapa_simple("dim_Lane", "idLane", "LaneValue"),
+            'km': ctx.mapa("km", crear_mapa_km),
+        }
         
         callback("Mapas de puentes creados.")
 
         # --- Cargar mapas de IDs 1:N para validación ---
         print("Creando mapas de validación 1:N...")
-        def crear_mapa_ids(tabla, id_col):
-            try:
-                return set(pd.read_sql(f"SELECT {id_col} FROM {tabla}", conn)[id_col])
-            except Exception as e:
-                callback(f"Error al cargar mapa de IDs para {tabla}: {e}")
-                # Retorna un set con el ID 'Sin dato' como mínimo
-                return {0} 
-
-        map_ids_section = crear_mapa_ids("dim_Section", "idSection")
-        map_ids_accidenttype = crear_mapa_ids("dim_AccidentType", "idAccidentType")
-        map_ids_relativelocation = crear_mapa_ids("dim_RelativeLocation", "idRelativeLocation")
-        map_ids_surfacecondition = crear_mapa_ids("dim_SurfaceCondition", "idSurfaceCondition")
-        map_ids_weather = crear_mapa_ids("dim_Weather", "idWeather")
-        map_ids_luminosity = crear_mapa_ids("dim_Luminosity", "idLuminosity")
-        map_ids_artificiallight = crear_mapa_ids("dim_ArtificialLight", "idArtificialLight")
+        mapas['ids'] = {columna_fk: ctx.mapa_ids(dimension, columna_fk, callback) for columna_fk, _, dimension in FKS_1N}
         
         print("Mapas de validación 1:N creados.")
 
-        # --- 1. Cargar factAccident (Hechos Principales) ---
-        callback("Cargando factAccident...")
-        df_ficha0['ID Accidente'] = df_ficha0['ID Accidente'].str.strip()
-        df_main_accident = df_ficha0.drop_duplicates(subset=['ID Accidente']).reset_index() 
-        
+        # --- Un archivo a la vez, cada uno en su propia transacción ---
         failed_accident_details = {}
-        filas_para_fact_accident = []
-        total_rows = len(df_main_accident)
-        start_loop = time.time()
-
-        for index, row in df_main_accident.iterrows():
-            if (index + 1) % 10000 == 0:
-                elapsed = time.time() - start_loop
-                rows_per_sec = (index + 1) / elapsed
-                callback(f"  ... Procesando Accidente {index + 1} de {total_rows} ({rows_per_sec:.0f} filas/seg)")
-            
-            fks = obtener_fk(cursor, row, mapa_datetime, callback) # Llamada a la función global
-            id_acc = row['ID Accidente']
-            
-            damage_text = str(row['Daños Ocasionados a la Infraestructura vial'])
-            total_veh = 0
-            
+        archivos_fallidos = set()
+        archivos_leidos = 0
+        filas_leidas = 0
+        for archivo in archivos_a_cargar:
+            callback(f"  Leyendo: {archivo['nombre']}")
             try:
-                error_fk = None
-                if fks['idDateTime'] is None:
-                    error_fk = "idDateTime es Nulo (fecha nan o no encontrada)"
-                elif fks['idSection'] not in map_ids_section:
-                    error_fk = f"idSection {fks['idSection']} no existe en dim_Section"
-                elif fks['idAccidentType'] not in map_ids_accidenttype:
-                    error_fk = f"idAccidentType {fks['idAccidentType']} no existe en dim_AccidentType"
-                elif fks['idRelativeLocation'] not in map_ids_relativelocation:
-                    error_fk = f"idRelativeLocation {fks['idRelativeLocation']} no existe en dim_RelativeLocation"
-                elif fks['idSurfaceCondition'] not in map_ids_surfacecondition:
-                    error_fk = f"idSurfaceCondition {fks['idSurfaceCondition']} no existe en dim_SurfaceCondition"
-                elif fks['idWeather'] not in map_ids_weather:
-                    error_fk = f"idWeather {fks['idWeather']} no existe en dim_Weather"
-                elif fks['idLuminosity'] not in map_ids_luminosity:
-                    error_fk = f"idLuminosity {fks['idLuminosity']} no existe en dim_Luminosity"
-                elif fks['idArtificialLight'] not in map_ids_artificiallight:
-                    error_fk = f"idArtificialLight {fks['idArtificialLight']} no existe en dim_ArtificialLight"
-
-                if error_fk:
-                    # Usar la misma clase de excepción para que el logger la capture
-                    raise sqlite3.IntegrityError(f"FOREIGN KEY no encontrada: {error_fk}. Valores: {fks}")
-                
-                # Si pasa la validación, se añade a la lista
-                filas_para_fact_accident.append((
-                    id_acc, fks['idDateTime'], fks['idSection'],
-                    fks['idAccidentType'], fks['idRelativeLocation'],
-                    fks['idSurfaceCondition'], fks['idWeather'], fks['idLuminosity'], fks['idArtificialLight'],
-                    damage_text, row['Descripción del Accidente'], total_veh
-                ))
-                
-            except sqlite3.IntegrityError as e:
-                if "FOREIGN KEY" in str(e) or "FOREIGN KEY no encontrada" in str(e):
-                    callback(f"Error de Integridad FK al insertar {id_acc}: {e}")
-                    callback(f"Valores FK que fallaron: {fks}")
-                elif "UNIQUE" in str(e) or "PRIMARY KEY" in str(e):
-                    callback(f"Info: {id_acc} ya existe. Omitiendo (PK/UNIQUE).")
-                else:
-                    callback(f"Error de Integridad (otro) al insertar {id_acc}: {e}")
-                failed_accident_details[id_acc] = (fks, row['__SourceFileName'])
-
-        if filas_para_fact_accident:
-            callback(f"Insertando {len(filas_para_fact_accident)} filas válidas en factAccident...")
-            try:
-                cursor.executemany("""
-                    INSERT OR IGNORE INTO factAccident (
-                        idAccident, idDateTime, idSection,
-                        idAccidentType, idRelativeLocation,
-                        idSurfaceCondition, idWeather, idLuminosity, idArtificialLight,
-                        InfrastructureDamage, Description, totalVehicles
-                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                """, filas_para_fact_accident)
-            except sqlite3.IntegrityError as e:
-                callback(f"ERROR FATAL en carga por lotes de factAccident. Revisar duplicados o FKs. Error: {e}")
-                conn.rollback()
-                raise e
-
-        callback("...factAccident procesado.")
-
-        # --- 2. Cargar Tablas Puente (M:N) y Detalle ---
-        callback("Cargando tablas puente y de detalle...")
-        df_full = df_ficha0.drop_duplicates().reset_index()
-
-        filas_bridge_response = []
-        filas_bridge_probablecause = []
-        filas_bridge_environment = []
-        filas_fact_affected = []
-        filas_bridge_lane = []
-        filas_bridge_km = []
-
-        total_rows_full = len(df_full)
-        start_loop_bridges = time.time()
-
-        for index, row in df_full.iterrows():
-            id_acc = row['ID Accidente']
-            
-            if (index + 1) % 50000 == 0:
-                elapsed = time.time() - start_loop_bridges
-                rows_per_sec = (index + 1) / elapsed
-                callback(f"  ... Procesando fila M:N {index + 1} de {total_rows_full} ({rows_per_sec:.0f} filas/seg)")
-
-            if id_acc in failed_accident_details:
+                # En memoria (carga en línea), copia columnar vigente o el CSV, tipados según su esquema
+                df_ficha0 = ctx.leer_limpio(archivo, ESQUEMAS['ficha0'])
+                relaciones = {tabla: ctx.leer_limpio(info, ESQUEMAS_FICHA0[tabla]) for tabla, info in archivo['tablas'].items()}
+            except Exception as e:
+                callback(f"    ERROR: No se pudo leer o procesar el archivo {archivo['ruta']}. Error: {e}")
                 continue
 
+            archivos_leidos += 1
+            filas_leidas += len(df_ficha0) + sum(len(df_tabla) for df_tabla in relaciones.values())
             try:
-                val_concurrencia = pd.to_numeric(row['Valor Concurrencia'], errors='coerce')
-                if pd.notna(val_concurrencia):
-                    id_resp_result = mapa_response.get((str(row['Concurrencia']), int(val_concurrencia)))
-                    if id_resp_result:
-                        filas_bridge_response.append((id_acc, id_resp_result))
-
-                val_causa = pd.to_numeric(row['Valor Causa Probable'], errors='coerce')
-                if pd.notna(val_causa):
-                    id_cause_result = mapa_probablecause.get((str(row['Causa Probable']), int(val_causa)))
-                    if id_cause_result:
-                        filas_bridge_probablecause.append((id_acc, id_cause_result))
-
-                val_entorno = pd.to_numeric(row['Valor Condiciones del Entorno'], errors='coerce')
-                if pd.notna(val_entorno):
-                    id_env_result = mapa_environment.get((str(row['Condiciones del Entorno']), int(val_entorno)))
-                    if id_env_result:
-                        filas_bridge_environment.append((id_acc, id_env_result))
-
-                id_cons_result = mapa_consequence.get(str(row['Consecuencia']))
-                id_aff_result = mapa_affected.get(str(row['Afectado']))
-                val_afectados = pd.to_numeric(row['Cantidad Afectados'], errors='coerce')
-                
-                if id_cons_result and id_aff_result and pd.notna(val_afectados):
-                    filas_fact_affected.append((id_acc, id_cons_result, id_aff_result, int(val_afectados)))
-            
-            except Exception as e_inner:
-                callback(f"Error procesando fila M:N para {id_acc} (Fila CSV {index}): {e_inner}")
+                # dim_DateTime se extiende (y confirma) antes de abrir la transacción del archivo
+                timestamps = parsear_fechas(df_ficha0['FECHA/HORA'], FORMATOS_FECHA_HORA)
+                clave_datetime = ctx.clave_datetime()
+                asegurar_rango(conn, timestamps.min(), timestamps.max(), callback, clave_datetime)
+                callback(f"dim_DateTime verificada (IDs {clave_datetime.id_min} a {clave_datetime.id_max}).")
+
+                conn.commit()
+                cursor.execute("BEGIN IMMEDIATE")
+                failed_accident_details.update(cargar_archivo(ctx, registro, archivo, df_ficha0, relaciones, mapas, callback))
+                conn.commit() # Commit del archivo: reemplazo, hechos, puentes y libro de cargas
+            except Exception as e:
+                # Sólo se revierte este archivo: la versión anterior (si la había) queda intacta
+                conn.rollback()
+                callback(f"    ERROR: No se pudo cargar el archivo {archivo['ruta']}. Se revirtió su carga. Error: {e}")
+                archivos_fallidos.add(archivo['ruta_relativa'])
+            del df_ficha0, relaciones
 
-        df_lanes_km = df_main_accident[['ID Accidente', 'Km', 'P1', 'P2', 'P3', 'P4', 'P5', 'P6']]
-        
-        for index, row in df_lanes_km.iterrows():
-            id_acc = row['ID Accidente']
-            
-            if id_acc in failed_accident_details:
-                continue
-                
-            for i in range(1, 7):
-                col_name = f'P{i}'
-                if pd.to_numeric(row[col_name], errors='coerce') > 0: 
-                    id_lane_result = mapa_lane.get(i) # Usar mapa
-                    if id_lane_result:
-                        filas_bridge_lane.append((id_acc, id_lane_result))
-                    else:
-                        callback(f"Error: No se encontró idLane para LaneValue = {i}. Saltando.")
-            
-            try:
-                km_val_csv = pd.to_numeric(row['Km'], errors='coerce')
-                if pd.notna(km_val_csv):
-                    km_rounded = round(float(km_val_csv), 3) 
-                    km_result = cursor.execute("SELECT idKm FROM dim_Km WHERE Km = ?", (km_rounded,)).fetchone()
-                    if km_result:
-                        filas_bridge_km.append((id_acc, km_result[0]))
-                    else:
-                        callback(f"Error: No se encontró idKm para Km = {km_rounded} (Accidente {id_acc}).")
-            except Exception as e_km:
-                callback(f"Error procesando puente Km para {id_acc}: {e_km}")
-        
-        print("Insertando datos en tablas puente...")
-        if filas_bridge_response:
-            cursor.executemany("INSERT OR IGNORE INTO bridge_Accident_Response (idAccident, idResponse) VALUES (?, ?)", filas_bridge_response)
-        if filas_bridge_probablecause:
-            cursor.executemany("INSERT OR IGNORE INTO bridge_Accident_ProbableCause (idAccident, idProbableCause) VALUES (?, ?)", filas_bridge_probablecause)
-        if filas_bridge_environment:
-            cursor.executemany("INSERT OR IGNORE INTO bridge_Accident_Environment (idAccident, idEnvironment) VALUES (?, ?)", filas_bridge_environment)
-        if filas_fact_affected:
-            cursor.executemany("INSERT OR IGNORE INTO factAccidentAffected (idAccident, idConsequence, idAffected, AffectedCount) VALUES (?, ?, ?, ?)", filas_fact_affected)
-        if filas_bridge_lane:
-            cursor.executemany("INSERT OR IGNORE INTO bridge_Accident_Lane (idAccident, idLane) VALUES (?, ?)", filas_bridge_lane)
-        if filas_bridge_km:
-            cursor.executemany("INSERT OR IGNORE INTO bridge_Accident_Km (idAccident, idKm) VALUES (?, ?)", filas_bridge_km)
-
-        callback("...tablas puente y de detalle cargadas.")
-
-        conn.commit() 
-        callback("Datos guardados en base de datos.")
+        if not archivos_leidos:
+            callback("Error: Ningún archivo CSV nuevo pudo ser leído correctamente. Saliendo.")
+            return
+        print(f"\nCarga de CSVs completada. {filas_leidas} filas totales leídas de {archivos_leidos} archivos.")
 
-        # --- Lógica de Log ---
-        callback("Registrando archivos procesados en el log (Ficha 0)...")
-        now_str = datetime.now().isoformat()
-        
-        dirty_files = set()
-        if failed_accident_details:
-            for fks, filename in failed_accident_details.values():
-                dirty_files.add(filename)
-        
-        files_to_log = []
-        for f_path in nuevos_archivos_csv:
-            f_name = os.path.basename(f_path)
-            if f_name not in dirty_files:
-                files_to_log.append((f_name, now_str))
-                
-        if files_to_log:
-            cursor.executemany("INSERT OR IGNORE INTO etl_log_ficha0 (FileName, LoadedTimestamp) VALUES (?, ?)", files_to_log)
-            callback(f"{len(files_to_log)} archivos 100% limpios registrados en el log etl_log_ficha0.")
+        # --- Lógica de Log (libro de cargas; en Ficha 0 se cuentan accidentes) ---
+        dirty_files = {filename for _, filename in failed_accident_details.values()}
+        callback(f"{archivos_leidos - len(dirty_files) - len(archivos_fallidos)} archivos 100% limpios registrados en etl_log_cargas.")
         
         if dirty_files:
-            callback(f"ADVERTENCIA: {len(dirty_files)} archivos con errores no se registraron en etl_log_ficha0 y serán reintentados.")
+            callback(f"ADVERTENCIA: {len(dirty_files)} archivos con errores quedaron como 'con_errores' y serán reintentados (reemplazando su carga).")
+
+        if archivos_fallidos:
+            callback(f"ADVERTENCIA: {len(archivos_fallidos)} archivos no se pudieron cargar y se revirtieron; se reintentarán en la próxima carga.")
 
         if failed_accident_details:
             callback("\n--- ⚠️ Reporte Detallado de Errores de Carga (Ficha 0) ---")
@@ -408,8 +372,11 @@ def run(callback):
             for failed_id, (fks_error, filename) in sorted(failed_accident_details.items()):
                 callback(f"\n  - ID Accidente: {failed_id} (Del archivo: {filename})")
                 callback(f"    Valores FK: {fks_error}")
-                
-        conn.commit()
+
+        memoria = texto_memoria_maxima()
+        if memoria:
+            callback(memoria)
+        callback("Datos guardados en base de datos.")
         callback("Proceso ETL para Ficha 0 completado.")
 
     except Exception as e:
@@ -418,6 +385,5 @@ def run(callback):
             conn.rollback()
         raise
     finally:
-        if 'conn' in locals():
-            conn.close()
-            print("Conexión cerrada.")
+        if contexto is None and ctx is not None:
+            ctx.cerrar()
@@ -1,38 +1,161 @@
-import sqlite3
 import time
-from config_manager import obtener_ruta
+from proceso_db.scripts.contexto_carga import ContextoCarga
+
+# totalVehicles = NULL marca un accidente con el conteo pendiente: los cargadores lo dejan así
+# al insertar el accidente (Ficha 0) y al agregar o borrar sus vehículos (Ficha 1), dentro de
+# la misma transacción. Esta etapa cuenta sólo esos accidentes y, con el resumen diario activado,
+# rehace sólo sus días.
+
+# Tabla resumen por día ('resumen_diario_siniestros' en config.json), la lee MLRegressionLineal
+TABLA_RESUMEN_DIARIO = "summary_AccidentDaily"
+
+# === Consultas de Actualización ===
+sql_marcar_todos = "UPDATE factAccident SET totalVehicles = NULL;"
+
+# Un solo agregado agrupado de los accidentes pendientes
+sql_conteo_pendientes = """
+CREATE TEMP TABLE conteo_vehiculos AS
+SELECT A.idAccident, COUNT(V.idVehicleAccident) AS totalVehicles
+FROM factAccident A
+LEFT JOIN factVehicleAccident V ON V.idAccident = A.idAccident
+WHERE A.totalVehicles IS NULL
+GROUP BY A.idAccident;
+"""
 
-# === Consulta de Actualización ===
 sql_update_query = """
 UPDATE factAccident
-SET totalVehicles = (
-    SELECT COUNT(*) 
-    FROM factVehicleAccident
-    WHERE factVehicleAccident.idAccident = factAccident.idAccident
+SET totalVehicles = C.totalVehicles
+FROM conteo_vehiculos C
+WHERE factAccident.idAccident = C.idAccident;
+"""
+
+sql_crear_resumen = f"""
+CREATE TABLE IF NOT EXISTS {TABLA_RESUMEN_DIARIO} (
+    Date TEXT PRIMARY KEY,
+    totalAccidents INTEGER,
+    totalVehicles INTEGER
 );
 """
 
-def run(callback):
+sql_llenar_resumen = f"""
+INSERT INTO {TABLA_RESUMEN_DIARIO} (Date, totalAccidents, totalVehicles)
+SELECT DT.Date, COUNT(*), SUM(FA.totalVehicles)
+FROM factAccident FA
+JOIN dim_DateTime DT ON FA.idDateTime = DT.idDateTime
+GROUP BY DT.Date;
+"""
+
+# Días de los accidentes recién contados (se toman de conteo_vehiculos antes de borrarla)
+sql_dias_pendientes = """
+CREATE TEMP TABLE dias_resumen AS
+SELECT DISTINCT DT.Date
+FROM conteo_vehiculos C
+JOIN factAccident A ON A.idAccident = C.idAccident
+JOIN dim_DateTime DT ON A.idDateTime = DT.idDateTime;
+"""
+
+sql_borrar_dias_resumen = f"""
+DELETE FROM {TABLA_RESUMEN_DIARIO}
+WHERE Date IN (SELECT Date FROM temp.dias_resumen);
+"""
+
+sql_llenar_dias_resumen = f"""
+INSERT INTO {TABLA_RESUMEN_DIARIO} (Date, totalAccidents, totalVehicles)
+SELECT DT.Date, COUNT(*), SUM(FA.totalVehicles)
+FROM factAccident FA
+JOIN dim_DateTime DT ON FA.idDateTime = DT.idDateTime
+WHERE DT.Date IN (SELECT Date FROM temp.dias_resumen)
+GROUP BY DT.Date;
+"""
+
+def existe_resumen_diario(cursor):
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (TABLA_RESUMEN_DIARIO,))
+    return cursor.fetchone() is not None
+
+def descartar_dias_resumen(cursor, ids_carga):
+    """
+    Se llama antes de borrar los accidentes de las cargas indicadas (reemplazo de un archivo de
+    Ficha 0). Sus días salen de summary_AccidentDaily y los accidentes que quedan en esos días
+    pasan a pendientes, para que el resumen incremental los vuelva a sumar.
+    """
+    if not existe_resumen_diario(cursor):
+        return
+    marcadores = ",".join("?" for _ in ids_carga)
+    cursor.execute("DROP TABLE IF EXISTS temp.dias_borrados")
+    cursor.execute(f"""
+        CREATE TEMP TABLE dias_borrados AS
+        SELECT DISTINCT DT.Date FROM factAccident A
+        JOIN dim_DateTime DT ON A.idDateTime = DT.idDateTime
+        WHERE A.idCarga IN ({marcadores})
+    """, ids_carga)
+    cursor.execute(f"DELETE FROM {TABLA_RESUMEN_DIARIO} WHERE Date IN (SELECT Date FROM temp.dias_borrados)")
+    cursor.execute(f"""
+        UPDATE factAccident SET totalVehicles = NULL
+        WHERE totalVehicles IS NOT NULL AND idCarga NOT IN ({marcadores}) AND idDateTime IN (
+            SELECT DT.idDateTime FROM dim_DateTime DT
+            JOIN temp.dias_borrados D ON D.Date = DT.Date)
+    """, ids_carga)
+    cursor.execute("DROP TABLE temp.dias_borrados")
+
+def actualizar_resumen_diario(conn, callback, completo=False):
+    """
+    Actualiza summary_AccidentDaily (accidentes y vehículos por día) a partir de totalVehicles,
+    sin volver a unir factVehicleAccident. Sólo se rehacen los días de temp.dias_resumen
+    (accidentes recién contados); con 'completo' o si la tabla no existía se rehace entera.
+    """
+    cursor = conn.cursor()
+    if completo or not existe_resumen_diario(cursor):
+        cursor.execute(sql_crear_resumen)
+        cursor.execute(f"DELETE FROM {TABLA_RESUMEN_DIARIO}")
+        cursor.execute(sql_llenar_resumen)
+        callback(f"Resumen diario de siniestros rehecho ({cursor.rowcount} días).")
+        return
+
+    cursor.execute(sql_borrar_dias_resumen)
+    cursor.execute(sql_llenar_dias_resumen)
+    callback(f"Resumen diario de siniestros actualizado ({cursor.rowcount} días recalculados).")
+
+def run(callback, contexto=None, recalcular_todo=False):
     """
-    Actualiza el campo totalVehicles en factAccident.
-    Recibe un callback para enviar mensajes de log.
+    Actualiza el campo totalVehicles en factAccident (sólo los accidentes pendientes, salvo
+    'recalcular_todo') y, si está activada la opción, la tabla resumen por día.
+    Recibe un callback para enviar mensajes de log y, opcionalmente, el ContextoCarga compartido
+    del pipeline (si no se entrega se usa uno propio).
     """
     start_time = time.time()
+    ctx = None
     try:
-        ruta_db = obtener_ruta("ruta_database")
+        ctx = contexto or ContextoCarga()
         print("Iniciando script de actualización de conteos...")
-        conn = sqlite3.connect(ruta_db)
+        conn = ctx.conexion()
         cursor = conn.cursor()
-        cursor.execute("PRAGMA foreign_keys = ON;")
+
+        if recalcular_todo:
+            cursor.execute(sql_marcar_todos)
 
         callback("Ejecutando actualización de 'totalVehicles' en factAccident...")
+        cursor.execute("DROP TABLE IF EXISTS temp.conteo_vehiculos")
+        cursor.execute(sql_conteo_pendientes)
         cursor.execute(sql_update_query)
-        
+
         # Obtener el número de filas actualizadas
         rows_updated = cursor.rowcount
-        
+
+        resumen_diario = ctx.opcion('resumen_diario_siniestros', False)
+        if resumen_diario:
+            cursor.execute("DROP TABLE IF EXISTS temp.dias_resumen")
+            cursor.execute(sql_dias_pendientes)
+        cursor.execute("DROP TABLE temp.conteo_vehiculos")
+
+        if resumen_diario:
+            actualizar_resumen_diario(conn, callback, completo=recalcular_todo)
+            cursor.execute("DROP TABLE temp.dias_resumen")
+        else:
+            # Sin la opción no se mantiene: se borra para que nadie lea un resumen desactualizado
+            cursor.execute(f"DROP TABLE IF EXISTS {TABLA_RESUMEN_DIARIO}")
+
         conn.commit()
-        
+
         end_time = time.time()
         callback(f"\n--- ¡Éxito! ---")
         callback(f"Se actualizaron {rows_updated} accidentes.")
@@ -45,6 +168,5 @@ def run(callback):
             conn.rollback()
         raise
     finally:
-        if 'conn' in locals():
-            conn.close()
-            print("Conexión cerrada.")
+        if contexto is None and ctx is not None:
+            ctx.cerrar()
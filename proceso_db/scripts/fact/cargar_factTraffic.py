@@ -1,18 +1,23 @@
-import sqlite3
 import pandas as pd
+import numpy as np
 import os
 import glob
-from datetime import datetime
 import time
-from config_manager import obtener_ruta
+from proceso_db.scripts.contexto_carga import ContextoCarga
+from proceso_db.scripts.registro_cargas import RegistroCargas
+from proceso_db.scripts.crear_tablas import preparar_indices
+from proceso_db.scripts.esquemas_csv import ESQUEMAS
+from proceso_db.scripts.clave_datetime import construir_timestamp
+from proceso_db.scripts.dim.cargar_dimDateTime import asegurar_rango
+from utils.memoria import texto_memoria_maxima
 
 # --- INICIO DE INTEGRACIÓN ---
 
 # === 1. Definir rutas ===
-def get_paths():
+def get_paths(ctx):
     try:
-        ruta_db = obtener_ruta("ruta_database")
-        ruta_csv_limpio = obtener_ruta("ruta_csv_limpio")
+        ruta_db = ctx.ruta("ruta_database")
+        ruta_csv_limpio = ctx.ruta("ruta_csv_limpio")
         ruta_base_csv_trafico = os.path.join(ruta_csv_limpio, "Tráfico Mensual")
         
         return ruta_db, ruta_base_csv_trafico
@@ -20,214 +25,204 @@ def get_paths():
         raise RuntimeError(f"Error al cargar rutas desde config_manager: {e}")
 
 # === 2. Funciones Helper ===
-def safe_int_convert(value, default=None):
-    val_num = pd.to_numeric(value, errors='coerce')
-    if pd.isna(val_num):
-        return default
-    return int(val_num)
+COLUMNAS_FK = ['idDateTime', 'idPlaza', 'idDirection', 'idCategory']
+
+# Filas por executemany
+TAMANO_LOTE_INSERCION = 50000
+
+def normalizar(serie):
+    """ Búsqueda robusta (minúsculas, sin espacios), igual que en mapa_normalizado """
+    return serie.astype(str).str.strip().str.lower()
+
+def mapear(serie, mapa):
+    """
+    IDs de la dimensión para cada fila según el nombre normalizado (NaN si no está).
+    En una columna categórica se normaliza y busca cada valor distinto una sola vez.
+    """
+    if not isinstance(serie.dtype, pd.CategoricalDtype):
+        return normalizar(serie).map(mapa)
+    ids_categorias = normalizar(pd.Series(serie.cat.categories, dtype=object)).map(mapa).to_numpy(dtype='float64')
+    # Código -1 = vacío: se busca como 'nan', igual que con el texto
+    ids_categorias = np.append(ids_categorias, mapa.get('nan', np.nan))
+    return pd.Series(ids_categorias[serie.cat.codes.to_numpy()], index=serie.index)
+
+def resolver_llaves(conn, df_trafico, mapas, clave_datetime, callback):
+    """
+    Resuelve las FKs de una parte de un archivo de tráfico (vectorizado).
+    dim_DateTime se extiende si hace falta dentro de la transacción abierta del archivo.
+    Devuelve (df_cargable, df_rechazadas): las filas válidas con las columnas de factTraffic
+    como enteros y las filas con alguna FK inválida (columnas del CSV + FKs, para el reporte).
+    """
+    timestamps = construir_timestamp(df_trafico['Fecha'], df_trafico['Hora'])
+    asegurar_rango(conn, timestamps.min(), timestamps.max(), callback, clave_datetime, confirmar=False)
+
+    default_plaza_id = mapas['plaza'].get("desconocido")
+    default_direction_id = mapas['direccion'].get("sin dato")
+
+    df_trafico['idPlaza'] = mapear(df_trafico['Plaza'], mapas['plaza'])
+    if default_plaza_id is not None:
+        df_trafico['idPlaza'] = df_trafico['idPlaza'].fillna(default_plaza_id)
+
+    df_trafico['idDirection'] = mapear(df_trafico['Direccion'], mapas['direccion'])
+    if default_direction_id is not None:
+        df_trafico['idDirection'] = df_trafico['idDirection'].fillna(default_direction_id)
+
+    # Categoría vacía o NaN queda sin ID (no tiene default)
+    df_trafico['idCategory'] = mapear(df_trafico['Categoria'], mapas['categoria'])
+
+    # idDateTime = minutos desde el inicio de dim_DateTime + 1 (NA si queda fuera de rango)
+    df_trafico['idDateTime'] = clave_datetime.calcular_ids(timestamps)
+
+    # Hecho
+    df_trafico['trafficVolume'] = pd.to_numeric(df_trafico['Contar'], errors='coerce').fillna(0)
+
+    # --- Separar filas con FK inválidas en una sola pasada ---
+    mask_validas = df_trafico[COLUMNAS_FK].notna().all(axis=1)
+    df_cargable = df_trafico.loc[mask_validas, COLUMNAS_FK + ['trafficVolume']].astype('int64')
+    return df_cargable, df_trafico.loc[~mask_validas]
+
+def insertar_lotes(cursor, df_cargable):
+    """ Inserta las filas (columnas de factTraffic + idCarga) de a TAMANO_LOTE_INSERCION. Devuelve cuántas. """
+    for inicio in range(0, len(df_cargable), TAMANO_LOTE_INSERCION):
+        lote = df_cargable.iloc[inicio:inicio + TAMANO_LOTE_INSERCION].to_numpy().tolist()
+        cursor.executemany("""
+            INSERT INTO factTraffic (
+                idDateTime, idPlaza, idDirection, idCategory, trafficVolume, idCarga
+            ) VALUES (?, ?, ?, ?, ?, ?)
+        """, lote)
+    return len(df_cargable)
 
 # === 3. Proceso ETL Principal ===
 
-def run(callback):
+def run(callback, contexto=None, archivos_csv=None):
     """
     Carga los hechos de tráfico mensual en factTraffic.
-    Recibe un callback para enviar mensajes de log.
+    Recibe un callback para enviar mensajes de log y, opcionalmente, el ContextoCarga compartido
+    del pipeline (si no se entrega se usa uno propio).
+    'archivos_csv' limita la carga a esos CSV (carga en línea); por defecto se buscan todos los
+    de la carpeta.
+    Los archivos se leen y cargan de a uno ('filas_por_lote_carga' de config.json acota además
+    las filas en memoria dentro de cada archivo) y cada uno se confirma en su propia transacción.
     """
+    ctx = None
     try:
-        ruta_db, ruta_base_csv_trafico = get_paths()
-        conn = sqlite3.connect(ruta_db)
+        ctx = contexto or ContextoCarga()
+        ruta_db, ruta_base_csv_trafico = get_paths(ctx)
+        conn = ctx.conexion()
         cursor = conn.cursor()
-        cursor.execute("PRAGMA foreign_keys = ON;")
 
         callback("--- Cargando Hechos: factTraffic ---")
 
-        print("Consultando log de archivos ya procesados (Tráfico)...")
-        cursor.execute("SELECT FileName FROM etl_log_trafico")
-        processed_files = set(row[0] for row in cursor.fetchall())
-        callback(f"Se encontraron {len(processed_files)} archivos en el log.")
+        if archivos_csv is None:
+            print(f"Buscando archivos CSV en: {ruta_base_csv_trafico} y subcarpetas...")
+            patron_busqueda = os.path.join(ruta_base_csv_trafico, '**', '*.csv')
+            archivos_csv = glob.glob(patron_busqueda, recursive=True)
 
-        print(f"Buscando archivos CSV en: {ruta_base_csv_trafico} y subcarpetas...")
-        patron_busqueda = os.path.join(ruta_base_csv_trafico, '**', '*.csv')
-        todos_los_archivos_csv = glob.glob(patron_busqueda, recursive=True)
-        
-        nuevos_archivos_csv = []
-        for f in todos_los_archivos_csv:
-            file_name = os.path.basename(f)
-            if file_name not in processed_files:
-                nuevos_archivos_csv.append(f)
-
-        if not nuevos_archivos_csv:
-            callback("No se encontraron archivos CSV nuevos para Tráfico. El proceso ha finalizado.")
-            conn.close()
+        # Libro de cargas: sólo archivos nuevos, modificados o que quedaron con errores
+        registro = RegistroCargas(ctx, 'trafico')
+        archivos_a_cargar = registro.planificar(archivos_csv, callback)
+
+        if not archivos_a_cargar:
+            callback("No se encontraron archivos CSV nuevos o modificados para Tráfico. El proceso ha finalizado.")
             return
         
-        callback(f"Se encontraron {len(nuevos_archivos_csv)} archivos CSV NUEVOS. Iniciando carga...")
+        callback(f"Se encontraron {len(archivos_a_cargar)} archivos CSV NUEVOS o modificados. Iniciando carga...")
 
-        lista_dataframes = []
-        for archivo_csv in nuevos_archivos_csv:
-            callback(f"  Leyendo: {os.path.basename(archivo_csv)}")
-            try:
-                df_temp = pd.read_csv(
-                    archivo_csv, 
-                    encoding="utf-8", 
-                    dtype=str
-                )
-                df_temp['__SourceFileName'] = os.path.basename(archivo_csv)
-                lista_dataframes.append(df_temp)
-            except Exception as e:
-                callback(f"    ERROR: No se pudo leer o procesar el archivo {archivo_csv}. Error: {e}")
+        # Índices de la tabla de hechos: se eliminan sólo si la carga es masiva
+        preparar_indices(ctx, registro, archivos_a_cargar, callback)
 
-        if not lista_dataframes:
-            callback("Error: Ningún archivo CSV nuevo de Tráfico pudo ser leído. Saliendo.")
-            conn.close()
-            return
-            
-        df_trafico_full = pd.concat(lista_dataframes, ignore_index=True)
-        callback(f"\nCarga de CSVs de Tráfico completada. {len(df_trafico_full)} filas totales leídas.")
-
-        # --- Preparar Mapas de Dimensiones (Lookups) ---
+        # --- Preparar Mapas de Dimensiones (Lookups, en caché del contexto) ---
         print("Creando mapas de dimensiones desde la BD...")
-        
-        def crear_mapa(tabla, campo_nombre, campo_id):
-            df_mapa = pd.read_sql(f"SELECT {campo_id}, {campo_nombre} FROM {tabla}", conn)
-            # Convertir nombres a minúsculas y sin espacios para una búsqueda robusta
-            return {str(k).strip().lower(): v for k, v in zip(df_mapa[campo_nombre], df_mapa[campo_id])}
-
-        mapa_plaza = crear_mapa("dim_Plaza", "PlazaName", "idPlaza")
-        mapa_direccion = crear_mapa("dim_Direction", "DirectionName", "idDirection")
-        mapa_categoria = crear_mapa("dim_Category", "CategoryName", "idCategory")
-        
-        default_plaza_id = mapa_plaza.get("desconocido")
-        default_direction_id = mapa_direccion.get("sin dato")
-
-        # === Carga de mapa de DateTime eficiente ===
-        callback("Creando mapa de dim_DateTime (eficiente)...")
-        df_trafico_full['Fecha_dt'] = pd.to_datetime(df_trafico_full['Fecha'], errors='coerce')
-        df_trafico_full['Hora_int'] = pd.to_numeric(df_trafico_full['Hora'], errors='coerce').fillna(0).astype(int)
-        
-        # --- ¡CAMBIO CLAVE! ---
-        # Crear la clave de búsqueda en el formato correcto 'YYYY-MM-DD HH:MM:SS'
-        df_trafico_full['LookupKey'] = df_trafico_full.apply(
-            lambda r: f"{r['Fecha_dt'].strftime('%Y-%m-%d')} {r['Hora_int']:02d}:00:00" if pd.notna(r['Fecha_dt']) else None,
-            axis=1
-        )
-        claves_needed = tuple(df_trafico_full['LookupKey'].dropna().unique())
-        
-        mapa_datetime = {}
-        if claves_needed: # Solo consultar si hay claves que buscar
-            callback(f"Buscando {len(claves_needed)} claves de fecha únicas en la BD...")
-            df_fecha = pd.read_sql(f"""
-                SELECT idDateTime, DateTime 
-                FROM dim_DateTime 
-                WHERE DateTime IN {claves_needed}
-            """, conn)
-            mapa_datetime = dict(zip(df_fecha['DateTime'], df_fecha['idDateTime']))
-            del df_fecha
+        # Nombres en minúsculas y sin espacios para una búsqueda robusta
+        mapas = {
+            'plaza': ctx.mapa_normalizado("dim_Plaza", "PlazaName", "idPlaza"),
+            'direccion': ctx.mapa_normalizado("dim_Direction", "DirectionName", "idDirection"),
+            'categoria': ctx.mapa_normalizado("dim_Category", "CategoryName", "idCategory"),
+        }
+        clave_datetime = ctx.clave_datetime()
         callback("Mapas creados.")
 
-        # --- Procesar y Cargar Fila por Fila ---
-        failed_rows_details = [] 
+        # --- Un archivo a la vez (de a 'filas_por_lote_carga' filas), cada uno en su transacción ---
+        filas_por_lote = ctx.filas_por_lote()
+        total_leidas = 0
+        total_insertadas = 0
+        total_rechazadas = 0
+        muestra_rechazadas = [] # Primeras filas rechazadas (para el reporte), con su archivo
         dirty_files = set()
-        total_rows = len(df_trafico_full)
-        
-        callback(f"Procesando {total_rows} filas de tráfico...")
+        archivos_cargados = 0
         start_loop = time.time()
 
-        # --- INICIAR TRANSACCIÓN ---
-        # Mover el cursor.execute("BEGIN...") fuera del bucle mejora drásticamente la velocidad.
-        # Pero para feedback, lo dejaremos dentro con un contador.
-        # Para la carga masiva real, considera usar df_cargable.to_sql como hizo tu compañero.
-        
-        filas_procesadas = 0
-        filas_insertadas = 0
-
-        for index, row in df_trafico_full.iterrows():
-            source_file = row['__SourceFileName']
+        for archivo in archivos_a_cargar:
+            callback(f"  Leyendo: {archivo['nombre']}")
+            conn.commit()
+            cursor.execute("BEGIN IMMEDIATE")
             try:
-                # 1. Obtener IDs de Dimensiones
-                
-                # Búsqueda robusta (minúsculas, sin espacios)
-                nombre_plaza_csv = row.get('Plaza')
-                id_plaza = mapa_plaza.get(str(nombre_plaza_csv).strip().lower(), default_plaza_id)
-                
-                nombre_direccion_csv = row.get('Direccion')
-                id_direction = mapa_direccion.get(str(nombre_direccion_csv).strip().lower(), default_direction_id)
-                
-                cat_val = row.get('Categoria')
-                if pd.isna(cat_val) or not cat_val:
-                    id_category = None
-                else:
-                    id_category = mapa_categoria.get(str(cat_val).strip().lower())
-
-                # idDateTime (clave pre-calculada)
-                lookup_key = row['LookupKey']
-                id_datetime = mapa_datetime.get(lookup_key)
-
-                # 2. Obtener Hecho
-                traffic_volume = safe_int_convert(row['Contar'], default=0)
-
-                # 3. Validar Llaves Foráneas
-                fks = {
-                    'idDateTime': id_datetime, 'idPlaza': id_plaza, 
-                    'idDirection': id_direction, 'idCategory': id_category
-                }
-                if None in fks.values():
-                    # Corregir los nombres en el CSV o en los mapas de cargar_dimensiones.py
-                    raise sqlite3.IntegrityError(f"FOREIGN KEY no encontrada. CSV: Plaza='{nombre_plaza_csv}', Dir='{nombre_direccion_csv}', Cat='{row.get('Categoria')}'. Valores: {fks}")
-
-                # 4. Insertar
-                cursor.execute("""
-                    INSERT INTO factTraffic (
-                        idDateTime, idPlaza, idDirection, idCategory, trafficVolume
-                    ) VALUES (?, ?, ?, ?, ?)
-                """, (
-                    id_datetime, id_plaza, id_direction, id_category, traffic_volume
-                ))
-                filas_insertadas += 1
-
+                # Registro de la carga + borrado de la versión que reemplaza, en la transacción del archivo
+                id_carga = registro.iniciar(archivo, callback)
+                inicio_archivo = time.time()
+                leidas = rechazadas = 0
+                muestra_archivo = []
+
+                # En memoria (carga en línea), copia columnar vigente o el CSV, tipados según su esquema
+                for df_parte in ctx.leer_limpio_por_partes(archivo, ESQUEMAS['trafico'], filas_por_lote):
+                    df_cargable, df_rechazadas = resolver_llaves(conn, df_parte, mapas, clave_datetime, callback)
+                    leidas += len(df_parte)
+                    rechazadas += len(df_rechazadas)
+                    for _, row in df_rechazadas.head(10 - len(muestra_rechazadas) - len(muestra_archivo)).iterrows():
+                        muestra_archivo.append((archivo['ruta_relativa'], row))
+                    del df_parte, df_rechazadas
+
+                    df_cargable['idCarga'] = id_carga
+                    total_insertadas += insertar_lotes(cursor, df_cargable)
+                    del df_cargable
+
+                    # === Log de Progreso ===
+                    elapsed = time.time() - start_loop
+                    rows_per_sec = total_insertadas / elapsed if elapsed > 0 else 0
+                    callback(f"  ... Insertadas {total_insertadas} ({rows_per_sec:.0f} filas/seg). Errores: {total_rechazadas + rechazadas}")
+
+                registro.finalizar(id_carga, leidas, leidas - rechazadas, rechazadas, time.time() - inicio_archivo)
+                conn.commit() # Hechos y libro de cargas del archivo en la misma transacción
             except Exception as e:
-                error_msg = f"Error: {e}"
-                failed_rows_details.append((row.to_dict(), error_msg, source_file))
-                dirty_files.add(source_file)
-            
-            filas_procesadas += 1
-            # === Log de Progreso Mejorado ===
-            if filas_procesadas % 50000 == 0:
-                elapsed = time.time() - start_loop
-                rows_per_sec = filas_procesadas / elapsed
-                callback(f"  ... Procesadas {filas_procesadas} de {total_rows} ({rows_per_sec:.0f} filas/seg). Insertadas: {filas_insertadas}. Errores: {len(failed_rows_details)}")
-                # Hacer commit en lotes para no perder todo si falla
-                conn.commit()
-                cursor.execute("BEGIN IMMEDIATE") # Iniciar nuevo lote
-
-        # --- Commit final y Registrar Logs ---
-        conn.commit() # Asegurarse de guardar el último lote
-        callback("...procesamiento de filas de Tráfico finalizado.")
-
-        callback("Registrando archivos procesados en el log (Tráfico)...")
-        now_str = datetime.now().isoformat()
-        
-        files_to_log = []
-        for f_path in nuevos_archivos_csv:
-            f_name = os.path.basename(f_path)
-            if f_name not in dirty_files:
-                files_to_log.append((f_name, now_str))
-                
-        if files_to_log:
-            cursor.executemany("INSERT OR IGNORE INTO etl_log_trafico (FileName, LoadedTimestamp) VALUES (?, ?)", files_to_log)
-            callback(f"{len(files_to_log)} archivos 100% limpios registrados en el log etl_log_trafico.")
+                conn.rollback()
+                clave_datetime.verificar(conn) # Por si se revirtió una extensión de dim_DateTime
+                callback(f"    ERROR: No se pudo leer o procesar el archivo {archivo['ruta']}. Error: {e}")
+                continue
+
+            archivos_cargados += 1
+            total_leidas += leidas
+            total_rechazadas += rechazadas
+            muestra_rechazadas.extend(muestra_archivo)
+            if rechazadas:
+                dirty_files.add(archivo['ruta_relativa'])
+
+        if not archivos_cargados:
+            callback("Error: Ningún archivo CSV nuevo de Tráfico pudo ser leído. Saliendo.")
+            return
+
+        # --- Resumen y Logs ---
+        elapsed = time.time() - start_loop
+        rows_per_sec = total_leidas / elapsed if elapsed > 0 else 0
+        callback(f"\nCarga de CSVs de Tráfico completada. {total_leidas} filas totales leídas.")
+        callback(f"...procesamiento de filas de Tráfico finalizado ({rows_per_sec:.0f} filas/seg).")
+
+        # Los archivos cargados ya quedaron en etl_log_cargas dentro de su propia transacción
+        callback(f"{archivos_cargados - len(dirty_files)} archivos 100% limpios registrados en etl_log_cargas.")
         
         if dirty_files:
-            callback(f"ADVERTENCIA: {len(dirty_files)} archivos con errores no se registraron en etl_log_trafico y serán reintentados.")
+            callback(f"ADVERTENCIA: {len(dirty_files)} archivos con errores quedaron como 'con_errores' y serán reintentados (reemplazando su carga).")
 
-        if failed_rows_details:
+        if total_rechazadas:
             callback("\n--- ⚠️ Reporte Detallado de Errores de Carga (Tráfico) ---")
-            callback(f"Se omitieron {len(failed_rows_details)} filas por errores de FK o datos.")
-            for i, (fila, error, archivo) in enumerate(failed_rows_details[:10]):
-                callback(f"\n  - Archivo: {archivo}")
-                callback(f"    Error: {error}")
-                
-        conn.commit() # Commit final para los logs
+            callback(f"Se omitieron {total_rechazadas} filas por errores de FK o datos.")
+            for nombre_archivo, row in muestra_rechazadas:
+                fks = {k: (None if pd.isna(row[k]) else int(row[k])) for k in COLUMNAS_FK}
+                callback(f"\n  - Archivo: {nombre_archivo}")
+                callback(f"    Error: FOREIGN KEY no encontrada. CSV: Plaza='{row['Plaza']}', Dir='{row['Direccion']}', Cat='{row['Categoria']}'. Valores: {fks}")
+
+        memoria = texto_memoria_maxima()
+        if memoria:
+            callback(memoria)
         callback("Proceso ETL para Tráfico completado.")
 
     except Exception as e:
@@ -236,6 +231,5 @@ def run(callback):
             conn.rollback()
         raise 
     finally:
-        if 'conn' in locals():
-            conn.close()
-            print("Conexión cerrada.")
+        if contexto is None and ctx is not None:
+            ctx.cerrar()
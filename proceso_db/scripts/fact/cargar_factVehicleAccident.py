@@ -1,17 +1,20 @@
-import sqlite3
 import pandas as pd
+import numpy as np
 import os
 import glob
-from datetime import datetime
-from config_manager import obtener_ruta
+import time
+from proceso_db.scripts.contexto_carga import ContextoCarga
+from proceso_db.scripts.registro_cargas import RegistroCargas
+from proceso_db.scripts.crear_tablas import preparar_indices
+from proceso_db.scripts.esquemas_csv import ESQUEMAS
 
 # --- INICIO DE INTEGRACIÓN ---
 
 # === 1. Definir Rutas ===
-def get_paths():
+def get_paths(ctx):
     try:
-        ruta_db = obtener_ruta("ruta_database")
-        ruta_csv_limpio = obtener_ruta("ruta_csv_limpio")
+        ruta_db = ctx.ruta("ruta_database")
+        ruta_csv_limpio = ctx.ruta("ruta_csv_limpio")
         ruta_base_csv_ficha1 = os.path.join(ruta_csv_limpio, "Siniestralidad", "Ficha 1")
 
         return ruta_db, ruta_base_csv_ficha1
@@ -19,85 +22,178 @@ def get_paths():
         raise RuntimeError(f"Error al cargar rutas desde config_manager: {e}")
 
 # === 2. Funciones Helper ===
-def safe_int_convert(value, default=0):
-    """ Convierte a int de forma segura, usando un default (ej. 0 para 'Sin Dato') """
-    val_num = pd.to_numeric(value, errors='coerce')
-    if pd.isna(val_num):
-        return default
-    return int(val_num)
-
-def crear_mapa_ids(conn, tabla, id_col, callback):
-    """ Carga un set de IDs válidos desde una tabla de dimensión. """
-    try:
-        return set(pd.read_sql(f"SELECT {id_col} FROM {tabla}", conn)[id_col])
-    except Exception as e:
-        callback(f"Error al cargar mapa de IDs para {tabla}: {e}")
-        return {0} # Retorna un set con el ID 'Sin dato' como mínimo
+# Tablas puente de factVehicleAccident: (tabla, columna FK, columna del DataFrame validado)
+PUENTES_VEHICULO = [
+    ("bridge_VehicleAccident_ServiceType", "idServiceType", "val_service"),
+    ("bridge_VehicleAccident_VehicleTypeValue", "idVehicleTypeValue", "val_veh_type"),
+    ("bridge_VehicleAccident_ManeuverType", "idManeuverType", "val_maneuver"),
+    ("bridge_VehicleAccident_ConsequenceType", "idConsequenceType", "val_consequence"),
+]
+
+# Máximo de parámetros por consulta (límite histórico de SQLite: 999)
+TAMANO_LOTE_SQL = 900
+
+def safe_int_convert(serie, default=0):
+    """ Convierte una columna a enteros de forma segura, usando un default (ej. 0 para 'Sin Dato') """
+    valores = np.trunc(pd.to_numeric(serie, errors='coerce')) # int() trunca hacia cero
+    if default is None:
+        return valores.astype('Int64') # Conserva los vacíos como <NA>
+    return valores.fillna(default).astype('int64')
+
+def texto_limpio(serie):
+    """ Quita espacios y deja como None los valores vacíos """
+    serie = serie.str.strip()
+    return serie.where(serie.notna() & (serie != ''), None)
+
+def validar_archivo(df, mapas):
+    """
+    Valida todas las filas de un archivo de Ficha 1 de una sola vez.
+    Devuelve (df_valido, errores): df_valido con las columnas de FK ya convertidas y
+    errores una Serie con el primer error de cada fila (None si la fila es válida),
+    en el mismo orden de validación que la carga fila a fila.
+    """
+    (map_ids_accidents, map_ids_service, map_ids_vehicletypevalue,
+     map_ids_maneuver, map_ids_consequence, map_lane) = mapas
+
+    # --- A. Obtener datos de las filas ---
+    datos = pd.DataFrame(index=df.index)
+    datos['id_acc'] = texto_limpio(df['ID Accidente'])
+    datos['registration'] = texto_limpio(df['Patente'])
+    datos['brand'] = df['Marca'].str.strip().fillna("Sin Marca")
+
+    # --- B. Obtener valores de FK (con default 0 = 'Sin dato') ---
+    columna = lambda nombre: df[nombre] if nombre in df.columns else pd.Series(None, index=df.index, dtype=object)
+    datos['val_service'] = safe_int_convert(columna("Servicio"), 0)
+    datos['val_veh_type'] = safe_int_convert(columna("Tipo Vehículo"), 0)
+    datos['val_maneuver'] = safe_int_convert(columna("Maniobra"), 0)
+    datos['val_consequence'] = safe_int_convert(columna("Consecuencia"), 0)
+    val_lane = safe_int_convert(columna("Pista/Vía"), None) # <NA> si está vacío
+    datos['id_lane'] = val_lane.map(map_lane, na_action='ignore')
 
-def crear_mapa_simple(conn, tabla, id_col, col1):
-    """ Carga un mapa clave->valor (ej. LaneValue -> idLane) """
-    df_mapa = pd.read_sql(f"SELECT {id_col}, {col1} FROM {tabla}", conn)
-    if pd.api.types.is_numeric_dtype(df_mapa[col1]):
-         return {int(k): v for k, v in zip(df_mapa[col1], df_mapa[id_col])}
-    return {str(k): v for k, v in zip(df_mapa[col1], df_mapa[id_col])}
+    # --- C. Validar todos los FKs (se conserva el primer error de cada fila) ---
+    chequeos = [
+        (datos['id_acc'].isna() | datos['registration'].isna(),
+         lambda f: f"Campo obligatorio vacío: ID Accidente ({f.id_acc}) o Patente ({f.registration})"),
+        (~datos['id_acc'].isin(map_ids_accidents),
+         lambda f: f"idAccident '{f.id_acc}' no existe en factAccident"),
+        (~datos['val_service'].isin(map_ids_service),
+         lambda f: f"idServiceType '{f.val_service}' no existe en dim_ServiceType"),
+        (~datos['val_veh_type'].isin(map_ids_vehicletypevalue),
+         lambda f: f"idVehicleTypeValue '{f.val_veh_type}' no existe en dim_VehicleTypeValue"),
+        (~datos['val_maneuver'].isin(map_ids_maneuver),
+         lambda f: f"idManeuverType '{f.val_maneuver}' no existe en dim_ManeuverType"),
+        (~datos['val_consequence'].isin(map_ids_consequence),
+         lambda f: f"idConsequenceType '{f.val_consequence}' no existe en dim_ConsequenceType"),
+        (val_lane.notna() & datos['id_lane'].isna(),
+         lambda f: f"LaneValue '{f.val_lane}' no existe en dim_Lane"),
+    ]
+    errores = pd.Series(None, index=df.index, dtype=object)
+    con_error = pd.Series(False, index=df.index)
+    for mascara, mensaje in chequeos:
+        nuevas = mascara.fillna(False).astype(bool) & ~con_error
+        if nuevas.any():
+            filas = datos.loc[nuevas].assign(val_lane=val_lane[nuevas])
+            errores[nuevas] = [mensaje(f) for f in filas.itertuples()]
+            con_error |= nuevas
+    return datos, errores
+
+def upsert_vehiculos(cursor, datos, map_vehicle_desc):
+    """
+    Inserta en lote las patentes que no están en el mapa y lee sus IDs de vuelta.
+    Con patentes repetidas en el archivo se conserva la marca de la primera aparición.
+    Devuelve un mapa Registration -> idVehicleDescription con las patentes nuevas
+    (se incorporan a map_vehicle_desc sólo después del commit del archivo).
+    """
+    nuevas = datos.loc[~datos['registration'].isin(map_vehicle_desc.keys()), ['registration', 'brand']]
+    nuevas = nuevas.drop_duplicates('registration')
+    if nuevas.empty:
+        return {}
+
+    cursor.executemany("INSERT OR IGNORE INTO dim_VehicleDescription (Registration, Brand) VALUES (?, ?)",
+                       nuevas.itertuples(index=False, name=None))
+
+    # Lectura de los IDs (incluye patentes que ya existían en la base y no estaban en el mapa)
+    patentes = nuevas['registration'].tolist()
+    ids_nuevos = {}
+    for i in range(0, len(patentes), TAMANO_LOTE_SQL):
+        lote = patentes[i:i + TAMANO_LOTE_SQL]
+        marcadores = ",".join("?" for _ in lote)
+        cursor.execute(f"SELECT Registration, idVehicleDescription FROM dim_VehicleDescription WHERE Registration IN ({marcadores})", lote)
+        ids_nuevos.update(cursor.fetchall())
+    return ids_nuevos
+
+def siguiente_id_vehicle_accident(cursor):
+    """
+    Primer idVehicleAccident libre. Con AUTOINCREMENT no se reutilizan IDs de filas borradas,
+    por eso se considera también sqlite_sequence. Debe llamarse con la transacción abierta.
+    """
+    cursor.execute("""
+        SELECT MAX(
+            COALESCE((SELECT seq FROM sqlite_sequence WHERE name = 'factVehicleAccident'), 0),
+            COALESCE((SELECT MAX(idVehicleAccident) FROM factVehicleAccident), 0)
+        )
+    """)
+    return cursor.fetchone()[0] + 1
 
 # === 3. Proceso ETL Principal ===
 
-def run(callback):
+def run(callback, contexto=None, archivos_csv=None):
     """
     Carga los hechos de Ficha 1 en factVehicleAccident.
-    Recibe un callback para enviar mensajes de log.
+    Recibe un callback para enviar mensajes de log y, opcionalmente, el ContextoCarga compartido
+    del pipeline (si no se entrega se usa uno propio).
+    'archivos_csv' limita la carga a esos CSV (carga en línea); por defecto se buscan todos los
+    de la carpeta.
     """
+    ctx = None
     try:
-        ruta_db, ruta_base_csv_ficha1 = get_paths()
-        conn = sqlite3.connect(ruta_db)
+        ctx = contexto or ContextoCarga()
+        ruta_db, ruta_base_csv_ficha1 = get_paths(ctx)
+        conn = ctx.conexion()
         cursor = conn.cursor()
-        cursor.execute("PRAGMA foreign_keys = ON;")
         
         callback("--- Cargando Ficha 1: factVehicleAccident ---")
 
-        # --- 1. Cargar Logs de Archivos Procesados ---
-        print("Consultando log de archivos ya procesados (Ficha 1)...")
-        cursor.execute("SELECT FileName FROM etl_log_ficha1_vehiculos")
-        processed_files = set(row[0] for row in cursor.fetchall())
-        callback(f"Se encontraron {len(processed_files)} archivos en el log.")
+        # --- 1. Buscar CSVs y decidir cuáles cargar (libro de cargas) ---
+        if archivos_csv is None:
+            print(f"Buscando archivos CSV en: {ruta_base_csv_ficha1} y subcarpetas...")
+            patron_busqueda = os.path.join(ruta_base_csv_ficha1, '**', '*.csv')
+            archivos_csv = glob.glob(patron_busqueda, recursive=True)
 
-        # --- 2. Leer todos los CSVs nuevos ---
-        print(f"Buscando archivos CSV en: {ruta_base_csv_ficha1} y subcarpetas...")
-        patron_busqueda = os.path.join(ruta_base_csv_ficha1, '**', '*.csv')
-        todos_los_archivos_csv = glob.glob(patron_busqueda, recursive=True)
-        
-        nuevos_archivos_csv = []
-        for f in todos_los_archivos_csv:
-            file_name = os.path.basename(f)
-            if file_name not in processed_files:
-                nuevos_archivos_csv.append(f)
-
-        if not nuevos_archivos_csv:
-            callback("No se encontraron archivos CSV nuevos para Ficha 1. El proceso ha finalizado.")
-            conn.close()
+        # Nuevos, modificados, con errores o invalidados por el reemplazo de accidentes de Ficha 0
+        registro = RegistroCargas(ctx, 'ficha1')
+        archivos_a_cargar = registro.planificar(archivos_csv, callback)
+
+        if not archivos_a_cargar:
+            callback("No se encontraron archivos CSV nuevos o modificados para Ficha 1. El proceso ha finalizado.")
             return
         
-        callback(f"Se encontraron {len(nuevos_archivos_csv)} archivos CSV NUEVOS. Iniciando carga...")
+        callback(f"Se encontraron {len(archivos_a_cargar)} archivos CSV NUEVOS o modificados. Iniciando carga...")
+
+        # Índices de la tabla de hechos: se eliminan sólo si la carga es masiva
+        preparar_indices(ctx, registro, archivos_a_cargar, callback)
 
         # --- 3. Cargar todos los mapas de validación de FKs ---
         print("Creando mapas de validación de FKs (Ficha 1)...")
         
-        # FKs de Hechos
-        map_ids_accidents = crear_mapa_ids(conn, "factAccident", "idAccident", callback)
+        # FKs de Hechos (sin caché: Ficha 0 los acaba de cargar)
+        map_ids_accidents = ctx.mapa_ids("factAccident", "idAccident", callback, en_cache=False)
         
-        # FKs de Dimensiones (Puentes)
-        map_ids_service = crear_mapa_ids(conn, "dim_ServiceType", "idServiceType", callback)
-        map_ids_vehicletypevalue = crear_mapa_ids(conn, "dim_VehicleTypeValue", "idVehicleTypeValue", callback)
-        map_ids_maneuver = crear_mapa_ids(conn, "dim_ManeuverType", "idManeuverType", callback)
-        map_ids_consequence = crear_mapa_ids(conn, "dim_ConsequenceType", "idConsequenceType", callback)
+        # FKs de Dimensiones (Puentes), en caché del contexto
+        map_ids_service = ctx.mapa_ids("dim_ServiceType", "idServiceType", callback)
+        map_ids_vehicletypevalue = ctx.mapa_ids("dim_VehicleTypeValue", "idVehicleTypeValue", callback)
+        map_ids_maneuver = ctx.mapa_ids("dim_ManeuverType", "idManeuverType", callback)
+        map_ids_consequence = ctx.mapa_ids("dim_ConsequenceType", "idConsequenceType", callback)
         
-        # Mapa de Búsqueda (LaneValue -> idLane)
-        map_lane = crear_mapa_simple(conn, "dim_Lane", "idLane", "LaneValue")
+        # Mapa de Búsqueda (LaneValue -> idLane), compartido con Ficha 0
+        map_lane = ctx.mapa_simple("dim_Lane", "idLane", "LaneValue")
         
         # Mapa de Búsqueda (Registration -> idVehicleDescription)
-        # Se carga ahora y se actualiza en vivo durante el bucle
-        map_vehicle_desc = crear_mapa_simple(conn, "dim_VehicleDescription", "idVehicleDescription", "Registration")
+        # Se carga ahora y se actualiza después de cada archivo confirmado
+        map_vehicle_desc = ctx.mapa_simple("dim_VehicleDescription", "idVehicleDescription", "Registration", en_cache=False)
+
+        mapas_validacion = (map_ids_accidents, map_ids_service, map_ids_vehicletypevalue,
+                            map_ids_maneuver, map_ids_consequence, map_lane)
         
         callback(f"Mapas creados. {len(map_ids_accidents)} accidentes válidos encontrados.")
         
@@ -105,117 +201,83 @@ def run(callback):
         dirty_files = set()
         failed_rows_details = []
 
-        for archivo_csv in nuevos_archivos_csv:
-            callback(f" Procesando Archivo: {os.path.basename(archivo_csv)}")
+        for archivo in archivos_a_cargar:
+            archivo_csv = archivo['ruta']
+            nombre_archivo = archivo['ruta_relativa'] # Distingue archivos homónimos de distintos años
+            callback(f" Procesando Archivo: {nombre_archivo}")
             
             try:
-                df = pd.read_csv(
-                    archivo_csv, 
-                    encoding="utf-8", 
-                    dtype=str,
-                    sep=','
-                )
-                df = df.where(pd.notna(df), None) # Convertir NaNs a None
-                
+                # En memoria (carga en línea), copia columnar vigente o el CSV, tipados según su esquema
+                df = ctx.leer_limpio(archivo, ESQUEMAS['ficha1'])
+
             except Exception as e:
                 callback(f" ERROR: No se pudo leer {archivo_csv}. Error: {e}")
-                dirty_files.add(os.path.basename(archivo_csv))
+                dirty_files.add(nombre_archivo)
                 continue
 
-            file_had_errors = False
-            
+            # --- Validación de FKs de todo el archivo (sin tocar la base) ---
             try:
+                datos, errores = validar_archivo(df, mapas_validacion)
+            except Exception as e_file:
+                callback(f"  ERROR al validar {nombre_archivo}: {e_file}.")
+                dirty_files.add(nombre_archivo)
+                failed_rows_details.append( (None, str(e_file), nombre_archivo) )
+                continue
+
+            if errores.notna().any():
+                # Un archivo con errores no se carga (mismo resultado que revertir su transacción)
+                dirty_files.add(nombre_archivo)
+                filas_con_error = errores.notna()
+                filas = df.loc[filas_con_error].astype(object)
+                for fila, error in zip(filas.where(filas.notna(), None).to_dict('records'), errores[filas_con_error]):
+                    failed_rows_details.append( (fila, error, nombre_archivo) )
+                callback(f" ADVERTENCIA: Se encontraron errores en {nombre_archivo}. Se revirtió la carga de este archivo.")
+                continue
+
+            try:
+                conn.commit()
                 cursor.execute("BEGIN IMMEDIATE")
-                
-                for index, row in df.iterrows():
-                    
-                    try:
-                        # --- A. Obtener datos de la fila ---
-                        id_acc = str(row['ID Accidente']).strip() if row['ID Accidente'] else None
-                        registration = str(row['Patente']).strip() if row['Patente'] else None
-                        brand = str(row['Marca']).strip() if row['Marca'] else "Sin Marca"
-
-                        # --- B. Obtener valores de FK (con default 0 = 'Sin dato') ---
-                        val_service = safe_int_convert(row.get("Servicio"), 0)
-                        val_veh_type = safe_int_convert(row.get("Tipo Vehículo"), 0)
-                        val_maneuver = safe_int_convert(row.get("Maniobra"), 0)
-                        val_consequence = safe_int_convert(row.get("Consecuencia"), 0)
-                        val_lane = safe_int_convert(row.get("Pista/Vía"), None) # None si está vacío
-
-                        # --- C. Validar todos los FKs antes de insertar ---
-                        error_fk = None
-                        if not id_acc or not registration:
-                            error_fk = f"Campo obligatorio vacío: ID Accidente ({id_acc}) o Patente ({registration})"
-                        elif id_acc not in map_ids_accidents:
-                            error_fk = f"idAccident '{id_acc}' no existe en factAccident"
-                        elif val_service not in map_ids_service:
-                            error_fk = f"idServiceType '{val_service}' no existe en dim_ServiceType"
-                        elif val_veh_type not in map_ids_vehicletypevalue:
-                            error_fk = f"idVehicleTypeValue '{val_veh_type}' no existe en dim_VehicleTypeValue"
-                        elif val_maneuver not in map_ids_maneuver:
-                            error_fk = f"idManeuverType '{val_maneuver}' no existe en dim_ManeuverType"
-                        elif val_consequence not in map_ids_consequence:
-                            error_fk = f"idConsequenceType '{val_consequence}' no existe en dim_ConsequenceType"
-
-                        if error_fk:
-                            raise sqlite3.IntegrityError(error_fk)
-
-                        # Búsqueda de Pista (Lane)
-                        id_lane_fk = None
-                        if val_lane is not None:
-                            id_lane_fk = map_lane.get(val_lane)
-                            if id_lane_fk is None:
-                                raise sqlite3.IntegrityError(f"LaneValue '{val_lane}' no existe en dim_Lane")
-                        
-                        # --- D. Si todo es válido, proceder con la lógica de "Upsert" ---
-                        
-                        # 1. Upsert dim_VehicleDescription
-                        id_vd = map_vehicle_desc.get(registration)
-                        if not id_vd:
-                            cursor.execute("INSERT OR IGNORE INTO dim_VehicleDescription (Registration, Brand) VALUES (?, ?)", 
-                                        (registration, brand))
-                            id_vd = cursor.lastrowid
-                            
-                            if id_vd == 0: # Fue ignorado (ya existía pero no estaba en el mapa)
-                                cursor.execute("SELECT idVehicleDescription FROM dim_VehicleDescription WHERE Registration = ?", (registration,))
-                                id_vd = cursor.fetchone()[0]
-                            
-                            map_vehicle_desc[registration] = id_vd # Actualizar mapa en vivo
-
-                        # 2. Insertar Hecho (factVehicleAccident)
-                        cursor.execute("INSERT INTO factVehicleAccident (idAccident, idVehicleDescription) VALUES (?, ?)", 
-                                    (id_acc, id_vd))
-                        idVA = cursor.lastrowid # Obtener el PK del hecho insertado
-
-                        # 3. Insertar Puentes
-                        cursor.execute("INSERT OR IGNORE INTO bridge_VehicleAccident_ServiceType (idVehicleAccident, idServiceType) VALUES (?, ?)", (idVA, val_service))
-                        cursor.execute("INSERT OR IGNORE INTO bridge_VehicleAccident_VehicleTypeValue (idVehicleAccident, idVehicleTypeValue) VALUES (?, ?)", (idVA, val_veh_type))
-                        cursor.execute("INSERT OR IGNORE INTO bridge_VehicleAccident_ManeuverType (idVehicleAccident, idManeuverType) VALUES (?, ?)", (idVA, val_maneuver))
-                        cursor.execute("INSERT OR IGNORE INTO bridge_VehicleAccident_ConsequenceType (idVehicleAccident, idConsequenceType) VALUES (?, ?)", (idVA, val_consequence))
-                        
-                        if id_lane_fk:
-                            cursor.execute("INSERT OR IGNORE INTO bridge_VehicleAccident_Lane (idVehicleAccident, idLane) VALUES (?, ?)", (idVA, id_lane_fk))
-
-                    except Exception as e_row:
-                        # Error a nivel de FILA
-                        file_had_errors = True
-                        failed_rows_details.append( (row.to_dict(), str(e_row), os.path.basename(archivo_csv)) )
-
-                # --- E. Decidir Commit o Rollback para el ARCHIVO ---
-                if file_had_errors:
-                    dirty_files.add(os.path.basename(archivo_csv))
-                    conn.rollback()
-                    callback(f" ADVERTENCIA: Se encontraron errores en {os.path.basename(archivo_csv)}. Se revirtió la carga de este archivo.")
-                else:
-                    conn.commit()
-                    callback(f" Archivo {os.path.basename(archivo_csv)} cargado exitosamente.")
+                inicio_archivo = time.time()
+                # Registro de la carga + borrado de la versión anterior, en la transacción del archivo
+                id_carga = registro.iniciar(archivo, callback)
+
+                # --- D. Upsert en lote de dim_VehicleDescription ---
+                ids_vehiculos_nuevos = upsert_vehiculos(cursor, datos, map_vehicle_desc)
+                id_vd = datos['registration'].map(lambda patente: map_vehicle_desc.get(patente) or ids_vehiculos_nuevos[patente])
+
+                # --- E. Hechos con idVehicleAccident preasignados (filas en el orden del archivo) ---
+                primer_id = siguiente_id_vehicle_accident(cursor)
+                ids_va = range(primer_id, primer_id + len(datos))
+                cursor.executemany(
+                    "INSERT INTO factVehicleAccident (idVehicleAccident, idAccident, idVehicleDescription, idCarga) VALUES (?, ?, ?, ?)",
+                    zip(ids_va, datos['id_acc'], id_vd.astype(int).tolist(), [id_carga] * len(datos)))
+                # Accidentes con vehículos nuevos: su totalVehicles queda pendiente de recontar
+                cursor.executemany("UPDATE factAccident SET totalVehicles = NULL WHERE idAccident = ?",
+                                   ((id_acc,) for id_acc in datos['id_acc'].unique()))
+
+                # --- F. Puentes en lote ---
+                for tabla, columna_fk, columna_df in PUENTES_VEHICULO:
+                    cursor.executemany(
+                        f"INSERT OR IGNORE INTO {tabla} (idVehicleAccident, {columna_fk}) VALUES (?, ?)",
+                        zip(ids_va, datos[columna_df].tolist()))
+
+                con_pista = datos['id_lane'].fillna(0) != 0
+                cursor.executemany(
+                    "INSERT OR IGNORE INTO bridge_VehicleAccident_Lane (idVehicleAccident, idLane) VALUES (?, ?)",
+                    zip(pd.Series(ids_va, index=datos.index)[con_pista].tolist(), datos.loc[con_pista, 'id_lane'].astype(int).tolist()))
+
+                registro.finalizar(id_carga, len(df), len(datos), 0, time.time() - inicio_archivo)
+                conn.commit()
+                # Las patentes nuevas pasan al mapa sólo cuando el archivo quedó confirmado
+                map_vehicle_desc.update(ids_vehiculos_nuevos)
+                callback(f" Archivo {nombre_archivo} cargado exitosamente.")
 
             except Exception as e_file:
                 # Error a nivel de TRANSACCIÓN/ARCHIVO
                 conn.rollback()
-                callback(f"  ERROR de Base de Datos al procesar {os.path.basename(archivo_csv)}: {e_file}.")
-                dirty_files.add(os.path.basename(archivo_csv))
-                failed_rows_details.append( (None, str(e_file), os.path.basename(archivo_csv)) )
+                callback(f"  ERROR de Base de Datos al procesar {nombre_archivo}: {e_file}.")
+                dirty_files.add(nombre_archivo)
+                failed_rows_details.append( (None, str(e_file), nombre_archivo) )
 
         if conn:
             conn.commit()
@@ -224,21 +286,11 @@ def run(callback):
         # --- 5. Registrar Logs y Reportar Errores ---
         callback("...procesamiento de Ficha 1 finalizado.")
 
-        callback("Registrando archivos procesados en el log (Ficha 1)...")
-        now_str = datetime.now().isoformat()
-        
-        files_to_log = []
-        for f_path in nuevos_archivos_csv:
-            f_name = os.path.basename(f_path)
-            if f_name not in dirty_files:
-                files_to_log.append((f_name, now_str))
-                
-        if files_to_log:
-            cursor.executemany("INSERT OR IGNORE INTO etl_log_ficha1_vehiculos (FileName, LoadedTimestamp) VALUES (?, ?)", files_to_log)
-            callback(f"{len(files_to_log)} archivos 100% limpios registrados en el log etl_log_ficha1_vehiculos.")
+        # Los archivos cargados ya quedaron en etl_log_cargas dentro de su propia transacción
+        callback(f"{len(archivos_a_cargar) - len(dirty_files)} archivos 100% limpios registrados en etl_log_cargas.")
         
         if dirty_files:
-            callback(f"ADVERTENCIA: {len(dirty_files)} archivos con errores no se registraron en etl_log_ficha1_vehiculos y serán reintentados.")
+            callback(f"ADVERTENCIA: {len(dirty_files)} archivos con errores no se registraron en etl_log_cargas y serán reintentados.")
 
         if failed_rows_details:
             callback("\n--- ⚠️ Reporte Detallado de Errores de Carga (Ficha 1) ---")
@@ -249,7 +301,7 @@ def run(callback):
                 if fila:
                     callback(f" Datos: ID Accidente {fila.get('ID Accidente')}, Patente {fila.get('Patente')}")
                     
-        conn.commit() # Commit final para los logs
+        conn.commit() # Commit final
         callback("Proceso ETL para Ficha 1 completado.")
 
     except Exception as e:
@@ -258,6 +310,5 @@ def run(callback):
             conn.rollback()
         raise
     finally:
-        if 'conn' in locals():
-            conn.close()
-            print("Conexión cerrada.")
+        if contexto is None and ctx is not None:
+            ctx.cerrar()
@@ -0,0 +1,114 @@
+import os
+import sqlite3
+import tempfile
+import time
+from config_manager import obtener_ruta
+from proceso_db.scripts.conexion import conectar
+from proceso_db.scripts.contexto_carga import ContextoCarga
+from proceso_db.scripts.crear_tablas import INDICES_SECUNDARIOS, crear_indices, eliminar_indices
+
+# Tablas que Power BI importa completas (SELECT * por tabla)
+TABLAS_POWER_BI = [
+    "dim_DateTime", "dim_Plaza", "dim_Direction", "dim_Category", "dim_Section", "dim_Km",
+    "factTraffic", "factAccident", "factVehicleAccident", "factAccidentAffected",
+]
+
+def run(callback, contexto=None):
+    """
+    Etapa post-carga: recrea los índices secundarios eliminados para una carga masiva,
+    actualiza las estadísticas del planificador (ANALYZE completo si se recreó alguno; si no,
+    PRAGMA optimize, que sólo analiza las tablas con estadísticas desactualizadas) y vuelca
+    el WAL al archivo principal para que la base quede autocontenida (Power BI / respaldos).
+    Recibe un callback para enviar mensajes de log y, opcionalmente, el ContextoCarga compartido.
+    """
+    ctx = None
+    try:
+        ctx = contexto or ContextoCarga()
+        conn = ctx.conexion()
+
+        start_idx = time.time()
+        callback(f"Verificando {len(INDICES_SECUNDARIOS)} índices secundarios...")
+        creados = crear_indices(conn, callback)
+        callback(f"{creados} índices creados en {time.time() - start_idx:.2f}s.")
+
+        start_analyze = time.time()
+        if creados:
+            conn.execute("ANALYZE")
+        else:
+            conn.execute("PRAGMA optimize")
+        conn.commit()
+        callback(f"Estadísticas actualizadas ({'ANALYZE' if creados else 'PRAGMA optimize'}) en {time.time() - start_analyze:.2f}s.")
+
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE);")
+
+    except Exception as e:
+        callback(f"Error: {e}")
+        if 'conn' in locals():
+            conn.rollback()
+        raise
+    finally:
+        if contexto is None and ctx is not None:
+            ctx.cerrar()
+
+# === Benchmark (antes / después) ===
+
+def _medir(conn, consulta, repeticiones=3):
+    """Mejor tiempo (s) de 'repeticiones' ejecuciones leyendo todas las filas."""
+    mejor = None
+    filas = 0
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        filas = len(conn.execute(consulta).fetchall())
+        duracion = time.perf_counter() - inicio
+        mejor = duracion if mejor is None else min(mejor, duracion)
+    return mejor, filas
+
+def benchmark(ruta_db, callback):
+    """
+    Compara la consulta del modelo ML y las consultas de importación de Power BI sobre una
+    copia de la base: sin índices secundarios ni PRAGMAs ("antes") y con el perfil de
+    conexión + índices + ANALYZE ("después"). La base original no se modifica.
+    """
+    # Import tardío: el módulo ML arrastra sklearn/matplotlib
+    from proceso_ml.ml_regresion_lineal import QUERY_DATOS_DIARIOS
+
+    consultas = [("ML: datos diarios", QUERY_DATOS_DIARIOS)]
+    consultas += [(f"Power BI: {tabla}", f"SELECT * FROM {tabla}") for tabla in TABLAS_POWER_BI]
+
+    with tempfile.TemporaryDirectory() as carpeta:
+        ruta_copia = os.path.join(carpeta, os.path.basename(ruta_db))
+        origen = sqlite3.connect(ruta_db)
+        destino = sqlite3.connect(ruta_copia)
+        origen.backup(destino)
+        origen.close()
+
+        # --- Antes: conexión por defecto, sin índices ni estadísticas ---
+        destino.execute("PRAGMA journal_mode = DELETE;")
+        eliminar_indices(destino, callback)
+        destino.execute("DROP TABLE IF EXISTS sqlite_stat1")
+        destino.commit()
+        destino.close()
+
+        conn = sqlite3.connect(ruta_copia)
+        antes = {nombre: _medir(conn, consulta) for nombre, consulta in consultas}
+        conn.close()
+
+        # --- Después: perfil de PRAGMAs + índices + ANALYZE ---
+        conn = conectar(ruta_copia)
+        crear_indices(conn, callback)
+        conn.execute("ANALYZE")
+        conn.commit()
+        despues = {nombre: _medir(conn, consulta) for nombre, consulta in consultas}
+        conn.close()
+
+    callback(f"\n{'Consulta':<32}{'Filas':>10}{'Antes (s)':>12}{'Después (s)':>14}{'Mejora':>9}")
+    for nombre, _ in consultas:
+        t_antes, filas = antes[nombre]
+        t_despues, _ = despues[nombre]
+        mejora = t_antes / t_despues if t_despues else float('inf')
+        callback(f"{nombre:<32}{filas:>10}{t_antes:>12.3f}{t_despues:>14.3f}{mejora:>8.1f}x")
+
+# --- Esto permite probar el script de forma independiente ---
+if __name__ == "__main__":
+    print("Ejecutando benchmark de índices y PRAGMAs sobre una copia de la base de datos...")
+    benchmark(obtener_ruta("ruta_database"), print)
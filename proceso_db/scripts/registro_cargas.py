@@ -0,0 +1,290 @@
+import os
+import hashlib
+from datetime import datetime
+from utils.gestion_archivos import hash_archivo, SIN_CAMBIOS
+from utils.formato_limpio import ruta_tabla, TABLAS_FICHA0
+from proceso_db.scripts.fact.cargar_factAccident_conteo import descartar_dias_resumen
+
+# Tipo de carga -> tabla de hechos cuyas filas llevan idCarga
+TABLAS_HECHOS = {
+    'trafico': 'factTraffic',
+    'ficha0': 'factAccident',
+    'ficha1': 'factVehicleAccident',
+}
+
+# Tipo de carga -> tablas relacionadas que acompañan a cada CSV limpio (se cargan con él)
+TABLAS_RELACIONADAS = {
+    'ficha0': TABLAS_FICHA0,
+}
+
+# Logs anteriores (sólo por nombre de archivo) que se migran a etl_log_cargas
+TABLAS_LOG_ANTERIORES = {
+    'etl_log_trafico': 'trafico',
+    'etl_log_ficha0': 'ficha0',
+    'etl_log_ficha1_vehiculos': 'ficha1',
+}
+
+# --- Estados de una carga ---
+CARGADO = 'cargado'          # Todas las filas del archivo quedaron en la base
+CON_ERRORES = 'con_errores'  # Carga parcial (filas rechazadas); se reintenta reemplazándola
+REEMPLAZADO = 'reemplazado'  # Sus filas se borraron al cargar otra versión del archivo
+INVALIDADO = 'invalidado'    # Perdió filas por el reemplazo de accidentes (Ficha 1); se recarga
+ESTADOS_ACTIVOS = (CARGADO, CON_ERRORES, INVALIDADO)
+
+def migrar_logs_anteriores(conn, callback):
+    """
+    Copia los registros de etl_log_trafico / etl_log_ficha0 / etl_log_ficha1_vehiculos a
+    etl_log_cargas y elimina esas tablas. Las cargas migradas no tienen hash ni ruta
+    (se completan la primera vez que se vuelve a ver el archivo) y sus filas no llevan idCarga.
+    """
+    cursor = conn.cursor()
+    tablas_existentes = {fila[0] for fila in cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    for tabla, tipo in TABLAS_LOG_ANTERIORES.items():
+        if tabla not in tablas_existentes:
+            continue
+        cursor.execute(f"""
+            INSERT INTO etl_log_cargas (Tipo, FileName, Status, LoadedTimestamp)
+            SELECT ?, FileName, ?, LoadedTimestamp FROM {tabla}
+        """, (tipo, CARGADO))
+        callback(f"{cursor.rowcount} registros de {tabla} migrados a etl_log_cargas.")
+        cursor.execute(f"DROP TABLE {tabla}")
+
+class RegistroCargas():
+    """
+    Libro de cargas (etl_log_cargas) de un tipo de archivo CSV limpio.
+    Cada carga se identifica por el hash de contenido del archivo (si tiene tablas relacionadas,
+    el de todas juntas) y guarda filas leídas, cargadas y rechazadas, duración y estado.
+    Las filas de hechos llevan el idCarga, así una
+    versión corregida de un archivo reemplaza exactamente las filas de la versión anterior
+    dentro de la misma transacción en que se carga la nueva.
+    """
+    def __init__(self, ctx, tipo):
+        self.ctx = ctx
+        self.tipo = tipo
+        self.tabla_hechos = TABLAS_HECHOS[tipo]
+        self.tablas_relacionadas = TABLAS_RELACIONADAS.get(tipo, ())
+        self.conn = ctx.conexion()
+        self.carpeta_base = ctx.ruta("ruta_csv_limpio")
+
+    def ruta_relativa(self, ruta_csv):
+        """Ruta del CSV relativa a la carpeta de limpios (distingue archivos homónimos de distintos años)."""
+        return os.path.relpath(ruta_csv, self.carpeta_base).replace(os.sep, '/')
+
+    def planificar(self, archivos_csv, callback):
+        """
+        Decide qué CSV hay que cargar. Devuelve una lista de dicts con 'ruta', 'nombre',
+        'ruta_relativa', 'hash' (el de la carga: con tablas relacionadas, el del conjunto),
+        'hash_csv' (el del CSV solo, con el que se busca su copia columnar), 'tamano',
+        'reemplaza' (idCarga de la versión anterior o None) y 'tablas'
+        ({tabla relacionada: {'ruta', 'hash_csv'}}, vacío si el tipo no tiene).
+        Se omiten los archivos cuyo contenido ya está cargado o que ya se cargaron en esta
+        ejecución; los que cambiaron o quedaron con errores se recargan como reemplazo de su carga anterior.
+        """
+        cursor = self.conn.cursor()
+        marcadores = ",".join("?" for _ in ESTADOS_ACTIVOS)
+        cursor.execute(f"""
+            SELECT idCarga, FileName, RelativePath, ContentHash, Status
+            FROM etl_log_cargas WHERE Tipo = ? AND Status IN ({marcadores})
+        """, (self.tipo, *ESTADOS_ACTIVOS))
+        por_ruta = {}
+        anteriores_por_nombre = {}
+        rutas_por_hash = {}
+        for id_carga, nombre, ruta_rel, hash_csv, estado in cursor.fetchall():
+            if ruta_rel is None:
+                anteriores_por_nombre[nombre] = id_carga
+            else:
+                por_ruta[ruta_rel] = (id_carga, hash_csv, estado)
+                if estado == CARGADO:
+                    rutas_por_hash[hash_csv] = ruta_rel
+
+        manifiesto = self.ctx.manifiesto()
+        plan = []
+        for ruta_csv in archivos_csv:
+            ruta_rel = self.ruta_relativa(ruta_csv)
+            # Un archivo se carga una sola vez por ejecución (la carga en línea repasa las carpetas al final)
+            if (self.tipo, ruta_rel) in self.ctx.archivos_cargados:
+                continue
+            nombre = os.path.basename(ruta_csv)
+            entrada_previa = manifiesto.entrada('carga_db', ruta_csv)
+            hash_previo = entrada_previa['hash'] if entrada_previa else None
+            hash_propio = self.__hash(ruta_csv)
+            tablas = self.__tablas_relacionadas(ruta_csv, ruta_rel, callback)
+            if tablas is None:
+                continue
+            hash_csv = self.__hash_conjunto(hash_propio, tablas) if tablas else hash_propio
+
+            previa = por_ruta.get(ruta_rel)
+            if previa is None and nombre in anteriores_por_nombre:
+                # Carga registrada sólo por nombre (log anterior): se asume que se cargó el
+                # contenido que conocía el manifiesto, o el actual si no hay registro.
+                id_carga = anteriores_por_nombre.pop(nombre)
+                hash_cargado = hash_previo or hash_csv
+                cursor.execute("UPDATE etl_log_cargas SET RelativePath = ?, ContentHash = ? WHERE idCarga = ?",
+                               (ruta_rel, hash_cargado, id_carga))
+                previa = (id_carga, hash_cargado, CARGADO)
+                por_ruta[ruta_rel] = previa
+                if hash_cargado != hash_csv:
+                    self.__avisar_sin_identificar(ruta_rel, callback)
+                    continue
+
+            if previa is not None:
+                id_previa, hash_cargado, estado = previa
+                if hash_cargado == hash_csv and estado == CARGADO:
+                    continue
+                if self.__sin_identificar(id_previa):
+                    self.__avisar_sin_identificar(ruta_rel, callback)
+                    continue
+            elif hash_csv in rutas_por_hash:
+                callback(f"Info: '{ruta_rel}' tiene el mismo contenido que '{rutas_por_hash[hash_csv]}' (ya cargado). Omitiendo.")
+                continue
+
+            plan.append({
+                'ruta': ruta_csv,
+                'nombre': nombre,
+                'ruta_relativa': ruta_rel,
+                'hash': hash_csv,
+                'hash_csv': hash_propio,
+                'tamano': os.path.getsize(ruta_csv) + sum(os.path.getsize(t['ruta']) for t in tablas.values()),
+                'reemplaza': previa[0] if previa is not None else None,
+                'tablas': tablas,
+            })
+
+        self.conn.commit()
+        manifiesto.guardar()
+
+        reemplazos = sum(1 for archivo in plan if archivo['reemplaza'] is not None)
+        if reemplazos:
+            callback(f"{reemplazos} archivos reemplazarán una carga anterior (versión corregida o con errores).")
+        return plan
+
+    def es_carga_masiva(self, plan, proporcion):
+        """
+        True si el plan es grande respecto de lo ya cargado: su tamaño suma al menos 'proporcion'
+        del de las cargas activas del tipo, o la tabla de hechos está vacía. Si sólo hay cargas
+        migradas de los logs anteriores (sin tamaño) no se considera masiva.
+        """
+        marcadores = ",".join("?" for _ in ESTADOS_ACTIVOS)
+        cargado = self.conn.execute(f"""
+            SELECT COALESCE(SUM(FileSize), 0) FROM etl_log_cargas WHERE Tipo = ? AND Status IN ({marcadores})
+        """, (self.tipo, *ESTADOS_ACTIVOS)).fetchone()[0]
+        if not cargado:
+            return self.conn.execute(f"SELECT 1 FROM {self.tabla_hechos} LIMIT 1").fetchone() is None
+        return sum(archivo['tamano'] for archivo in plan) >= proporcion * cargado
+
+    def iniciar(self, archivo, callback):
+        """
+        Registra la carga del archivo y, si reemplaza una carga anterior, borra sus filas.
+        Debe llamarse dentro de la transacción del cargador: si ésta se revierte, la versión
+        anterior queda intacta. Devuelve el idCarga para etiquetar las filas nuevas.
+        """
+        cursor = self.conn.cursor()
+        cursor.execute("""
+            INSERT INTO etl_log_cargas (Tipo, FileName, RelativePath, ContentHash, FileSize, Status, LoadedTimestamp)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, (self.tipo, archivo['nombre'], archivo['ruta_relativa'], archivo['hash'], archivo['tamano'],
+              CARGADO, datetime.now().isoformat()))
+        id_carga = cursor.lastrowid
+        self.ctx.archivos_cargados.add((self.tipo, archivo['ruta_relativa']))
+
+        if archivo['reemplaza'] is not None:
+            filas = self.eliminar_filas([archivo['reemplaza']], callback)
+            cursor.execute("UPDATE etl_log_cargas SET Status = ?, ReplacedBy = ? WHERE idCarga = ?",
+                           (REEMPLAZADO, id_carga, archivo['reemplaza']))
+            callback(f"  Reemplazando '{archivo['ruta_relativa']}': {filas} filas de la carga {archivo['reemplaza']} eliminadas.")
+        return id_carga
+
+    def finalizar(self, id_carga, filas_leidas, filas_cargadas, filas_rechazadas, duracion):
+        """Guarda los conteos y el estado final de la carga (dentro de la misma transacción)."""
+        estado = CON_ERRORES if filas_rechazadas else CARGADO
+        self.conn.execute("""
+            UPDATE etl_log_cargas
+            SET RowsRead = ?, RowsLoaded = ?, RowsRejected = ?, DurationSeconds = ?, Status = ?
+            WHERE idCarga = ?
+        """, (int(filas_leidas), int(filas_cargadas), int(filas_rechazadas), round(duracion, 3), estado, id_carga))
+
+    def eliminar_filas(self, ids_carga, callback):
+        """
+        Borra las filas de hechos de las cargas indicadas (los puentes se borran por ON DELETE CASCADE).
+        En Ficha 0 los vehículos de los accidentes borrados también caen en cascada, por lo que
+        las cargas de Ficha 1 afectadas se marcan INVALIDADO para recargarlas. En Ficha 1 los
+        accidentes de los vehículos borrados quedan con totalVehicles pendiente (NULL).
+        Devuelve la cantidad de filas borradas de la tabla de hechos.
+        """
+        cursor = self.conn.cursor()
+        marcadores = ",".join("?" for _ in ids_carga)
+        # Borrar por idCarga sin recorrer la tabla de hechos completa (el índice puede haberse
+        # eliminado antes de una carga masiva; es el mismo de INDICES_SECUNDARIOS)
+        cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_{self.tabla_hechos}_idCarga ON {self.tabla_hechos} (idCarga)")
+
+        if self.tipo == 'ficha0':
+            # La cascada busca vehículos por idAccident: el índice evita un recorrido completo por accidente
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_factVehicleAccident_idAccident ON factVehicleAccident (idAccident)")
+            cursor.execute(f"""
+                SELECT DISTINCT V.idCarga FROM factVehicleAccident V
+                JOIN factAccident A ON A.idAccident = V.idAccident
+                WHERE A.idCarga IN ({marcadores}) AND V.idCarga IS NOT NULL
+            """, ids_carga)
+            cargas_vehiculos = [fila[0] for fila in cursor.fetchall()]
+            # Los días de los accidentes borrados se vuelven a sumar en el resumen diario
+            descartar_dias_resumen(cursor, ids_carga)
+        elif self.tipo == 'ficha1':
+            # Los accidentes que pierden vehículos quedan con el conteo pendiente (cargar_factAccident_conteo)
+            cursor.execute(f"""
+                UPDATE factAccident SET totalVehicles = NULL
+                WHERE idAccident IN (SELECT idAccident FROM factVehicleAccident WHERE idCarga IN ({marcadores}))
+            """, ids_carga)
+
+        cursor.execute(f"DELETE FROM {self.tabla_hechos} WHERE idCarga IN ({marcadores})", ids_carga)
+        filas_borradas = cursor.rowcount
+
+        if self.tipo == 'ficha0' and cargas_vehiculos:
+            marcadores_vehiculos = ",".join("?" for _ in cargas_vehiculos)
+            cursor.execute(f"""
+                UPDATE etl_log_cargas SET Status = ?
+                WHERE idCarga IN ({marcadores_vehiculos}) AND Status IN (?, ?)
+            """, (INVALIDADO, *cargas_vehiculos, CARGADO, CON_ERRORES))
+            callback(f"  {cursor.rowcount} cargas de Ficha 1 dependientes se recargarán.")
+        return filas_borradas
+
+    # --- Métodos privados ---
+    def __hash(self, ruta_csv):
+        """Hash de contenido usando el manifiesto como caché (sólo os.stat si el archivo no cambió)."""
+        manifiesto = self.ctx.manifiesto()
+        estado, hash_csv = manifiesto.estado('carga_db', ruta_csv)
+        if estado == SIN_CAMBIOS:
+            return hash_csv or manifiesto.entrada('carga_db', ruta_csv)['hash']
+        hash_csv = hash_csv or hash_archivo(ruta_csv)
+        manifiesto.registrar('carga_db', ruta_csv, hash_csv)
+        return hash_csv
+
+    def __tablas_relacionadas(self, ruta_csv, ruta_rel, callback):
+        """
+        {tabla: {'ruta', 'hash_csv'}} de las tablas relacionadas del CSV. None (con aviso) si falta
+        alguna: CSV con el formato anterior o escrito a medias, que el ETL vuelve a generar.
+        """
+        tablas = {tabla: {'ruta': ruta_tabla(ruta_csv, tabla)} for tabla in self.tablas_relacionadas}
+        faltantes = [tabla for tabla, info in tablas.items() if not os.path.exists(info['ruta'])]
+        if faltantes:
+            callback(f"ADVERTENCIA: a '{ruta_rel}' le faltan sus tablas {', '.join(faltantes)}. "
+                     f"Se omite hasta que el ETL lo vuelva a generar.")
+            return None
+        for info in tablas.values():
+            info['hash_csv'] = self.__hash(info['ruta'])
+        return tablas
+
+    def __hash_conjunto(self, hash_csv, tablas):
+        """Hash que identifica al CSV junto con sus tablas relacionadas (cambia si cambia cualquiera)."""
+        hasher = hashlib.blake2b(digest_size=16)
+        hasher.update(hash_csv.encode())
+        for tabla, info in tablas.items():
+            hasher.update(f"|{tabla}:{info['hash_csv']}".encode())
+        return hasher.hexdigest()
+
+    def __sin_identificar(self, id_carga):
+        """True si la carga es anterior al registro por contenido (sus filas no llevan idCarga)."""
+        fila = self.conn.execute("SELECT RowsRead FROM etl_log_cargas WHERE idCarga = ?", (id_carga,)).fetchone()
+        return fila is None or fila[0] is None
+
+    def __avisar_sin_identificar(self, ruta_rel, callback):
+        callback(f"ADVERTENCIA: '{ruta_rel}' cambió, pero su carga es anterior al registro por contenido "
+                 f"y sus filas no se pueden reemplazar. Reconstruya la base para recargarlo.")
@@ -1,13 +1,22 @@
 import os
 import re
-import pandas as pd
 from pathlib import Path
+import queue
 import threading
-from config_manager import obtener_ruta
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait, FIRST_COMPLETED
+from config_manager import obtener_ruta, obtener_opcion
+from utils.gestion_archivos import ManifiestoArchivos, MODIFICADO, NUEVO
+from utils.formato_limpio import ruta_tabla, TABLAS_FICHA0
+from proceso_etl.libro_excel import LibroExcel
 from proceso_etl.etl_siniestros import ETLSiniestralidad
 from proceso_etl.etl_trafico import ETLTrafico
 from proceso_etl.etl_vehiculos import ETLVehiculos
 
+# Tablas que cada tipo escribe junto a su CSV limpio (Ficha 0 normalizada)
+TABLAS_RELACIONADAS = {
+    'siniestralidad': TABLAS_FICHA0,
+}
+
 def _extraer_fecha_del_nombre(nombre_archivo):
     match = re.search(r'(\d{4}).*?(\d{2})|(\d{2}).*?(\d{4})|(\d{2})\s+\w+\s+(\d{4})', nombre_archivo)
     if match:
@@ -18,21 +27,27 @@ def _extraer_fecha_del_nombre(nombre_archivo):
             return (int(año), int(mes))
     return (0, 0)
 
-def encontrar_archivos_a_procesar():
+def encontrar_archivos_a_procesar(manifiesto=None):
     """
     Busca todos los archivos Excel en las carpetas de brutos estructuradas
     y devuelve una lista de aquellos que necesitan ser procesados.
+    Un archivo está pendiente si su CSV limpio (o alguna de sus tablas relacionadas) no existe
+    o si cambió su contenido desde la última conversión (según el manifiesto de archivos,
+    sección 'etl').
     """
     ruta_brutos_base = obtener_ruta('ruta_excel_bruto')
     ruta_limpios_base = obtener_ruta('ruta_csv_limpio')
+    if manifiesto is None:
+        manifiesto = ManifiestoArchivos(obtener_ruta('ruta_manifiesto'))
     archivos_pendientes = []
     log_mensajes = []
 
     # Definir las subcarpetas a explorar y sus tipos asociados
+    # (las carpetas limpias son las mismas donde escriben las clases ETL)
     carpetas_etl = {
-        'Tráfico Mensual': ('trafico', os.path.join(ruta_limpios_base, 'Trafico')),
-        'Siniestralidad/Ficha 0': ('siniestralidad', os.path.join(ruta_limpios_base, 'Siniestralidad')),
-        'Siniestralidad/Ficha 1': ('vehiculos', os.path.join(ruta_limpios_base, 'Vehiculos'))
+        'Tráfico Mensual': ('trafico', os.path.join(ruta_limpios_base, 'Tráfico Mensual')),
+        'Siniestralidad/Ficha 0': ('siniestralidad', os.path.join(ruta_limpios_base, 'Siniestralidad', 'Ficha 0')),
+        'Siniestralidad/Ficha 1': ('vehiculos', os.path.join(ruta_limpios_base, 'Siniestralidad', 'Ficha 1'))
     }
 
     log_mensajes.append("Iniciando búsqueda de archivos a procesar...")
@@ -59,13 +74,26 @@ def encontrar_archivos_a_procesar():
                         ruta_carpeta_anio_limpia = os.path.join(carpeta_limpia_destino, anio_carpeta) # usa "anio"
                         ruta_archivo_limpio = os.path.join(ruta_carpeta_anio_limpia, f"{nombre_base}_Limpio.csv")
 
-                        # Si el archivo limpio NO existe, añadir el bruto a la lista de pendientes
-                        if not os.path.exists(ruta_archivo_limpio):
-                            archivos_pendientes.append({'ruta': ruta_archivo_bruto, 'tipo': tipo_etl})
+                        estado, hash_bruto = manifiesto.estado('etl', ruta_archivo_bruto)
+                        rutas_limpias = [ruta_archivo_limpio] + [ruta_tabla(ruta_archivo_limpio, tabla) for tabla in TABLAS_RELACIONADAS.get(tipo_etl, ())]
+                        existe_limpio = all(os.path.exists(ruta) for ruta in rutas_limpias)
+
+                        if estado == MODIFICADO:
+                            # Re-emisión corregida: se reprocesa sobrescribiendo el CSV limpio
+                            archivos_pendientes.append({'ruta': ruta_archivo_bruto, 'tipo': tipo_etl, 'forzar': True, 'hash': hash_bruto})
+                            log_mensajes.append(f"    -> MODIFICADO: {archivo}")
+                        elif not existe_limpio:
+                            # Si el archivo limpio NO existe, añadir el bruto a la lista de pendientes
+                            archivos_pendientes.append({'ruta': ruta_archivo_bruto, 'tipo': tipo_etl, 'forzar': False, 'hash': hash_bruto})
                             log_mensajes.append(f"    -> PENDIENTE: {archivo}")
+                        elif estado == NUEVO:
+                            # Convertido antes de existir el manifiesto: se registra sin reprocesar
+                            manifiesto.registrar('etl', ruta_archivo_bruto, tipo=tipo_etl)
                         # else:
                         #     log_mensajes.append(f"    -> Ya procesado: {archivo}") # Opcional: loggear los ya procesados
 
+    manifiesto.guardar()
+
     if not archivos_pendientes:
         log_mensajes.append("No se encontraron archivos nuevos o pendientes de procesar.")
     else:
@@ -84,19 +112,26 @@ def encontrar_archivos_a_procesar():
 #    ruta_completa = os.path.join(ruta_brutos, archivos_ordenados[0])
 #    return ruta_completa, f"Archivo más reciente encontrado: {archivos_ordenados[0]}"
 
-def identificar_tipo_por_contenido(ruta_excel):
+def identificar_tipo_por_contenido(ruta_excel, libro=None):
+    """
+    Identifica el tipo de archivo mirando su contenido.
+    Si se entrega 'libro' (LibroExcel abierto) la primera hoja queda en su caché y la
+    transformación posterior la reutiliza sin volver a leer el archivo.
+    """
+    if libro is None:
+        with LibroExcel(ruta_excel) as libro:
+            return identificar_tipo_por_contenido(ruta_excel, libro)
     try:
-        df_preview_cols = pd.read_excel(ruta_excel, nrows=1).columns
+        df_preview_cols = libro.leer(nrows=1).columns
         if all(col.startswith('Column') for col in df_preview_cols[:5]):
             return 'siniestralidad'
         
-        df_preview_skip = pd.read_excel(ruta_excel, skiprows=6, nrows=1).columns
+        df_preview_skip = libro.leer(skiprows=6, nrows=1).columns
         columnas_vehiculo = {"código accidente", "tipo vehículo", "servicio"}
         if columnas_vehiculo.issubset({str(c).lower() for c in df_preview_skip}):
             return 'vehiculos'
 
-        xls = pd.ExcelFile(ruta_excel)
-        if any(str(hoja).strip().startswith(tuple('123456789')) for hoja in xls.sheet_names):
+        if any(str(hoja).strip().startswith(tuple('123456789')) for hoja in libro.hojas):
             return 'trafico'
     except Exception as e:
         print(f"Error al analizar el archivo {ruta_excel}: {e}")
@@ -104,40 +139,121 @@ def identificar_tipo_por_contenido(ruta_excel):
     return 'desconocido'
 
 
-def ejecutar_proceso_etl_completo(callback_progreso=None, cancel_event=None):
+# Mapa de clases ETL
+ETL_MAP = {
+    'siniestralidad': ETLSiniestralidad,
+    'trafico': ETLTrafico,
+    'vehiculos': ETLVehiculos
+}
+
+def obtener_num_procesos(total_archivos, num_procesos=None):
     """
-    Función orquestadora: Encuentra TODOS los archivos pendientes, los identifica
-    (usando la estructura de carpetas) y delega su procesamiento.
+    Cantidad de procesos para convertir los Excel.
+    Se lee 'etl_procesos' de config.json si no se indica: 1 = secuencial (un archivo tras otro),
+    0 = automático (núcleos disponibles - 1). Nunca se usan más procesos que archivos.
+    """
+    if num_procesos is None:
+        num_procesos = obtener_opcion('etl_procesos', 1)
+    try:
+        num_procesos = int(num_procesos)
+    except (TypeError, ValueError):
+        num_procesos = 1
+    if num_procesos <= 0:
+        num_procesos = max(1, (os.cpu_count() or 2) - 1)
+    return max(1, min(num_procesos, total_archivos))
+
+def _procesar_archivo(ruta_archivo, tipo_archivo, forzar=False, al_transformar=None):
+    """
+    Convierte un Excel con su clase ETL. Está a nivel de módulo para que el
+    ProcessPoolExecutor pueda enviarla a los procesos hijos.
+    'forzar' sobrescribe el CSV limpio existente (archivo bruto modificado).
+    'al_transformar' se entrega a la clase ETL (carga en línea, ver procesar_archivo de cada clase).
+    El libro se abre una sola vez para todo el procesamiento del archivo y se cierra
+    (liberando las hojas leídas) al terminar, antes de pasar al siguiente.
     """
+    with LibroExcel(ruta_archivo) as libro:
+        etl_instance = ETL_MAP[tipo_archivo]()
+        return etl_instance.procesar_archivo(ruta_archivo, forzar=forzar, libro=libro, al_transformar=al_transformar)
+
+def _registrar_en_manifiesto(manifiesto, archivo_info):
+    """Marca el Excel como convertido (sólo tras un procesamiento sin errores)."""
+    try:
+        manifiesto.registrar('etl', archivo_info['ruta'], archivo_info.get('hash'), tipo=archivo_info['tipo'])
+        manifiesto.guardar()
+    except OSError as e:
+        print(f"Advertencia: no se pudo actualizar el manifiesto para {archivo_info['ruta']}: {e}")
+
+def _mensaje_resultado(nombre_archivo, resultado_exitoso):
+    if resultado_exitoso:
+        return f"[OK] {nombre_archivo}"
+    return f"[WARN] {nombre_archivo} (sin datos o advertencia)"
+
+def _armar_resumen(resultados_procesamiento, proceso_cancelado):
+    """Mensaje final para la GUI (vista_etl.finalizar_proceso lo interpreta)."""
+    resumen_errores = sum(1 for msg in resultados_procesamiento if "ERROR" in msg)
+    resumen_advertencias = sum(1 for msg in resultados_procesamiento if "Advertencia" in msg)
+    resumen_exitosos = len(resultados_procesamiento) - resumen_errores - resumen_advertencias
+    return (
+        f"Proceso ETL {'cancelado' if proceso_cancelado else 'completado'}.\n"
+        f"- Éxito: {resumen_exitosos}\n"
+        f"- Adv.: {resumen_advertencias}\n"
+        f"- Errores: {resumen_errores}\n\n"
+        f"Resultados individuales:\n" + "\n".join([f"  {msg}" for msg in resultados_procesamiento])
+    )
+
+def _crear_reportador(callback_progreso):
+    """Función de progreso de los orquestadores: llama al callback si existe y además imprime en consola."""
     def reportar_progreso(mensaje, progreso_actual=None, progreso_total=None):
         # Esta función interna llama al callback si existe
         if callback_progreso:
             callback_progreso(mensaje, progreso_actual, progreso_total)
         # Sigue imprimiendo en consola para depuración
         print(mensaje)
+    return reportar_progreso
 
-    archivos_a_procesar, mensaje_busqueda = encontrar_archivos_a_procesar()
+def ejecutar_proceso_etl_completo(callback_progreso=None, cancel_event=None, num_procesos=None):
+    """
+    Función orquestadora: Encuentra TODOS los archivos pendientes, los identifica
+    (usando la estructura de carpetas) y delega su procesamiento.
+    Con más de un proceso (ver obtener_num_procesos) los archivos se convierten en paralelo.
+    """
+    reportar_progreso = _crear_reportador(callback_progreso)
+
+    manifiesto = ManifiestoArchivos(obtener_ruta('ruta_manifiesto'))
+    archivos_a_procesar, mensaje_busqueda = encontrar_archivos_a_procesar(manifiesto)
     reportar_progreso(mensaje_busqueda) # Log de búsqueda
 
     if not archivos_a_procesar:
         return "No hay archivos nuevos para procesar.", None, False
-    
+
+    total_archivos = len(archivos_a_procesar)
+    num_procesos = obtener_num_procesos(total_archivos, num_procesos)
+
+    if num_procesos > 1:
+        reportar_progreso(f"\nIniciando procesamiento de {total_archivos} archivos en {num_procesos} procesos...", 0, total_archivos)
+        resultados_procesamiento, archivos_procesados_ruta, proceso_cancelado, progreso_actual = _procesar_en_paralelo(
+            archivos_a_procesar, num_procesos, manifiesto, reportar_progreso, cancel_event)
+    else:
+        reportar_progreso(f"\nIniciando procesamiento de {total_archivos} archivos...", 0, total_archivos)
+        resultados_procesamiento, archivos_procesados_ruta, proceso_cancelado, progreso_actual = _procesar_en_serie(
+            archivos_a_procesar, manifiesto, reportar_progreso, cancel_event)
+
+    mensaje_final = _armar_resumen(resultados_procesamiento, proceso_cancelado)
+
+    reportar_progreso("\n--- PROCESO FINALIZADO ---" if not proceso_cancelado else "", progreso_actual, total_archivos)
+
+    # Devolvemos el resumen y la lista de archivos procesados (o None si no se procesó ninguno)
+    return mensaje_final, archivos_procesados_ruta if archivos_procesados_ruta else None, proceso_cancelado
+
+def _procesar_en_serie(archivos_a_procesar, manifiesto, reportar_progreso, cancel_event):
+    """Procesa los archivos uno tras otro en el proceso actual."""
     resultados_procesamiento = []
     archivos_procesados_ruta = []
     total_archivos = len(archivos_a_procesar)
     proceso_cancelado = False # Flag de cancelación
     progreso_actual = 0 # Contador para progreso
 
-    # Mapa de clases ETL
-    etl_map = {
-        'siniestralidad': ETLSiniestralidad,
-        'trafico': ETLTrafico,
-        'vehiculos': ETLVehiculos
-    }
-
-    reportar_progreso(f"\nIniciando procesamiento de {total_archivos} archivos...", 0, total_archivos)
-
-    for i, archivo_info in enumerate(archivos_a_procesar):
+    for archivo_info in archivos_a_procesar:
         if cancel_event and cancel_event.is_set():
             reportar_progreso("\nCancelación solicitada. Deteniendo...", progreso_actual, total_archivos)
             proceso_cancelado = True
@@ -150,24 +266,18 @@ def ejecutar_proceso_etl_completo(callback_progreso=None, cancel_event=None):
 
         reportar_progreso(f"\n({progreso_actual + 1}/{total_archivos}) Procesando: {nombre_archivo}...", progreso_actual, total_archivos)
 
-        ETLClass = etl_map.get(tipo_archivo)
-        if not ETLClass:
+        if tipo_archivo not in ETL_MAP:
             mensaje = f"[ERR] No hay clase ETL definida para '{tipo_archivo}'."
             reportar_progreso(f"-> {mensaje}", progreso_actual, total_archivos)
             resultados_procesamiento.append(mensaje + f" Archivo: {nombre_archivo}")
             continue
 
         try:
-            etl_instance = ETLClass()
-            resultado_exitoso = etl_instance.procesar_archivo(ruta_archivo)
+            resultado_exitoso = _procesar_archivo(ruta_archivo, tipo_archivo, archivo_info.get('forzar', False))
             progreso_actual += 1 # Avanzar progreso
-
-            if resultado_exitoso:
-                 mensaje_resumen = f"[OK] {nombre_archivo}"
-                 reportar_progreso(f"-> {mensaje_resumen}", progreso_actual, total_archivos)
-            else:
-                 mensaje_resumen = f"[WARN] {nombre_archivo} (sin datos o advertencia)"
-                 reportar_progreso(f"-> {mensaje_resumen}", progreso_actual, total_archivos)
+            _registrar_en_manifiesto(manifiesto, archivo_info)
+            mensaje_resumen = _mensaje_resultado(nombre_archivo, resultado_exitoso)
+            reportar_progreso(f"-> {mensaje_resumen}", progreso_actual, total_archivos)
             resultados_procesamiento.append(mensaje_resumen)
 
         except Exception as e:
@@ -176,19 +286,174 @@ def ejecutar_proceso_etl_completo(callback_progreso=None, cancel_event=None):
             resultados_procesamiento.append(mensaje_resumen)
             # Continuar con el siguiente archivo
 
-    # Mensaje final para la GUI
-    resumen_errores = sum(1 for msg in resultados_procesamiento if "ERROR" in msg)
-    resumen_advertencias = sum(1 for msg in resultados_procesamiento if "Advertencia" in msg)
-    resumen_exitosos = len(resultados_procesamiento) - resumen_errores - resumen_advertencias
-    mensaje_final = (
-        f"Proceso ETL {'cancelado' if proceso_cancelado else 'completado'}.\n"
-        f"- Éxito: {resumen_exitosos}\n"
-        f"- Adv.: {resumen_advertencias}\n"
-        f"- Errores: {resumen_errores}\n\n"
-        f"Resultados individuales:\n" + "\n".join([f"  {msg}" for msg in resultados_procesamiento])
-    )
+    return resultados_procesamiento, archivos_procesados_ruta, proceso_cancelado, progreso_actual
 
-    reportar_progreso("\n--- PROCESO FINALIZADO ---" if not proceso_cancelado else "", progreso_actual, total_archivos)
+def _procesar_en_paralelo(archivos_a_procesar, num_procesos, manifiesto, reportar_progreso, cancel_event):
+    """
+    Reparte los archivos en un ProcessPoolExecutor. Los mensajes de progreso se emiten
+    desde este hilo a medida que terminan los archivos; la cancelación descarta los
+    archivos que aún no se envían y espera a los que ya están en curso.
+    Los resultados se devuelven en el mismo orden que la lista de pendientes.
+    """
+    total_archivos = len(archivos_a_procesar)
+    resultados = [None] * total_archivos
+    archivos_procesados_ruta = []
+    proceso_cancelado = False
+    progreso_actual = 0
 
-    # Devolvemos el resumen y la lista de archivos procesados (o None si no se procesó ninguno)
-    return mensaje_final, archivos_procesados_ruta if archivos_procesados_ruta else None, proceso_cancelado
\ No newline at end of file
+    # Archivos con clase ETL conocida; los demás se registran como error de inmediato
+    por_enviar = []
+    for posicion, archivo_info in enumerate(archivos_a_procesar):
+        if archivo_info['tipo'] in ETL_MAP:
+            por_enviar.append(posicion)
+        else:
+            nombre_archivo = Path(archivo_info['ruta']).name
+            mensaje = f"[ERR] No hay clase ETL definida para '{archivo_info['tipo']}'."
+            reportar_progreso(f"-> {mensaje}", progreso_actual, total_archivos)
+            resultados[posicion] = mensaje + f" Archivo: {nombre_archivo}"
+    por_enviar.reverse() # Se toman con pop() manteniendo el orden original
+
+    with ProcessPoolExecutor(max_workers=num_procesos) as executor:
+        futuros = {}
+        while por_enviar or futuros:
+            if cancel_event and cancel_event.is_set() and not proceso_cancelado:
+                reportar_progreso("\nCancelación solicitada. Esperando archivos en curso...", progreso_actual, total_archivos)
+                proceso_cancelado = True
+                por_enviar.clear()
+
+            # Sólo se envía un archivo por proceso libre, así la cancelación no deja archivos encolados
+            while por_enviar and len(futuros) < num_procesos:
+                posicion = por_enviar.pop()
+                archivo_info = archivos_a_procesar[posicion]
+                reportar_progreso(f"Procesando: {Path(archivo_info['ruta']).name}...", progreso_actual, total_archivos)
+                futuros[executor.submit(_procesar_archivo, archivo_info['ruta'], archivo_info['tipo'], archivo_info.get('forzar', False))] = posicion
+            if not futuros:
+                break
+
+            # Espera corta para revisar la cancelación con frecuencia
+            terminados, _ = wait(futuros, timeout=0.5, return_when=FIRST_COMPLETED)
+            for futuro in terminados:
+                posicion = futuros.pop(futuro)
+                ruta_archivo = archivos_a_procesar[posicion]['ruta']
+                nombre_archivo = Path(ruta_archivo).name
+                archivos_procesados_ruta.append(ruta_archivo)
+                try:
+                    resultado_exitoso = futuro.result()
+                    progreso_actual += 1
+                    _registrar_en_manifiesto(manifiesto, archivos_a_procesar[posicion])
+                    mensaje_resumen = _mensaje_resultado(nombre_archivo, resultado_exitoso)
+                    reportar_progreso(f"({progreso_actual}/{total_archivos}) {mensaje_resumen}", progreso_actual, total_archivos)
+                except Exception as e:
+                    # Incluye BrokenProcessPool si un proceso hijo muere
+                    mensaje_resumen = f"[ERR] {nombre_archivo}: {type(e).__name__}"
+                    reportar_progreso(f"-> ¡ERROR CRÍTICO! {mensaje_resumen} (Detalle: {e})", progreso_actual, total_archivos)
+                resultados[posicion] = mensaje_resumen
+
+    resultados_procesamiento = [msg for msg in resultados if msg is not None]
+    return resultados_procesamiento, archivos_procesados_ruta, proceso_cancelado, progreso_actual
+
+# --- Carga en línea (ver proceso_db/carga_en_linea.py) ---
+
+def _guardar_en_segundo_plano(manifiesto, archivo_info, entregas):
+    """Escribe los CSV limpios entregados por la transformación y marca el Excel como convertido."""
+    for df, ruta_csv, guardar in entregas:
+        guardar(df, ruta_csv)
+    _registrar_en_manifiesto(manifiesto, archivo_info)
+
+def _poner_en_cola(cola, elemento, detener):
+    """Pone el elemento en la cola acotada esperando lugar; devuelve False si se pidió detener antes."""
+    while not detener.is_set():
+        try:
+            cola.put(elemento, timeout=0.5)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+def ejecutar_proceso_etl_en_linea(cola, callback_progreso=None, detener=None):
+    """
+    Variante de ejecutar_proceso_etl_completo para la carga en línea: los archivos se
+    transforman uno tras otro en este hilo y el DataFrame limpio de cada uno se pone en 'cola'
+    apenas está listo, para que la carga a la base empiece mientras se transforma el siguiente.
+    Cada elemento es un dict con 'tipo', 'ruta_csv', 'df' y 'guardado': el futuro de la escritura
+    del CSV, que se hace en un hilo aparte (el CSV queda como registro y el libro de cargas lo
+    identifica por su hash). La cola es acotada: si la carga se atrasa, la transformación espera.
+    'detener' (threading.Event) corta el proceso entre archivos. Al terminar (con todos los CSV ya
+    escritos) pone None en la cola. Devuelve lo mismo que ejecutar_proceso_etl_completo.
+    """
+    reportar_progreso = _crear_reportador(callback_progreso)
+    detener = detener or threading.Event()
+    resultados_procesamiento = []
+    archivos_procesados_ruta = []
+    escrituras = [] # (posición en resultados, nombre del archivo, futuro de la escritura)
+    proceso_cancelado = False
+    progreso_actual = 0
+    total_archivos = 0
+    escritor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="csv_limpio")
+
+    try:
+        manifiesto = ManifiestoArchivos(obtener_ruta('ruta_manifiesto'))
+        archivos_a_procesar, mensaje_busqueda = encontrar_archivos_a_procesar(manifiesto)
+        reportar_progreso(mensaje_busqueda) # Log de búsqueda
+
+        if not archivos_a_procesar:
+            return "No hay archivos nuevos para procesar.", None, False
+
+        total_archivos = len(archivos_a_procesar)
+        reportar_progreso(f"\nIniciando procesamiento en línea de {total_archivos} archivos...", 0, total_archivos)
+
+        for archivo_info in archivos_a_procesar:
+            if detener.is_set():
+                reportar_progreso("\nCancelación solicitada. Deteniendo...", progreso_actual, total_archivos)
+                proceso_cancelado = True
+                break
+
+            ruta_archivo = archivo_info['ruta']
+            tipo_archivo = archivo_info['tipo']
+            nombre_archivo = Path(ruta_archivo).name
+            archivos_procesados_ruta.append(ruta_archivo)
+
+            reportar_progreso(f"\n({progreso_actual + 1}/{total_archivos}) Procesando: {nombre_archivo}...", progreso_actual, total_archivos)
+
+            if tipo_archivo not in ETL_MAP:
+                mensaje = f"[ERR] No hay clase ETL definida para '{tipo_archivo}'."
+                reportar_progreso(f"-> {mensaje}", progreso_actual, total_archivos)
+                resultados_procesamiento.append(mensaje + f" Archivo: {nombre_archivo}")
+                continue
+
+            entregas = []
+            try:
+                resultado_exitoso = _procesar_archivo(ruta_archivo, tipo_archivo, archivo_info.get('forzar', False),
+                                                      al_transformar=lambda df, ruta_csv, guardar: entregas.append((df, ruta_csv, guardar)))
+            except Exception as e:
+                mensaje_resumen = f"[ERR] {nombre_archivo}: {type(e).__name__}"
+                reportar_progreso(f"-> ¡ERROR CRÍTICO! {mensaje_resumen} (Detalle: {e})", progreso_actual, total_archivos)
+                resultados_procesamiento.append(mensaje_resumen)
+                continue
+
+            progreso_actual += 1
+            guardado = escritor.submit(_guardar_en_segundo_plano, manifiesto, archivo_info, entregas)
+            mensaje_resumen = _mensaje_resultado(nombre_archivo, resultado_exitoso)
+            reportar_progreso(f"-> {mensaje_resumen}", progreso_actual, total_archivos)
+            resultados_procesamiento.append(mensaje_resumen)
+            escrituras.append((len(resultados_procesamiento) - 1, nombre_archivo, guardado))
+
+            for df, ruta_csv, _ in entregas:
+                if not _poner_en_cola(cola, {'tipo': tipo_archivo, 'ruta_csv': ruta_csv, 'df': df, 'guardado': guardado}, detener):
+                    break
+            # Sólo la cola y el escritor conservan el DataFrame (se libera apenas se carga y se escribe)
+            entregas = df = None
+
+    finally:
+        # Todos los CSV quedan escritos antes de avisar el fin a la carga
+        escritor.shutdown(wait=True)
+        for posicion, nombre_archivo, guardado in escrituras:
+            if guardado.exception() is not None:
+                mensaje_resumen = f"[ERR] {nombre_archivo}: {type(guardado.exception()).__name__}"
+                reportar_progreso(f"-> ¡ERROR CRÍTICO! No se pudo guardar el CSV limpio de {nombre_archivo} (Detalle: {guardado.exception()})")
+                resultados_procesamiento[posicion] = mensaje_resumen
+        _poner_en_cola(cola, None, detener)
+
+    mensaje_final = _armar_resumen(resultados_procesamiento, proceso_cancelado)
+    reportar_progreso("\n--- PROCESO FINALIZADO ---" if not proceso_cancelado else "", progreso_actual, total_archivos)
+    return mensaje_final, archivos_procesados_ruta if archivos_procesados_ruta else None, proceso_cancelado
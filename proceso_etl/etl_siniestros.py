@@ -6,6 +6,8 @@ from datetime import datetime, date, time
 from pathlib import Path
 import csv
 from config_manager import obtener_ruta
+from proceso_etl.libro_excel import LibroExcel
+from utils.formato_limpio import obtener_formato, guardar_columnar, ruta_tabla, TABLAS_FICHA0
 import re
 
 
@@ -81,6 +83,21 @@ class ETLSiniestralidad():
         "Column67": "Descripción del Accidente",
     }
 
+    # Secciones anchas del Excel: (tabla de salida, texto de sus columnas, columnas de la tabla)
+    __SECCIONES = [
+        ("Entorno", "Condiciones del Entorno", ["Condiciones del Entorno", "Valor Condiciones del Entorno"]),
+        ("Concurrencia", "Concurrencia", ["Concurrencia", "Valor Concurrencia"]),
+        ("Afectados", "Consecuencias", ["Consecuencia", "Afectado", "Cantidad Afectados"]),
+        ("Causas", "Causa Probable", ["Causa Probable", "Valor Causa Probable"]),
+    ]
+
+    # Fechas en texto 'DD/MM' o 'DD/MM/YY(YY)' (después de cambiar '.' y '-' por '/')
+    __PATRON_FECHA = r'^\s*([0-9]{1,4})\s*/\s*([0-9]{1,4})\s*(?:/\s*([0-9]{1,4})\s*)?$'
+    # Horas en texto 'HH:MM' o 'HH:MM:SS' (celdas de hora de Excel leídas como datetime.time)
+    __PATRON_HORA = r'^[0-9]{1,2}:[0-9]{2}(?::[0-9]{2})?$'
+    # Origen de los números seriales de fecha de Excel (Windows)
+    __ORIGEN_EXCEL = '1899-12-30'
+
     # -----------------------------------------
     # MÉTODOS PÚBLICOS
     # -----------------------------------------
@@ -94,14 +111,29 @@ class ETLSiniestralidad():
         self.__ruta_bruta_general = base_brutos
         self.__ruta_limpia_base = os.path.join(base_limpios, 'Siniestralidad', 'Ficha 0') # La salida sí es específica
         self.__CSV_SEP = "|"
+        # Copia columnar tipada junto al CSV (parquet/feather), según config.json
+        self.__formato_limpio = obtener_formato()
         os.makedirs(self.__ruta_limpia_base, exist_ok=True)
         self.__log("ETL de Siniestralidad (Ficha 0) inicializada.")
 
-    def procesar_archivo(self, ruta_archivo_excel):
+    def procesar_archivo(self, ruta_archivo_excel, forzar=False, libro=None, al_transformar=None):
             """
             Punto de entrada para el controlador. Procesa un único archivo que se le entrega.
             Devuelve True si tuvo éxito, False si falló.
+            El resultado son tablas normalizadas: el CSV _Limpio con un accidente por fila y, a su
+            lado, un CSV por relación (TABLAS_FICHA0: entorno, concurrencia, afectados, causas,
+            pistas y Km).
+            'forzar' sobrescribe los CSV limpios si ya existen (Excel re-emitido).
+            'libro' es el LibroExcel ya abierto por el controlador; si no se entrega se abre
+            uno propio que se cierra al terminar.
+            'al_transformar' (carga en línea) recibe (tablas, ruta_csv, guardar) en lugar de guardar
+            aquí los CSV limpios ('tablas' = {ruta CSV: DataFrame}): guardar(tablas, ruta_csv) los
+            escribe cuando y donde convenga al controlador.
             """
+            if libro is None:
+                with LibroExcel(ruta_archivo_excel) as libro:
+                    return self.procesar_archivo(ruta_archivo_excel, forzar, libro, al_transformar)
+
             self.__log(f"Iniciando procesamiento para: {ruta_archivo_excel}")
 
             nombre_base = Path(ruta_archivo_excel).stem
@@ -114,24 +146,34 @@ class ETLSiniestralidad():
             os.makedirs(ruta_salida_anio, exist_ok=True)
             ruta_csv_salida = os.path.join(ruta_salida_anio, f"{nombre_base}_Limpio.csv")
 
-            # Verificar si el archivo ya fue procesado
-            if os.path.exists(ruta_csv_salida):
+            # Verificar si el archivo ya fue procesado (con todas sus tablas)
+            if self.__salidas_completas(ruta_csv_salida) and not forzar:
                 self.__log(f"El archivo '{nombre_base}' ya ha sido procesado. Saltando.")
                 # Es importante notificar al controlador que no hubo error, simplemente no se hizo nada nuevo.
                 return True
 
             try:
                 # Llamada a la lógica principal de transformación
-                df_transformado = self.__transformar_excel(ruta_archivo_excel)
+                resultado = self.__transformar_excel(libro)
 
-                # Verificar si la transformación produjo un DataFrame válido
-                if df_transformado is None or df_transformado.empty:
+                # Verificar si la transformación produjo accidentes válidos
+                if resultado is None or resultado[0].empty:
                     self.__log(f"ADVERTENCIA: La transformación de '{nombre_base}' no produjo datos válidos.")
                     # Consideramos esto un éxito parcial (no error), pero no guardamos nada.
                     return True
 
+                df_accidentes, relaciones = resultado
+                tablas = {ruta_csv_salida: df_accidentes}
+                for tabla in TABLAS_FICHA0:
+                    tablas[ruta_tabla(ruta_csv_salida, tabla)] = relaciones[tabla]
+
+                # Carga en línea: el controlador guarda los CSV en segundo plano
+                if al_transformar is not None:
+                    al_transformar(tablas, ruta_csv_salida, self.__guardar_tablas)
+                    return True
+
                 # Guardar el resultado si la transformación fue exitosa
-                self.__guardar_csv(df_transformado, ruta_csv_salida)
+                self.__guardar_tablas(tablas, ruta_csv_salida)
                 return True # Indicar éxito al controlador
 
             except Exception as e:
@@ -143,6 +185,11 @@ class ETLSiniestralidad():
     # -----------------------------------------
     # MÉTODOS PRIVADOS - Lógica del ETL
     # -----------------------------------------
+    def __salidas_completas(self, ruta_csv):
+        """True si ya existen el CSV limpio y todas sus tablas relacionadas."""
+        rutas = [ruta_csv] + [ruta_tabla(ruta_csv, tabla) for tabla in TABLAS_FICHA0]
+        return all(os.path.exists(ruta) for ruta in rutas)
+
     def __extraer_anio_de_ruta(self, ruta_archivo):
         """Intenta extraer el año (carpeta 'YYYY') del path del archivo."""
         try:
@@ -154,11 +201,16 @@ class ETLSiniestralidad():
             self.__log(f"No se pudo extraer año de la ruta {ruta_archivo}: {e}")
         return None
 
-    def __transformar_excel(self, ruta_excel):
-        """Orquesta el proceso de transformación para un archivo Excel."""
+    def __transformar_excel(self, libro):
+        """
+        Orquesta el proceso de transformación para un archivo Excel.
+        Devuelve (accidentes, relaciones): un DataFrame con un accidente por fila y un dict
+        {tabla: DataFrame} con las TABLAS_FICHA0, o None si no se pudo transformar.
+        """
+        ruta_excel = libro.ruta
         self.__log(f"Transformando archivo: {Path(ruta_excel).name}")
         # 1. Leer y encontrar encabezado
-        df, _ = self.__read_raw_sheet(ruta_excel)
+        df, _ = self.__read_raw_sheet(libro)
         if df is None:
             # Si no se puede leer, no podemos continuar.
             self.__log("Error: No se pudo leer la hoja o encontrar el encabezado 'Correlativo'.")
@@ -192,26 +244,23 @@ class ETLSiniestralidad():
              self.__log("DataFrame vacío después de la limpieza inicial.")
              return None
 
-        # 3. Unpivot y combinar
-        df = self.__unpivot_y_combinar(df)
+        # 3. Unpivot (accidentes y una tabla por sección)
+        df, relaciones = self.__unpivot_y_combinar(df)
         if df.empty:
-             self.__log("DataFrame vacío después del unpivot y merge.")
+             self.__log("DataFrame vacío después del unpivot.")
              return None
 
         # 4. Imputar y expandir
-        df = self.__imputar_y_expandir(df)
-        if df.empty:
-             self.__log("DataFrame vacío después de imputar y expandir.")
-             return None
+        df, relaciones, valores_por_accidente = self.__imputar_y_expandir(df, relaciones)
 
         # 5. Pasos finales
-        df = self.__pasos_finales(df)
+        df, relaciones = self.__pasos_finales(df, relaciones, valores_por_accidente)
         if df.empty:
              self.__log("DataFrame vacío después de los pasos finales.")
              return None
 
-        self.__log(f"Transformación completada exitosamente. {len(df)} filas generadas.")
-        return df
+        self.__log(f"Transformación completada exitosamente. {len(df)} accidentes.")
+        return df, relaciones
 
     def __limpieza_inicial(self, df, prefijo_fecha_para_id, anio_archivo):
         """Realiza los primeros pasos de limpieza, formato y creación de ID."""
@@ -247,8 +296,8 @@ class ETLSiniestralidad():
             self.__log(f"ERROR durante el chequeo de columnas invertidas: {e_swap}")
         
         self.__log("Iniciando limpieza y preparación de datos...")
-        if "Km" in df.columns: df["Km"] = df["Km"].apply(self.__fix_km)
-        if "Hora" in df.columns: df["Hora"] = df["Hora"].apply(self.__fix_time)
+        if "Km" in df.columns: df["Km"] = self.__normalizar_km(df["Km"])
+        if "Hora" in df.columns: df["Hora"] = self.__normalizar_hora(df["Hora"])
 
         df = df.dropna(subset=["Correlativo"])
         # Asegurarse que Correlativo no sea un string vacío después de quitar NaNs
@@ -265,23 +314,27 @@ class ETLSiniestralidad():
 
         # Conversión de tipos
         df["Correlativo"] = pd.to_numeric(df["Correlativo"], errors='coerce').astype('Int64')
-        # ===  Usar función robusta __fix_fecha ===
+        # === Normalización vectorizada (los casos raros se resuelven con __fix_fecha) ===
         self.__log(f"Normalizando columna 'Fecha' usando el año default: {anio_archivo}")
-        df["Fecha"] = df["Fecha"].apply(self.__fix_fecha, anio_default=anio_archivo)
+        df["Fecha"] = self.__normalizar_fecha(df["Fecha"], anio_archivo)
         for col in ["P6", "P4", "P2", "P1", "P3", "P5", "Tramo"]:
             if col in df.columns:
                 df[col] = pd.to_numeric(df[col], errors="coerce").astype("Int64")
 
         # Crear ID Accidente con fecha de archivo
         self.__log(f"Generando 'ID Accidente' con prefijo: {prefijo_fecha_para_id}")
-        df["ID Accidente"] = df["Correlativo"].apply(
-            lambda correl: f"ACC-{prefijo_fecha_para_id}-{correl:03d}" if pd.notna(correl) else None)
+        ids = f"ACC-{prefijo_fecha_para_id}-" + df["Correlativo"].astype(str).str.zfill(3) # zfill = formato 03d
+        df["ID Accidente"] = ids.where(df["Correlativo"].notna(), None)
         self.__log("Preparación inicial completada.")
         return df
 
     def __unpivot_y_combinar(self, df):
-        """Realiza la lógica central de anulación de dinamización y producto cartesiano."""
-        self.__log("Iniciando transformación principal (unpivot y merge)...")
+        """
+        Separa los accidentes (columnas de contexto, uno por 'ID Accidente') de las secciones
+        anchas, que pasan a una tabla cada una. Cada tabla queda ordenada por accidente y, dentro
+        de él, en el orden de la sección: el mismo en que aparecían en la tabla combinada.
+        """
+        self.__log("Iniciando transformación principal (unpivot por sección)...")
         context_cols = [c for c in [
             "ID Accidente", "Fecha", "Hora", "Km", "P1", "P2", "P3", "P4", "P5", "P6",
             "Tramo", "Tipo Accidente", "Ubicación Relativa", "Ubicacion Relativa",
@@ -289,55 +342,92 @@ class ETLSiniestralidad():
             "Daños Ocasionados a la Infraestructura vial", "Descripción del Accidente"
         ] if c in df.columns]
 
-        df_cond = self.__unpivot_section(df, ["ID Accidente"], "Condiciones del Entorno", ["Condiciones del Entorno", "Valor Condiciones del Entorno"])
-        df_conc = self.__unpivot_section(df, ["ID Accidente"], "Concurrencia", ["Concurrencia", "Valor Concurrencia"])
-        df_consq = self.__unpivot_section(df, ["ID Accidente"], "Consecuencias", ["Consecuencia", "Afectado", "Cantidad Afectados"])
-        df_causa = self.__unpivot_section(df, ["ID Accidente"], "Causa Probable", ["Causa Probable", "Valor Causa Probable"])
-
         df_base = df[context_cols].drop_duplicates(subset=["ID Accidente"]).reset_index(drop=True)
-        work_df = df_base.copy()
-        for seccion_df in [df_cond, df_conc, df_consq, df_causa]:
-            if len(seccion_df.columns) > 1:
-                work_df = pd.merge(work_df, seccion_df, on="ID Accidente", how="left")
-        
-        self.__log("Merges completados.")
-        return work_df
-
-    def __imputar_y_expandir(self, df):
-        """Maneja los casos sin consecuencias y expande columnas con múltiples valores."""
+        ids_base = df_base[["ID Accidente"]]
+        relaciones = {}
+        for tabla, section_name, new_col_names in self.__SECCIONES:
+            seccion_df = self.__unpivot_section(df, ["ID Accidente"], section_name, new_col_names)
+            if len(seccion_df.columns) == 1: # Sección ausente o sin valores
+                seccion_df = pd.DataFrame(columns=["ID Accidente"] + new_col_names, dtype=object)
+            # Afectados conserva los accidentes sin consecuencias (se imputan en el paso 4)
+            como = "left" if tabla == "Afectados" else "inner"
+            relaciones[tabla] = pd.merge(ids_base, seccion_df, on="ID Accidente", how=como)
+
+        self.__log("Secciones separadas.")
+        return df_base, relaciones
+
+    def __imputar_y_expandir(self, df, relaciones):
+        """
+        Maneja los casos sin consecuencias y expande los valores múltiples ('10-11'): en la tabla
+        Entorno una fila por valor; en las columnas del accidente queda el primero (el que tomaba
+        la carga de la fila del accidente en la tabla combinada).
+        Devuelve también, por accidente, el producto de la cantidad de valores de sus columnas
+        (las filas en que se expandía en la tabla combinada, para el reporte de filas).
+        """
         self.__log("Imputando valores y expandiendo columnas...")
-        mask_sin_consecuencias = df["Consecuencia"].isnull()
-        df.loc[mask_sin_consecuencias, "Consecuencia"] = "Ninguna"
-        df.loc[mask_sin_consecuencias, "Afectado"] = "N/A"
-        df.loc[mask_sin_consecuencias, "Cantidad Afectados"] = 0
-        df["Cantidad Afectados"] = df["Cantidad Afectados"].astype(int)
+        df_afectados = relaciones["Afectados"]
+        mask_sin_consecuencias = df_afectados["Consecuencia"].isnull()
+        df_afectados.loc[mask_sin_consecuencias, "Consecuencia"] = "Ninguna"
+        df_afectados.loc[mask_sin_consecuencias, "Afectado"] = "N/A"
+        df_afectados.loc[mask_sin_consecuencias, "Cantidad Afectados"] = 0
+        df_afectados["Cantidad Afectados"] = df_afectados["Cantidad Afectados"].astype(int)
+
+        relaciones["Entorno"] = self.__split_and_explode(relaciones["Entorno"], "Valor Condiciones del Entorno", "Valor Condiciones del Entorno")
 
         cols_to_expand = [
-            "Valor Condiciones del Entorno", "Tipo Accidente", "Ubicación Relativa",
-            "Condición calzada", "Luminosidad", "Estado Atmosférico", "Luz artificial"
+            "Tipo Accidente", "Ubicación Relativa", "Condición calzada", "Luminosidad",
+            "Estado Atmosférico", "Luz artificial"
         ]
+        valores_por_accidente = pd.Series(1, index=df.index, dtype='int64')
         for col in cols_to_expand:
             col_name_in_df = col
             if col == "Ubicación Relativa" and col not in df.columns and "Ubicacion Relativa" in df.columns:
                 col_name_in_df = "Ubicacion Relativa"
-            
+
             if col_name_in_df in df.columns:
-                df = self.__split_and_explode(df, col_name_in_df, col)
-        
+                valores = self.__dividir_valores(df[col_name_in_df])
+                valores_por_accidente *= valores.str.len().fillna(1).astype('int64')
+                df[col] = valores.str[0].str.strip()
+
         self.__log("Imputación y expansión completadas.")
-        return df
+        return df, relaciones, valores_por_accidente
 
-    def __pasos_finales(self, df):
-        """Aplica los filtros finales y crea columnas derivadas."""
+    def __pasos_finales(self, df, relaciones, valores_por_accidente):
+        """
+        Aplica los filtros finales, crea columnas derivadas y pasa las pistas (P1..P6) y el Km del
+        accidente a sus propias tablas.
+        """
         self.__log("Aplicando filtros y transformaciones finales...")
         if "Descripción del Accidente" in df.columns:
             cond_desc = df["Descripción del Accidente"].notnull() & (df["Descripción del Accidente"].astype(str).str.strip() != "")
             df = df[cond_desc].reset_index(drop=True)
+            valores_por_accidente = valores_por_accidente[cond_desc].reset_index(drop=True)
+            for tabla, df_tabla in relaciones.items():
+                relaciones[tabla] = df_tabla[df_tabla["ID Accidente"].isin(df["ID Accidente"])].reset_index(drop=True)
+
+        df["FECHA/HORA"] = self.__combinar_fecha_hora(df)
+
+        # Pistas marcadas (> 0), por accidente y luego por pista
+        partes = []
+        for i in range(1, 7):
+            if f"P{i}" not in df.columns:
+                continue
+            marcadas = pd.to_numeric(df[f"P{i}"], errors="coerce").fillna(0) > 0
+            partes.append(pd.DataFrame({"ID Accidente": df.loc[marcadas, "ID Accidente"], "Pista": i}))
+        if partes:
+            pistas = pd.concat(partes).rename_axis("fila").sort_values(["fila", "Pista"], kind="stable")
+            relaciones["Pistas"] = pistas.reset_index(drop=True)
+        else:
+            relaciones["Pistas"] = pd.DataFrame(columns=["ID Accidente", "Pista"])
+
+        km = df["Km"] if "Km" in df.columns else pd.Series(np.nan, index=df.index)
+        relaciones["Km"] = pd.DataFrame({"ID Accidente": df["ID Accidente"], "Km": km})[km.notna()].reset_index(drop=True)
+        df = df.drop(columns=[c for c in ["Km", "P1", "P2", "P3", "P4", "P5", "P6"] if c in df.columns])
 
-        df["FECHA/HORA"] = df.apply(self.__combine_fecha_hora, axis=1)
+        self.__reportar_filas(df, relaciones, valores_por_accidente)
         self.__log("Proceso final completado.")
-        return df
-        
+        return df, relaciones
+
     # -----------------------------------------
     # MÉTODOS PRIVADOS - FUNCIONES AUXILIARES
     # -----------------------------------------
@@ -347,15 +437,28 @@ class ETLSiniestralidad():
         now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         print(f"[{now}] [ETL Siniestralidad] {msg}")
 
-    def __read_raw_sheet(self, path):
-        """Lee la hoja de Excel y localiza la fila de encabezado."""
+    def __reportar_filas(self, df, relaciones, valores_por_accidente):
+        """
+        Informa las filas de cada tabla y las que habría tenido la tabla combinada anterior:
+        por accidente, el producto de sus filas de cada sección (mínimo 1) y de sus valores.
+        """
+        filas_combinadas = valores_por_accidente.to_numpy(dtype='int64')
+        for tabla, _, _ in self.__SECCIONES:
+            filas_por_id = relaciones[tabla]["ID Accidente"].value_counts(dropna=False)
+            filas_combinadas = filas_combinadas * df["ID Accidente"].map(filas_por_id).fillna(0).clip(lower=1).to_numpy(dtype='int64')
+        total = len(df) + sum(len(df_tabla) for df_tabla in relaciones.values())
+        detalle = ", ".join(f"{tabla}: {len(df_tabla)}" for tabla, df_tabla in relaciones.items())
+        self.__log(f"Tablas normalizadas: {total} filas (Accidentes: {len(df)}, {detalle}). "
+                   f"La tabla combinada tendría {int(filas_combinadas.sum())} filas.")
+
+    def __read_raw_sheet(self, libro):
+        """Lee la hoja de Excel (desde el libro compartido) y localiza la fila de encabezado."""
+        path = libro.ruta
         self.__log(f"Cargando archivo: {path}")
         try:
-            # --- Cambio: Añadir engine ---
-            engine = 'xlrd' if path.lower().endswith('.xls') else 'openpyxl'
-            self.__log(f"Usando motor: {engine}") # Ya usa __log
+            self.__log(f"Usando motor: {libro.motor}") # Ya usa __log
 
-            df_raw = pd.read_excel(path, header=None, engine=engine, dtype=object)
+            df_raw = libro.leer(header=None, dtype=object)
             first_col = df_raw.iloc[:, 0].astype(str).fillna("")
             matches = first_col[first_col.str.strip().str.lower() == "correlativo"]
 
@@ -375,44 +478,64 @@ class ETLSiniestralidad():
             return None, None
 
     def __unpivot_section(self, df, id_vars, section_name, new_col_names):
-        """Lógica de anulación de dinamización para una sección específica."""
+        """
+        Lógica de anulación de dinamización para una sección específica.
+        Equivale a melt + filtro, pero sin armar la tabla larga completa (columnas × filas):
+        se buscan las celdas no vacías con máscaras sobre el bloque ancho y se emiten sólo
+        esas, en el mismo orden e índice que tendría el melt (columna por columna).
+        """
         cols_to_unpivot = [c for c in df.columns if section_name in str(c)]
         if not cols_to_unpivot:
             return pd.DataFrame({id_vars[0]: df[id_vars[0]].unique()})
 
-        unpivoted = df.melt(id_vars=id_vars, value_vars=cols_to_unpivot, var_name="Atributo", value_name="Valor")
-        unpivoted = unpivoted.dropna(subset=['Valor'])
-
-        is_text_range = unpivoted['Valor'].astype(str).str.contains('-')
-        numeric_values = pd.to_numeric(unpivoted.loc[~is_text_range, 'Valor'], errors='coerce').fillna(0)
-        
-        keep_mask = is_text_range | (numeric_values != 0)
-        
-        is_not_numeric_or_range = pd.to_numeric(unpivoted['Valor'], errors='coerce').isna() & ~is_text_range
-        keep_mask = keep_mask | is_not_numeric_or_range
-
-        unpivoted = unpivoted[keep_mask]
-        unpivoted = unpivoted[unpivoted['Valor'].astype(str).str.strip().str.upper() != 'FALSE']
-
-        if unpivoted.empty:
+        # Columnas de la sección una tras otra: mismo orden y tipo (inferido por el constructor
+        # del DataFrame, ej. datetime64) que la columna de valores del melt
+        bloque = pd.concat([df[c] for c in cols_to_unpivot], ignore_index=True).to_numpy()
+        bloque = pd.DataFrame({"Valor": bloque})["Valor"].to_numpy()
+        celdas = np.flatnonzero(pd.notna(bloque))
+        valores = bloque[celdas]
+
+        # Filtro de ceros / FALSE, evaluado una vez por valor distinto (según su texto)
+        codigos, unicos = pd.factorize(pd.Series(valores, dtype=object).astype(str))
+        texto = pd.Series(unicos, dtype=object)
+        is_text_range = texto.str.contains('-', regex=False)
+        numeric_values = pd.to_numeric(texto, errors='coerce')
+        keep_mask = is_text_range | (numeric_values.fillna(0) != 0) | numeric_values.isna()
+        keep_mask &= texto.str.strip().str.upper() != 'FALSE'
+
+        conservar = keep_mask.to_numpy()[codigos]
+        if not conservar.any():
             return pd.DataFrame({id_vars[0]: df[id_vars[0]].unique()})
 
+        col_idx, fila_idx = np.divmod(celdas[conservar], len(df))
+
+        # Atributos de cada columna de la sección (se calculan una vez por columna)
+        atributos = pd.Series(cols_to_unpivot, dtype=object)
+        tabla_atributos = {}
         if section_name == "Consecuencias":
-            unpivoted['Atributo'] = unpivoted['Atributo'].str.replace(f"{section_name} - ", "", regex=False)
-            split_data = unpivoted['Atributo'].str.split(" - ", n=1, expand=True)
-            unpivoted[new_col_names[0]] = split_data.get(0)
-            unpivoted[new_col_names[1]] = split_data.get(1)
+            atributos = atributos.str.replace(f"{section_name} - ", "", regex=False)
+            split_data = atributos.str.split(" - ", n=1, expand=True)
+            tabla_atributos[new_col_names[0]] = split_data.get(0)
+            tabla_atributos[new_col_names[1]] = split_data.get(1)
         elif section_name == "Causa Probable":
-            unpivoted[new_col_names[0]] = unpivoted['Atributo'].str.replace(
+            tabla_atributos[new_col_names[0]] = atributos.str.replace(
                 "Causa Probable (Contratos de Interurbanos y Urbanos) - ", "", regex=False
             ).str.replace(
                 "Causa Probable (Contratos de Corredores urbanos)", "Corredores urbanos", regex=False
             )
         else:
-            unpivoted[new_col_names[0]] = unpivoted['Atributo'].str.replace(f"{section_name} - ", "", regex=False)
+            tabla_atributos[new_col_names[0]] = atributos.str.replace(f"{section_name} - ", "", regex=False)
 
-        unpivoted[new_col_names[-1]] = unpivoted["Valor"]
-        return unpivoted[[id_vars[0]] + new_col_names]
+        unpivoted = pd.DataFrame(
+            {id_vars[0]: df[id_vars[0]].to_numpy()[fila_idx]},
+            index=celdas[conservar], # Índice que deja el melt (posición en la tabla larga)
+        )
+        for columna in new_col_names[:-1]:
+            serie = tabla_atributos.get(columna)
+            unpivoted[columna] = None if serie is None else serie.to_numpy()[col_idx]
+        # Como Series para conservar el dtype del bloque (pandas infiere tipos en un ndarray object)
+        unpivoted[new_col_names[-1]] = pd.Series(valores[conservar], index=unpivoted.index, dtype=valores.dtype)
+        return unpivoted
 
 
     # Funciones como métodos privadas
@@ -491,32 +614,162 @@ class ETLSiniestralidad():
         except Exception:
             return pd.NaT # Falla definitiva
 
+    def __dividir_valores(self, serie):
+        """Lista de valores de cada celda separados por '-' ('FALSE' cuenta como '0'); nulo si está vacía."""
+        valores = serie.astype(str).replace({'nan': None, 'None': None})
+        is_false = valores.str.strip().str.upper() == "FALSE"
+        valores.loc[is_false] = "0"
+        return valores.str.split("-")
+
     def __split_and_explode(self, df, column, new_column):
         if column not in df.columns: return df
         df_copy = df.copy()
-        df_copy[new_column] = df_copy[column].astype(str).replace({'nan': None, 'None': None})
-        is_false = df_copy[new_column].str.strip().str.upper() == "FALSE"
-        df_copy.loc[is_false, new_column] = "0"
-        df_copy[new_column] = df_copy[new_column].str.split("-")
+        df_copy[new_column] = self.__dividir_valores(df_copy[column])
         exploded = df_copy.explode(new_column).reset_index(drop=True)
         exploded[new_column] = exploded[new_column].str.strip()
         return exploded
 
-    def __make_id_acc(self, row):
-        try:
-            correl = int(row["Correlativo"])
-            fecha = row["Fecha"]
-            fecha_text = "000000" if pd.isna(fecha) else fecha.strftime("%Y%m")
-            return f"ACC-{fecha_text}-{correl:03d}"
-        except (ValueError, TypeError): return None
-
-    def __combine_fecha_hora(self, row):
-        f = row.get("Fecha")
-        h = row.get("Hora")
-        if pd.isna(f) or pd.isna(h): return pd.NaT
-        try: return pd.to_datetime(f"{f} {h}")
-        except Exception: return pd.NaT
-        
+    # --- Normalizadores vectorizados (mismo resultado que __fix_km / __fix_time / __fix_fecha) ---
+
+    def __clasificar_valores(self, serie):
+        """
+        Clasifica cada celda (leída con dtype=object) según su tipo Python:
+        'nulo', 'datetime', 'date', 'numero' u 'otro'. Se evalúa una vez por tipo distinto.
+        """
+        def categoria(tipo):
+            if issubclass(tipo, datetime): return 'datetime'
+            if issubclass(tipo, date): return 'date'
+            if issubclass(tipo, bool): return 'otro' # bool es int: se deja al caso escalar
+            if issubclass(tipo, (int, float)): return 'numero'
+            return 'otro'
+        tipos = serie.map(type)
+        categorias = tipos.map({tipo: categoria(tipo) for tipo in tipos.unique()})
+        categorias[serie.isna()] = 'nulo'
+        return categorias
+
+    def __normalizar_km(self, serie):
+        """Km como float: 'km+m' (se toma el primer dígito de los metros) y '-' o ',' como separador decimal."""
+        km = pd.Series(np.nan, index=serie.index, dtype=float)
+
+        # Números positivos en notación decimal: el valor ya es el Km (el resto, ej. 1e-05, va como texto)
+        es_numero = self.__clasificar_valores(serie) == 'numero'
+        numeros = serie[es_numero].astype(float)
+        directos = numeros[(numeros >= 1e-4) & (numeros < 1e15)]
+        km[directos.index] = directos
+
+        # Texto (y números raros): se normalizan sólo los valores únicos
+        restantes = serie.notna() & ~km.index.isin(directos.index)
+        codigos, unicos = pd.factorize(serie[restantes].astype(str))
+        texto = pd.Series(unicos, dtype=object).str.strip().str.replace("–", "-", regex=False)
+        partes = texto.str.extract(r'^([^+]*)\+([^+])')
+        con_mas = partes[1].notna()
+        candidato = texto.str.replace("-", ".", regex=False).str.replace(",", ".", regex=False)
+        candidato[con_mas] = partes.loc[con_mas, 0] + "." + partes.loc[con_mas, 1]
+        valores_unicos = pd.to_numeric(candidato, errors='coerce').astype(float).to_numpy()
+        km[restantes] = valores_unicos[codigos]
+        return km
+
+    def __normalizar_hora(self, serie):
+        """
+        Hora como datetime.time. Números H.MM (14.3 = 14:30) y textos 'HH:MM[:SS]' se resuelven
+        por columna; lo que no calce (formatos raros) pasa por __fix_time.
+        """
+        categorias = self.__clasificar_valores(serie)
+        horas = pd.Series(pd.NaT, index=serie.index, dtype=object)
+        resueltas = categorias == 'nulo'
+
+        es_datetime = categorias == 'datetime'
+        if es_datetime.any():
+            horas[es_datetime] = [pd.Timestamp(valor).time() for valor in serie[es_datetime]]
+            resueltas |= es_datetime
+
+        # Números H.MM: hora = parte entera, minutos = 2 decimales redondeados
+        numeros = serie[categorias == 'numero'].astype(float)
+        numeros = numeros[np.isfinite(numeros) & (numeros.abs() < 1e9)]
+        parte_entera = np.trunc(numeros)
+        minutos = np.round((numeros - parte_entera) * 100)
+        minutos = minutos.where(minutos < 60, minutos % 60)
+        validos = minutos >= 0 # Minutos negativos no forman una hora (NaT)
+        total_minutos = (parte_entera % 24) * 60 + minutos
+        horas[numeros.index[validos]] = (pd.Timestamp(0) + pd.to_timedelta(total_minutos[validos], unit='m')).dt.time
+        resueltas[numeros.index] = True
+
+        # Texto 'HH:MM' / 'HH:MM:SS'
+        texto = serie[categorias == 'otro'].astype(str).str.strip()
+        texto = texto[texto.str.match(self.__PATRON_HORA)]
+        if not texto.empty:
+            parseadas = pd.to_datetime(texto, format='%H:%M:%S', errors='coerce')
+            parseadas = parseadas.fillna(pd.to_datetime(texto, format='%H:%M', errors='coerce'))
+            parseadas = parseadas.dropna()
+            horas[parseadas.index] = parseadas.dt.time
+            resueltas[parseadas.index] = True
+
+        if not resueltas.all():
+            horas[~resueltas] = serie[~resueltas].apply(self.__fix_time)
+        return horas
+
+    def __normalizar_fecha(self, serie, anio_default):
+        """
+        Fecha como datetime.date. Se resuelven por columna las fechas ya leídas como fecha, los
+        números seriales de Excel y los textos DD/MM, DD/MM/YY y DD/MM/YYYY (también con '.' o '-');
+        lo que no calce (o no forme una fecha válida) pasa por __fix_fecha.
+        """
+        categorias = self.__clasificar_valores(serie)
+        fechas = pd.Series(pd.NaT, index=serie.index, dtype=object)
+        resueltas = categorias == 'nulo'
+
+        es_datetime = categorias == 'datetime'
+        if es_datetime.any():
+            fechas[es_datetime] = [valor.date() for valor in serie[es_datetime]]
+        es_date = categorias == 'date'
+        fechas[es_date] = serie[es_date]
+        resueltas |= es_datetime | es_date
+
+        # Números seriales de Excel
+        es_numero = categorias == 'numero'
+        if es_numero.any():
+            seriales = pd.to_datetime(serie[es_numero].astype(float), unit='D', origin=self.__ORIGEN_EXCEL, errors='coerce').dropna()
+            fechas[seriales.index] = seriales.dt.date
+            resueltas[seriales.index] = True
+
+        # Texto DD/MM[/AA]: se parsean sólo los valores únicos
+        es_texto = categorias == 'otro'
+        codigos, unicos = pd.factorize(serie[es_texto].astype(str))
+        texto = pd.Series(unicos, dtype=object).str.strip().str.replace('.', '/', regex=False).str.replace('-', '/', regex=False)
+        partes = texto.str.extract(self.__PATRON_FECHA).dropna(subset=[0, 1])
+        if not partes.empty:
+            anio = partes[2].astype(float).fillna(int(anio_default)).astype(int)
+            anio = anio.where(~(partes[2].notna() & (anio < 100)), anio + 2000) # "16" -> 2016
+            componentes = pd.DataFrame({'year': anio, 'month': partes[1].astype(int), 'day': partes[0].astype(int)})
+            fechas_unicas = np.full(len(texto), None, dtype=object)
+            fechas_unicas[partes.index] = pd.to_datetime(componentes, errors='coerce').dt.date.to_numpy()
+            por_fila = pd.Series(fechas_unicas[codigos], index=serie.index[es_texto])
+            por_fila = por_fila[por_fila.notna()]
+            fechas[por_fila.index] = por_fila
+            resueltas[por_fila.index] = True
+
+        if not resueltas.all():
+            fechas[~resueltas] = serie[~resueltas].apply(self.__fix_fecha, anio_default=anio_default)
+        return fechas
+
+    def __combinar_fecha_hora(self, df):
+        """Columna FECHA/HORA (Timestamp) a partir de 'Fecha' y 'Hora'; NaT si falta alguna."""
+        if "Fecha" not in df.columns or "Hora" not in df.columns:
+            return pd.Series(pd.NaT, index=df.index, dtype='datetime64[ns]')
+        validos = df["Fecha"].notna() & df["Hora"].notna()
+        texto = df.loc[validos, "Fecha"].astype(str) + " " + df.loc[validos, "Hora"].astype(str)
+
+        fecha_hora = pd.Series(pd.NaT, index=df.index, dtype='datetime64[ns]')
+        parseadas = pd.to_datetime(texto, format='%Y-%m-%d %H:%M:%S', errors='coerce')
+        fecha_hora[parseadas.index] = parseadas
+
+        # Formatos no estándar (ej. segundos con decimales): uno a uno
+        pendientes = parseadas.index[parseadas.isna()]
+        for index in pendientes:
+            try: fecha_hora[index] = pd.to_datetime(texto[index])
+            except Exception: pass
+        return fecha_hora
+
     def __guardar_csv(self, df, ruta_csv):
         """Guarda el DataFrame final en un archivo CSV."""
         self.__log(f"Guardando CSV limpio en: {ruta_csv}")
@@ -526,6 +779,19 @@ class ETLSiniestralidad():
                 f.write(f"sep={self.__CSV_SEP}\n")
                 df.to_csv(f, sep=self.__CSV_SEP, index=False, quoting=csv.QUOTE_ALL)
             self.__log(f"CSV guardado correctamente. Filas finales: {len(df)}")
+            ruta_columnar = guardar_columnar(df, ruta_csv, self.__formato_limpio)
+            if ruta_columnar:
+                self.__log(f"Copia {self.__formato_limpio} guardada en: {ruta_columnar}")
         except Exception as e:
             self.__log(f"Error al guardar CSV: {e}")
-            raise
\ No newline at end of file
+            raise
+
+    def __guardar_tablas(self, tablas, ruta_csv):
+        """
+        Guarda las tablas normalizadas ({ruta CSV: DataFrame}). Las relacionadas se escriben
+        antes que el CSV principal 'ruta_csv', que queda al final.
+        """
+        for ruta, df in tablas.items():
+            if ruta != ruta_csv:
+                self.__guardar_csv(df, ruta)
+        self.__guardar_csv(tablas[ruta_csv], ruta_csv)
\ No newline at end of file
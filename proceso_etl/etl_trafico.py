@@ -1,9 +1,12 @@
 import pandas as pd
+import numpy as np
 import re
 import os # TODO: Reemplazar librería "os" por "gestion_archivos.py" cuando tenga funcionalidad
 from pathlib import Path
 from datetime import datetime
 from config_manager import obtener_ruta
+from proceso_etl.libro_excel import LibroExcel, es_nulo
+from utils.formato_limpio import obtener_formato, guardar_columnar
 
 class ETLTrafico():
     # TODO: Mover este diccionario en otro modulo
@@ -17,12 +20,17 @@ class ETLTrafico():
         '6 BUS +2 EJES': 'Bus +2 Ejes',
         '12 SOBREDIMEN.': 'Sobredimensionado'
     }
+    # Columnas de la matriz de cada hoja: Col0, DiaRaw, Direccion y las 24 horas
+    __NUM_COLUMNAS = 27
+    __DIRECCIONES = ('ASCENDENTE', 'DESCENDENTE')
 
     def __init__(self):
         """Inicializa las rutas usando el config_manager."""
         base_limpios = obtener_ruta('ruta_csv_limpio')
         self.__ruta_limpia_base = os.path.join(base_limpios, 'Tráfico Mensual/')
         os.makedirs(self.__ruta_limpia_base, exist_ok=True)
+        # Copia columnar tipada junto al CSV (parquet/feather), según config.json
+        self.__formato_limpio = obtener_formato()
         self.__log("ETL de Tráfico inicializada.")
     
     def __log(self, msg):
@@ -31,10 +39,19 @@ class ETLTrafico():
         print(f"[{now}] [ETL Trafico] {msg}")
 
     # Método principal para la transformación
-    def procesar_archivo(self, ruta_archivo_excel):
+    def procesar_archivo(self, ruta_archivo_excel, forzar=False, libro=None, al_transformar=None):
         """
         Punto de entrada para el controlador. Procesa un único archivo de tráfico.
+        'forzar' sobrescribe el CSV limpio si ya existe (Excel re-emitido).
+        'libro' es el LibroExcel ya abierto por el controlador; si no se entrega se abre
+        uno propio que se cierra al terminar.
+        'al_transformar' (carga en línea) recibe (df, ruta_csv, guardar) en lugar de guardar aquí
+        el CSV limpio: guardar(df, ruta_csv) lo escribe cuando y donde convenga al controlador.
         """
+        if libro is None:
+            with LibroExcel(ruta_archivo_excel) as libro:
+                return self.procesar_archivo(ruta_archivo_excel, forzar, libro, al_transformar)
+
         self.__log(f"Iniciando procesamiento para: {ruta_archivo_excel}")
         nombre_base = Path(ruta_archivo_excel).stem
         anio_str = self.__extraer_anio_de_ruta(ruta_archivo_excel)
@@ -45,22 +62,27 @@ class ETLTrafico():
         os.makedirs(ruta_salida_anio, exist_ok=True)
         ruta_csv_salida = os.path.join(ruta_salida_anio, f"{nombre_base}_Limpio.csv")
 
-        if os.path.exists(ruta_csv_salida):
+        if os.path.exists(ruta_csv_salida) and not forzar:
             self.__log(f"El archivo '{nombre_base}' ya ha sido procesado. Saltando.")
             return True
 
-        if not self.__es_hoja_valida(ruta_archivo_excel):
+        if not self.__es_hoja_valida(libro):
             self.__log(f"ADVERTENCIA: El archivo '{nombre_base}' no contiene hojas de cálculo válidas. Saltando.")
             # Devolvemos True porque no es un error, simplemente no hay nada que procesar.
             return True
 
         try:
-            df_transformado = self.__transformar_excel(ruta_archivo_excel)
+            df_transformado = self.__transformar_excel(libro)
             if df_transformado.empty:
                  self.__log(f"La transformación de '{nombre_base}' no produjo datos. Saltando guardado.")
                  return True
 
-            df_transformado.to_csv(ruta_csv_salida, index=False, encoding='utf-8-sig')
+            if al_transformar is not None:
+                al_transformar(df_transformado, ruta_csv_salida, self.__guardar_csv)
+                self.__log(f"Éxito: '{nombre_base}' procesado ({len(df_transformado)} filas). Entregado para guardar en '{anio_str}'.")
+                return True
+
+            self.__guardar_csv(df_transformado, ruta_csv_salida)
             self.__log(f"Éxito: '{nombre_base}' procesado ({len(df_transformado)} filas). Guardado en '{anio_str}'.")
             return True
         except Exception as e:
@@ -81,14 +103,12 @@ class ETLTrafico():
         return hojas_validas
     
     # Método para revisar si la primera hoja es válida
-    def __es_hoja_valida(self, ruta_excel):
+    def __es_hoja_valida(self, libro):
         try:
-            engine = 'xlrd' if ruta_excel.lower().endswith('.xls') else 'openpyxl'
-            xls = pd.ExcelFile(ruta_excel, engine=engine)
-            hojas_validas = self.__filtrar_hojas_validas(xls.sheet_names)
+            hojas_validas = self.__filtrar_hojas_validas(libro.hojas)
             return len(hojas_validas) > 0
         except Exception as e:
-            self.__log(f"Error al verificar hojas en '{Path(ruta_excel).name}': {e}")
+            self.__log(f"Error al verificar hojas en '{Path(libro.ruta).name}': {e}")
             return False
     
     # Método para obtener año y mes desde el nombre del archivo
@@ -136,18 +156,23 @@ class ETLTrafico():
         nombre = nombre_hoja.strip().upper()
         return self.__CATEGORIA_VEHICULO.get(nombre, nombre_hoja.title())
     
-    # Método para la transformación en bucle
-    def __transformar_excel(self, ruta_excel):
-        """Realiza la transformación ETL principal para un archivo de tráfico."""
+    # Método para la transformación de todas las hojas
+    def __transformar_excel(self, libro):
+        """
+        Realiza la transformación ETL principal para un archivo de tráfico.
+        Las hojas de categoría comparten la matriz día × dirección × 24 horas: las que tienen la
+        misma disposición se apilan en un arreglo (categorías, filas, 24) y el formato largo sale
+        de un solo reshape, con las columnas clave repetidas por broadcast (ver __formato_largo).
+        """
+        ruta_excel = libro.ruta
         self.__log(f"Transformando archivo: {Path(ruta_excel).name}")
-        engine = 'xlrd' if ruta_excel.lower().endswith('.xls') else 'openpyxl'
         try:
-            xls = pd.ExcelFile(ruta_excel, engine=engine)
+            hojas = libro.hojas
         except Exception as e:
-             self.__log(f"Error fatal al abrir '{Path(ruta_excel).name}' (motor {engine}): {e}") # Usar __log
+             self.__log(f"Error fatal al abrir '{Path(ruta_excel).name}' (motor {libro.motor}): {e}") # Usar __log
              return None
         
-        hojas_validas = self.__filtrar_hojas_validas(xls.sheet_names)
+        hojas_validas = self.__filtrar_hojas_validas(hojas)
         orden_columnas = ['Plaza', 'Categoria', 'TipoVehiculo', 'Fecha', 'Anio', 'Mes', 'Dia', 'Hora', 'Direccion', 'Contar']
         dataframes = []
 
@@ -155,59 +180,24 @@ class ETLTrafico():
         nombre_archivo = os.path.basename(ruta_excel)
         anio, mes = self.__extraer_fecha_desde_nombre(nombre_archivo)
         plaza = self.__extraer_plaza_desde_nombre(nombre_archivo)
-        
-        for hoja in hojas_validas:
-            # Cargar desde la fila 6
-            # Asumiendo que todas las hojas de cada archivo tiene el mismo formato de la matriz
-            df = xls.parse(hoja, skiprows=5, header=None)
-            df = df.iloc[:, :27] # Sólo las primeras 27 columnas
-
-            # Renombrar columnas
-            columna_hora = [str(h) for h in range(24)]
-            df.columns = ['Col0', 'DiaRaw', 'Direccion'] + columna_hora
-
-            # Propagar día hacia abajo
-            df['Dia'] = df['DiaRaw'].ffill()
-
-            # Filtrar sólo las filas con direction válido
-            df = df[df['Direccion'].isin(['ASCENDENTE', 'DESCENDENTE'])].copy()
-
-            # Reorganizar el dataframe en filas
-            df_largo = df.melt(id_vars=['Dia', 'Direccion'], value_vars=columna_hora, var_name='Hora', value_name='Contar')
 
-            # Limpieza final
-            df_largo['Dia'] = pd.to_numeric(df_largo['Dia'], errors='coerce').fillna(-1).astype(int)
-            df_largo = df_largo[df_largo['Dia'] != -1] # Excluir días no válidas
-
-            df_largo['Hora'] = pd.to_numeric(df_largo['Hora'], errors='coerce').fillna(-1).astype(int)
-            df_largo = df_largo[df_largo['Hora'].between(0, 23)]
-
-            df_largo['Contar'] = pd.to_numeric(df_largo['Contar'], errors='coerce').fillna(0).astype(int)
-
-            df_largo['Anio'] = anio
-            df_largo['Mes'] = mes
-            df_largo['Fecha'] = pd.to_datetime({'year': df_largo['Anio'], 'month': df_largo['Mes'], 'day': df_largo['Dia']}, errors='coerce')
-
-            num_invalidas = df_largo['Fecha'].isna().sum()
-            if num_invalidas > 0:
-                self.__log(f"[{nombre_archivo} - {hoja}] Se excluyeron {num_invalidas} filas con fecha inválidas")
-
-            # Filtrar solo fechas válidas
-            df_largo = df_largo[df_largo['Fecha'].notna()]
-            
-            # Metadato de la categoría del vehículo
-            categoria = self.__traducir_categoria_vehiculo(hoja)
-            df_largo['Categoria'] = categoria
-
-            if categoria in ['Moto', 'Auto/Camioneta']:
-                tipo = 'Ligero'
-            else:
-                tipo = 'Pesado'
-            
-            df_largo['TipoVehiculo'] = tipo
+        # Leer las matrices y agrupar las hojas consecutivas con la misma disposición (días y
+        # direcciones); normalmente todas las hojas del archivo forman un único bloque
+        bloques = []
+        for hoja in hojas_validas:
+            dias, direcciones, conteos = self.__leer_hoja(libro, hoja)
+            bloque = bloques[-1] if bloques else None
+            if bloque is None or not (pd.Series(bloque['dias']).equals(pd.Series(dias)) and pd.Series(bloque['direcciones']).equals(pd.Series(direcciones))):
+                bloque = {'dias': dias, 'direcciones': direcciones, 'hojas': [], 'conteos': []}
+                bloques.append(bloque)
+            bloque['hojas'].append(hoja)
+            bloque['conteos'].append(conteos)
 
+        for bloque in bloques:
+            df_largo = self.__formato_largo(bloque, anio, mes, nombre_archivo)
+            if df_largo is None:
+                continue
             df_largo['Plaza'] = plaza
-
             dataframes.append(df_largo)
         
         # Reordenar columnas
@@ -219,14 +209,112 @@ class ETLTrafico():
         else:
             self.__log(f"No se generaron datos válidos para el archivo '{nombre_archivo}'.")
             return pd.DataFrame(columns=orden_columnas)
+
+    def __formato_largo(self, bloque, anio, mes, nombre_archivo):
+        """
+        Formato largo de un bloque de hojas con la misma disposición, en el orden de siempre:
+        por hoja, luego por hora y luego por fila de la matriz.
+        Los días y fechas se resuelven una vez por fila de la matriz (la fecha, una vez por día
+        distinto del mes) y los conteos se convierten en una sola pasada sobre el arreglo
+        (categorías, filas, 24). Devuelve None si el bloque no tiene filas válidas.
+        """
+        hojas = bloque['hojas']
+        # Día de cada fila de la matriz; se excluyen los días no válidos
+        dias = pd.to_numeric(pd.Series(bloque['dias'], dtype=object), errors='coerce').fillna(-1).astype(int)
+        validas = (dias != -1).to_numpy()
+
+        # Fecha una vez por día distinto del mes
+        df_dias = pd.DataFrame({'Dia': pd.unique(dias[validas])})
+        df_dias['Anio'] = anio
+        df_dias['Mes'] = mes
+        fechas_dia = pd.to_datetime({'year': df_dias['Anio'], 'month': df_dias['Mes'], 'day': df_dias['Dia']}, errors='coerce')
+        fechas = pd.Series(fechas_dia.to_numpy(), index=df_dias['Dia']).reindex(dias[validas]).to_numpy()
+
+        num_invalidas = int(pd.isna(fechas).sum()) * 24
+        if num_invalidas > 0:
+            for hoja in hojas:
+                self.__log(f"[{nombre_archivo} - {hoja}] Se excluyeron {num_invalidas} filas con fecha inválidas")
+
+        # Filtrar solo fechas válidas
+        filas = np.flatnonzero(validas)[pd.notna(fechas)]
+        fechas = fechas[pd.notna(fechas)]
+        num_filas = len(filas)
+        if num_filas == 0:
+            return None
+
+        # (categorías, filas, 24) -> (categorías, 24, filas): el ravel queda por hoja, hora y fila
+        conteos = np.stack(bloque['conteos'])[:, filas, :].transpose(0, 2, 1).ravel()
+        conteos = pd.to_numeric(pd.Series(conteos, dtype=object), errors='coerce').fillna(0).astype(int)
+
+        # Metadato de la categoría del vehículo
+        categorias = [self.__traducir_categoria_vehiculo(hoja) for hoja in hojas]
+        tipos = ['Ligero' if categoria in ['Moto', 'Auto/Camioneta'] else 'Pesado' for categoria in categorias]
+        por_hoja = 24 * num_filas
+        repeticiones = len(hojas) * 24
+
+        df_largo = pd.DataFrame({
+            'Dia': np.tile(dias.to_numpy()[filas], repeticiones),
+            'Direccion': np.tile(bloque['direcciones'][filas], repeticiones),
+            'Hora': np.tile(np.repeat(np.arange(24), num_filas), len(hojas)),
+            'Contar': conteos.to_numpy(),
+        })
+        df_largo['Anio'] = anio
+        df_largo['Mes'] = mes
+        df_largo['Fecha'] = np.tile(fechas, repeticiones)
+        df_largo['Categoria'] = np.repeat(np.array(categorias, dtype=object), por_hoja)
+        df_largo['TipoVehiculo'] = np.repeat(np.array(tipos, dtype=object), por_hoja)
+        return df_largo
     
+    # Método para la lectura en streaming de una hoja de categoría
+    def __leer_hoja(self, libro, hoja):
+        """
+        Recorre la matriz de la hoja fila a fila (desde la fila 6, sólo las primeras 27 columnas)
+        y guarda en arreglos NumPy preasignados únicamente las filas ASCENDENTE/DESCENDENTE,
+        con el día propagado hacia abajo. Devuelve (días, direcciones, conteos), este último
+        de forma (filas, 24), sin convertir (ver __formato_largo).
+        """
+        capacidad = 128
+        dias = np.empty(capacidad, dtype=object)
+        direcciones = np.empty(capacidad, dtype=object)
+        conteos = np.empty((capacidad, 24), dtype=object)
+        num_filas = 0
+        dia_actual = np.nan
+
+        for fila in libro.iterar_filas(hoja, desde_fila=5, max_columnas=self.__NUM_COLUMNAS):
+            if len(fila) < self.__NUM_COLUMNAS:
+                fila = list(fila) + [''] * (self.__NUM_COLUMNAS - len(fila))
+
+            # Propagar día hacia abajo
+            if not es_nulo(fila[1]):
+                dia_actual = fila[1]
+
+            # Sólo las filas con dirección válida
+            if fila[2] not in self.__DIRECCIONES:
+                continue
+
+            if num_filas == capacidad:
+                capacidad *= 2
+                dias = np.resize(dias, capacidad)
+                direcciones = np.resize(direcciones, capacidad)
+                conteos = np.resize(conteos, (capacidad, 24))
+            dias[num_filas] = dia_actual
+            direcciones[num_filas] = fila[2]
+            conteos[num_filas] = fila[3:]
+            num_filas += 1
+
+        return dias[:num_filas], direcciones[:num_filas], conteos[:num_filas]
+
+    def __guardar_csv(self, df, ruta_csv):
+        """Guarda el CSV limpio y, según config.json, su copia columnar."""
+        df.to_csv(ruta_csv, index=False, encoding='utf-8-sig')
+        guardar_columnar(df, ruta_csv, self.__formato_limpio)
+
     # Método sólo como guía de la estructura excel
     def __inspeccionar_estructura(self, ruta_excel):
         try:
-            engine = 'xlrd' if ruta_excel.lower().endswith('.xls') else 'openpyxl'
-            xls = pd.ExcelFile(ruta_excel, engine=engine)
-            hojas_validas = self.__filtrar_hojas_validas(xls.sheet_names)
-            df = xls.parse(hojas_validas[0], skiprows=5, header=None)
+            with LibroExcel(ruta_excel) as libro:
+                hojas_validas = self.__filtrar_hojas_validas(libro.hojas)
+                df = libro.leer(hojas_validas[0], skiprows=5, header=None)
             print(f"Columnas detectadas: {df.shape[1]}")
             print("Primeras 5 filas:")
             print(df.head())
@@ -1,11 +1,13 @@
 import pandas as pd
 import numpy as np # Asegurar importación de numpy
-import unicodedata
 import os
 import re
 from pathlib import Path
 from datetime import datetime
 from config_manager import obtener_ruta
+from proceso_etl.libro_excel import LibroExcel
+from proceso_etl.normalizacion_vehiculos import NormalizadorVehiculos, VALORES_A_CERO
+from utils.formato_limpio import obtener_formato, guardar_columnar
 
 class ETLVehiculos():
 
@@ -15,6 +17,14 @@ class ETLVehiculos():
         # Define la ruta base para guardar archivos limpios
         self.__ruta_limpia_base = os.path.join(base_limpios, 'Siniestralidad', 'Ficha 1')
         os.makedirs(self.__ruta_limpia_base, exist_ok=True)
+        # Copia columnar tipada junto al CSV (parquet/feather), según config.json
+        self.__formato_limpio = obtener_formato()
+        # Patente y Marca limpias por valor distinto, con caché en disco compartido entre ejecuciones
+        try:
+            ruta_cache = obtener_ruta('ruta_cache_normalizacion')
+        except KeyError:
+            ruta_cache = None # config.json sin la clave: el caché queda sólo en memoria
+        self.__normalizador = NormalizadorVehiculos(ruta_cache)
         self.__log("ETL de Vehículos (Ficha 1) inicializada.")
 
     def __log(self, msg):
@@ -22,17 +32,20 @@ class ETLVehiculos():
         now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         print(f"[{now}] [ETL Vehiculos] {msg}")
 
-    def __sin_tildes(self, txt: str):
-        if pd.isna(txt):
-            return txt
-        # Normaliza y remueve diacríticos (tildes/¨/´)
-        return unicodedata.normalize("NFKD", txt).encode("ASCII", "ignore").decode("ASCII")
-
     # --- Método público ---
-    def procesar_archivo(self, ruta_archivo_excel):
+    def procesar_archivo(self, ruta_archivo_excel, forzar=False, libro=None, al_transformar=None):
         """
         Punto de entrada para el controlador. Procesa un único archivo de vehículos.
+        'forzar' sobrescribe el CSV limpio si ya existe (Excel re-emitido).
+        'libro' es el LibroExcel ya abierto por el controlador; si no se entrega se abre
+        uno propio que se cierra al terminar.
+        'al_transformar' (carga en línea) recibe (df, ruta_csv, guardar) en lugar de guardar aquí
+        el CSV limpio: guardar(df, ruta_csv) lo escribe cuando y donde convenga al controlador.
         """
+        if libro is None:
+            with LibroExcel(ruta_archivo_excel) as libro:
+                return self.procesar_archivo(ruta_archivo_excel, forzar, libro, al_transformar)
+
         self.__log(f"Iniciando procesamiento para: {ruta_archivo_excel}")
         nombre_base = Path(ruta_archivo_excel).stem
 
@@ -46,20 +59,25 @@ class ETLVehiculos():
         os.makedirs(ruta_salida_anio, exist_ok=True) # Usa anio
         ruta_csv_salida = os.path.join(ruta_salida_anio, f"{nombre_base}_Limpio.csv") # Usa anio
 
-        if os.path.exists(ruta_csv_salida):
+        if os.path.exists(ruta_csv_salida) and not forzar:
             self.__log(f"El archivo '{nombre_base}' ya ha sido procesado en '{anio_str}'. Saltando.") # Usa anio
             return True
 
         try:
-            df_transformado = self.__transformar_excel(ruta_archivo_excel)
+            df_transformado = self.__transformar_excel(libro)
 
             # Chequear si la transformación devolvió None o un DataFrame vacío
             if df_transformado is None or df_transformado.empty:
                 self.__log(f"ADVERTENCIA: La transformación de '{nombre_base}' no produjo datos.")
                 return True # Considerar éxito parcial, no guardar
 
+            if al_transformar is not None:
+                al_transformar(df_transformado, ruta_csv_salida, self.__guardar_csv)
+                self.__log(f"Éxito: '{nombre_base}' procesado ({len(df_transformado)} filas). Entregado para guardar en '{anio_str}'.")
+                return True
+
             # Guardado del archivo
-            df_transformado.to_csv(ruta_csv_salida, index=False, encoding="utf-8-sig")
+            self.__guardar_csv(df_transformado, ruta_csv_salida)
             self.__log(f"Éxito: '{nombre_base}' procesado ({len(df_transformado)} filas). Guardado en '{anio_str}'.") # Usa anio
             return True
         except Exception as e:
@@ -67,6 +85,11 @@ class ETLVehiculos():
             raise e
 
     # --- Métodos privados ---
+    def __guardar_csv(self, df, ruta_csv):
+        """Guarda el CSV limpio y, según config.json, su copia columnar."""
+        df.to_csv(ruta_csv, index=False, encoding="utf-8-sig")
+        guardar_columnar(df, ruta_csv, self.__formato_limpio)
+
     def __extraer_anio_de_ruta(self, ruta_archivo): # Usa anio
         """Intenta extraer el anio (carpeta 'YYYY') del path del archivo."""
         try:
@@ -78,11 +101,12 @@ class ETLVehiculos():
             self.__log(f"No se pudo extraer anio de la ruta {ruta_archivo}: {e}") # Usa anio
         return None
 
-    def __transformar_excel(self, ruta_archivo):
+    def __transformar_excel(self, libro):
         """
         ETL que replica las transformaciones de Power Query para datos de vehículos,
         incorporando las nuevas funcionalidades.
         """
+        ruta_archivo = libro.ruta
         self.__log(f"Transformando '{Path(ruta_archivo).name}'...")
 
         # === 1. Extraer Año y Mes del nombre del archivo ===
@@ -98,11 +122,10 @@ class ETLVehiculos():
 
         # === 2. Leer el Excel saltando las primeras 6 filas ===
         try:
-            engine = 'xlrd' if ruta_archivo.lower().endswith('.xls') else 'openpyxl'
-            self.__log(f"Leyendo con motor {engine}...")
-            df = pd.read_excel(ruta_archivo, skiprows=6, engine=engine)
+            self.__log(f"Leyendo con motor {libro.motor}...")
+            df = libro.leer(skiprows=6)
         except Exception as e:
-             self.__log(f"Error fatal al leer '{Path(ruta_archivo).name}' (motor {engine}): {e}")
+             self.__log(f"Error fatal al leer '{Path(ruta_archivo).name}' (motor {libro.motor}): {e}")
              return None # Devolver None si falla
 
         # === 3. Renombrar columnas ===
@@ -130,8 +153,17 @@ class ETLVehiculos():
         self.__log("Eliminando filas basura (sin Patente Y sin Marca)...")
         df = df.dropna(subset=['Código Accidente', 'Patente', 'Marca'], how='all').reset_index(drop=True) # Resetear índice aquí
 
+        # === Patente y Marca: pasos 5, 9, 11, 12, 13, 16 y 17 por valor distinto (normalizacion_vehiculos) ===
+        self.__log("Normalizando Patente y Marca por valor distinto...")
+        for col in ["Patente", "Marca"]:
+            df[col] = self.__normalizador.normalizar(df[col], col)
+        try:
+            self.__normalizador.guardar()
+        except OSError as e:
+            self.__log(f"Advertencia: no se pudo guardar el caché de normalización ({e}).")
+
         # === 5. Convertir columnas a string y limpiar espacios ===
-        text_cols = list(column_renames.values()) # Usar nombres nuevos
+        text_cols = [c for c in column_renames.values() if c not in ("Patente", "Marca")] # Usar nombres nuevos
         for col in text_cols:
             if col in df.columns:
                 df[col] = df[col].astype(str).str.strip()
@@ -160,13 +192,6 @@ class ETLVehiculos():
             df = df.drop(columns=["Pista/Vía_split"]) # Eliminar columna temporal
 
 
-        # === 9. Limpiar "Patente" ===
-        if "Patente" in df.columns:
-            # Quitar guiones y espacios
-            df["Patente"] = df["Patente"].str.replace("-", "", regex=False).str.replace(" ", "", regex=False)
-            # Reemplazar 'nan' y 'None' strings con NaN real
-            df["Patente"] = df["Patente"].replace(['nan', 'None'], np.nan, regex=False)
-
         # === 10. Crear campo "ID Accidente" según cambios en Código Accidente ===
         self.__log("Generando 'ID Accidente' por cambios reales en 'Código Accidente'...")
 
@@ -206,115 +231,9 @@ class ETLVehiculos():
 
         # === 11. Reemplazar vacíos/NaN/representaciones de nulo por 0 (Numérico) ===
         self.__log("Reemplazando valores nulos/vacíos representativos por 0...")
-        valores_a_reemplazar_por_cero = [
-            "SINPATENTE", "SIN PATENTE", "No registra", "NoRegistra", "Sin datos", "Sindatos","NO REGISTRA", "NOREGISTRA",
-            "Sinantecedentes", "Sin antecedentes", "SINANTEDECENTES", "SIN ANTECEDENTES",
-            "NAN", "nan", "None", "S/I", "-", "","N°0575902","NRO", None, np.nan
-            # Añadir mas si es necesario
-        ]
-        # Aplicar a todo el DataFrame (Patente y Marca se corregirán después)
-        df = df.replace(valores_a_reemplazar_por_cero, 0)
-
-        # === 12. Reemplazar '0' en Patente/Marca por 'SIN-ANTECEDENTES' ===
-        self.__log("Estandarizando 'SIN-ANTECEDENTES' en Patente y Marca...")
-        for col in ["Patente", "Marca"]:
-            if col in df.columns:
-                # Lista de valores a reemplazar por SIN-ANTECEDENTES
-                valores_a_sin_antecedentes = ["S/PPU", "S/I", "0", 0] # Incluir 0 numérico y "0" string
-                df[col] = df[col].replace(valores_a_sin_antecedentes, "SIN-ANTECEDENTES")
-                # Asegurar que sea string y mayúsculas al final
-                df[col] = df[col].astype(str).str.upper()
-                # Limpiar posibles espacios extra introducidos
-                df[col] = df[col].str.strip()
-
-        # === 13. Limpieza avanzada de la columna Marca ===
-        if "Marca" in df.columns:
-            self.__log("Aplicando limpieza avanzada a columna Marca...")
-            # Quitar espacios internos ANTES de aplicar el diccionario
-            df["Marca"] = df["Marca"].str.replace(" ", "", regex=False)
-            
-            # Quitar tildes/diacríticos en Marca (ej.: HYUNDAÍ -> HYUNDAI)
-            df["Marca"] = df["Marca"].apply(self.__sin_tildes)
-
-            # Diccionario de correcciones
-            correcciones_marcas = {
-                 "SINANTECEDENTES":"SIN-ANTECEDENTES", "SINMARCA" : "SIN-ANTECEDENTES",
-                 "RANDON(REMOLQUE)":"RANDON", "MACK(CAMABAJA)":"MACK", # Corregido Mack
-                 "MITSUBICHI":"MITSUBISHI", "MITSUVISHI":"MITSUBISHI", "MITZUBISHI":"MITSUBISHI",
-                 "KIAMOTORS": "KIA", "KIAMOTOR": "KIA", "KÍAMOTORS": "KIA", "KIAFRONTIER" : "KIA",
-                 "CHEBROLET": "CHEVROLET", "CARROHECHIZO": "REMOLQUE", "CARRODEREMOLQUE": "REMOLQUE",
-                 "CHEROKEE": "JEEP", "INTER": "INTERNATIONAL", "MASDA": "MAZDA",
-                 "DAFCL":"DAF", "MAC":"MACK", "FOR": "FORD", "BWW": "BMW",
-                 "SAMGUN": "SAMSUNG", "TOYTA": "TOYOTA", "HYUNDAY":"HYUNDAI",
-                 "SUSUKI.":"SUZUKI", "VW": "VOLKSWAGEN", "CAWASAKI": "KAWASAKI",
-                 "WOLKSWAGEN": "VOLKSWAGEN", "GREALWALL": "GREAT-WALL", "GREATWALL": "GREAT-WALL",
-                 "GREATWAL": "GREAT-WALL", "GREATWALT": "GREAT-WALL",
-                 "THERMOKINGRAMPLA": "RAMPLA", "TERMOKINGRAMPLA": "RAMPLA",
-                 "TERMOKINRAMPLA": "RAMPLA", "MERCEDEZ": "MERCEDES-BENZ",
-                 "MERCEDES": "MERCEDES-BENZ", "MERCEDESBENZ": "MERCEDES-BENZ",
-                 "MERCEDEZBENZ": "MERCEDES-BENZ", "PEUGEOTPARTNER":"PEUGEOT",
-                 "HARLEYDAVIDSON": "HARLEY-DAVIDSON",
-                 "MORRIS GARAGE": "MORRIS-GARAGE",
-                 "MORRISGARAGE": "MORRIS-GARAGE",
-                 "MITSUBICHIMONTERO":"MITSUBISHI", "HYUNDAI.": "HYUNDAI",
-                 "CHEVROLET.": "CHEVROLET", "SUZUKI.": "SUZUKI", "KIA.": "KIA",
-                 "PEUGEOT.": "PEUGEOT", "NISSAM":"NISSAN", "NISAN":"NISSAN",
-                 "NISSNA":"NISSAN", "NISSSAN":"NISSAN", "TOYOTTA":"TOYOTA",
-                 "TOYOTAYARIS":"TOYOTA", "HONDA.":"HONDA", "HODA":"HONDA",
-                 "HYNDAI":"HYUNDAI", "HYUDAI":"HYUNDAI", "HYUDAHI":"HYUNDAI",
-                 "HYUNDAIACCENT":"HYUNDAI", "ISUZU.":"ISUZU", "DAIHATSU.":"DAIHATSU",
-                 "DAEWOO.":"DAEWOO", "DAEWU":"DAEWOO", "DODGE.":"DODGE", "JAC.":"JAC",
-                 "JEEP.":"JEEP", "JPE":"JEEP", "JEEPCHEROKEE":"JEEP-CHEROKEE",
-                 "RENAULT.":"RENAULT", "RENO":"RENAULT", "RENAUL":"RENAULT",
-                 "REANULT":"RENAULT", "FIAT.":"FIAT", "FIA":"FIAT", "FOD":"FORD",
-                 "FORDMOTOR":"FORD", "FORD.":"FORD", "CHEVROLE":"CHEVROLET",
-                 "CHEVORLET":"CHEVROLET", "CHEVROLETE":"CHEVROLET",
-                 "CHEVROLETSAIL":"CHEVROLET-SAIL", "SUZUK":"SUZUKI", "SUSUKI":"SUZUKI",
-                 "SUZIKI":"SUZUKI", "MITSUBI":"MITSUBISHI", "PEUJEOT":"PEUGEOT",
-                 "VOLSWAGEN":"VOLKSWAGEN", "VOLKS":"VOLKSWAGEN", "VOLV":"VOLVO",
-                 "VOLV.":"VOLVO", "VOLVO.":"VOLVO", 
-                 "FREIGTHLINER": "FREIGHTLINER", "FREIGTLINER": "FREIGHTLINER",
-                 "FREIGTLINER.": "FREIGHTLINER", "FREIGHTLINER.": "FREIGHTLINER",
-                 "FORDD":"FORD","OXFORD":"FORD", "VOLKWAGEN":"VOLKSWAGEN", "VOLKSAWAGEN":"VOLKSWAGEN",
-                 "HYUNDAYGETZ":"HYUNDAI", "HYUNDAPORTER":"HYUNDAI",
-                 "SUZUKY": "SUZUKI", "ZUZUKI": "SUZUKI", "SUSUKY": "SUZUKI",
-                 "ZUBARU": "SUBARU", "SAMSUM": "SAMSUNG","SAMNSUNG": "SAMSUNG",
-                 "GRANCHEROKEE": "JEEP", "GRANDCHEROKEE": "JEEP",
-                 "NOREGISTRA":"SIN-ANTECEDENTES",
-                 "INO":"HINO", "GACGONOW": "GAC-GONOW", "SSANYONG": "SSANGYONG","SSAINGYONG":"SSANGYONG",
-                 "NISSANNAVARA":"NISSAN", "NISSANCOROLA":"NISSAN",
-                 "SCANNIA": "SCANIA", "SECANIA": "SCANIA", "SCANIA.": "SCANIA", 
-                 "DAEWO": "DAEWOO", "TOYOTAHILUX":"TOYOTA", "TOYOTARUNNER":"TOYOTA",
-                 "TOYOTAURBAN": "TOYOTA", "MERCEDESACTRON":"MERCEDES-BENZ","MERCEDESACTROS":"MERCEDES-BENZ",
-                 "DOGDE": "DODGE","BRILLANCE":"BRILLIANCE", "DUCATE": "DUCATI", "FREIGHLINER":"FREIGHTLINER",
-                 "FORDCARGO":"FORD", "FORDFIESTA":"FORD", "FORDRANGER":"FORD",
-                 "SINANTEDECENTES":"SIN-ANTECEDENTES", "HIARIO": "SIN-ANTECEDENTES", "HILUX":"TOYOTA",
-                 "HIUNDAYELANTRA":"HYUNDAI", "HIUNDAI": "HYUNDAI","HYNDAY": "HYUNDAI",
-                 "KEMBORT": "KENWORTH","KENWORK":"KENWORTH","KIACERATO":"KIA","KIAMORNING":"KIA",
-                 "KIARIO":"KIA","KIASOLUTO": "KIA","KIASPORTAGE": "KIA","MAXUX":"MAXUS",
-                 "MISUBISHI": "MITSUBISHI", "MITSHUBISHI": "MITSUBISHI","CHEVROLETAVEOLS1.4 ":"CHEVROLET",
-                 "MINICOOPER": "MINI", "MINICOOOPER": "MINI", "MINICOOOPER.": "MINI",
-                 "OPELCORSA":"OPEL", "OPELCORSAS":"OPEL", "OPELCORSAS.":"OPEL",
-                 "PEUGOT": "PEUGEOT", "PEUGOT.":"PEUGEOT", "PEUGEOT.":"PEUGEOT",
-                 "PORSHE":"PORSCHE", "RANDOMRAMPLA": "RANDON", "RANDONREMOLQUE": "RANDON", "RENEGATE": "JEEP",
-                 "SANGYONG": "SSANGYONG", "SANSJONG": "SSANGYONG", "SORENTO": "KIA", "STATIONWAGON": "SIN-ANTECEDENTES",
-                 "TOYOYA":"TOYOTA", "TSR": "ZENVO", "WOKSWAGEN": "VOLKSWAGEN", "WOLSVAGEN": "VOLKSWAGEN", 
-                 "ZNADONGFENG": "DONGFENG", "CHEVY": "CHEVROLET", "FORESTER": "SUBARU",
-                 "FRONTIER": "NISSAN", "FVR": "CHEVROLET", "GOREN": "GOREN", "GRAND-CHEROKEE": "JEEP",
-                 "HIUNDAY": "HYUNDAI", "HOMAN": "SINOTRUK", "OMAN": "SINOTRUK", "KENWOOD": "KENWORTH",
-                 "KONECT": "BRILLIANCE",  "MG": "MORRIS-GARAGE", "NAVARA": "NISSAN",
-                 "OPELL": "OPEL", "OOPEL": "OPEL", "PULSAR": "BAJAJ", "RENEGADE": "JEEP", "SPRINTER": "MERCEDES-BENZ",
-                 "KGM": "SSANGYONG", "STATION-WAGON": "SIN-ANTECEDENTES", "TROOPERS": "ISUZU", "TROOPER": "ISUZU",
-                 "ZENVOTSR": "ZENVO", "ZUMI": "SIN-ANTECEDENTES", "PUGEOT": "PEUGEOT", "BENZ": "MERCEDES-BENZ",
-                 "SINOTRUKHOMAN": "SINOTRUK", "SINOTRUKOMAN": "SINOTRUK", "NISSANMP300": "NISSAN",
-                 "HYUNDAITUCSON":"HYUNDAI", "ZX": "ZX-AUTO", "ZXAUTO": "ZX-AUTO",
-                 #"PÈUGEOT": "PEUGEOT",
-            }
-            # Aplicar reemplazos (solo si la columna existe)
-            if "Marca" in df.columns:
-                df["Marca"] = df["Marca"].replace(correcciones_marcas)
-                # Asegurar mayúsculas al final
-                df["Marca"] = df["Marca"].astype(str).str.upper()
+        # Aplicar a todo el DataFrame salvo Patente y Marca (ya normalizadas)
+        otras_cols = [c for c in df.columns if c not in ("Patente", "Marca")]
+        df[otras_cols] = df[otras_cols].replace(VALORES_A_CERO, 0)
 
         # === 14. ELIMINAR FILAS FANTASMAS ===
         df = df.dropna(how="all")
@@ -327,37 +246,4 @@ class ETLVehiculos():
                 df[col] = pd.to_numeric(df[col], errors="coerce").fillna(0).astype(int)
 
 
-        # === 16. REFORZANDO LA UNIFICACIÓN FINAL DE PATENTE Y MARCA ===
-        self.__log("Aplicando unificación final en Patente y Marca...")
-
-        # Listado de valores que deben convertirse a SIN-ANTECEDENTES
-        valores_invalidos_global = [
-            "-", "SINANTECEDENTES", "SINANTECEDENTE", "SINPPU", "SINPATENTE", "SINANTEDECENTES",
-            "SINDATOS", "DESCONOCIDA", "N°0575902", "N°", "NRO", "NONE",
-            "0", 0, "", None, np.nan
-        ]
-
-        for col in ["Patente", "Marca"]:
-            if col in df.columns:
-                df[col] = df[col].astype(str).str.upper().str.strip()
-
-                # Remove punctuation and weird characters
-                df[col] = df[col].str.replace(r"[^A-Z0-9\-]", "", regex=True)
-
-                # Convert patterns like SINPATENTE, SINPU, etc → SIN-ANTECEDENTES
-                df[col] = df[col].replace(valores_invalidos_global, "SIN-ANTECEDENTES")
-
-                # Cualquier valor con longitud menor a 2 → lo consideramos inválido y lo pasamos a SIN-ANTECEDENTES
-                df.loc[df[col].str.len() < 2, col] = "SIN-ANTECEDENTES"
-
-                # Si la marca contiene números → probablemente es error → SIN-ANTECEDENTES
-                df.loc[df["Marca"].str.contains(r"\d", regex=True), "Marca"] = "SIN-ANTECEDENTES"
-
-        # === 17. Correcciones de marcas muy largas como CHEVROLETAVEOLS1.4 -> CHEVROLET ===
-        df["Marca"] = df["Marca"].str.replace(r"^(CHEVROLET).*", "CHEVROLET", regex=True)
-        df["Marca"] = df["Marca"].str.replace(r"^(MERCEDESBENZ).*", "MERCEDES-BENZ", regex=True)
-        df["Marca"] = df["Marca"].str.replace(r"^(HYUNDAI).*", "HYUNDAI", regex=True)
-        df["Marca"] = df["Marca"].str.replace(r"^(SUZUKI).*", "SUZUKI", regex=True)
-
-
         return df
\ No newline at end of file
@@ -0,0 +1,187 @@
+import os
+import math
+from datetime import date, datetime, timedelta
+import pandas as pd
+from pandas.io.parsers import TextParser
+from openpyxl.cell.cell import ERROR_CODES
+from config_manager import obtener_opcion
+from utils.formato_limpio import VALORES_NULOS
+
+# Motor de lectura por tipo de archivo ('motores_excel' en config.json, ej. {"xls": "calamine",
+# "xlsx": "calamine"}). 'calamine' (python-calamine, escrito en Rust) es el preferido; si no está
+# instalado, o no puede abrir el archivo, se usa el motor de siempre del tipo.
+MOTOR_CALAMINE = 'calamine'
+MOTORES_POR_DEFECTO = {
+    'xls': 'xlrd',
+    'xlsx': 'openpyxl',
+}
+
+def calamine_disponible():
+    try:
+        import python_calamine # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+def tipo_excel(ruta_excel):
+    """Tipo de archivo para 'motores_excel': 'xls' o 'xlsx' (el resto de extensiones)."""
+    return 'xls' if str(ruta_excel).lower().endswith('.xls') else 'xlsx'
+
+def motor_excel(ruta_excel, config=None):
+    """
+    Motor de pandas para el archivo según 'motores_excel' de config.json: 'calamine' (por
+    defecto) si está instalado o, si no, el de siempre ('xlrd' para .xls, 'openpyxl' para el resto).
+    """
+    tipo = tipo_excel(ruta_excel)
+    motores = obtener_opcion('motores_excel', {}, config)
+    motor = str((motores or {}).get(tipo, MOTOR_CALAMINE)).strip().lower()
+    if motor == MOTOR_CALAMINE and calamine_disponible():
+        return MOTOR_CALAMINE
+    if motor not in (MOTOR_CALAMINE, MOTORES_POR_DEFECTO[tipo]):
+        print(f"Advertencia: motor '{motor}' no reconocido para archivos {tipo}. Se usará {MOTORES_POR_DEFECTO[tipo]}.")
+    return MOTORES_POR_DEFECTO[tipo]
+
+def valor_calamine(valor):
+    """
+    Valor de una celda leída directamente con python-calamine, convertido como lo hace
+    pd.read_excel(engine='calamine') (y luego LibroExcel.filas()): enteros sin decimales como
+    int, fechas como datetime y duraciones como pd.Timedelta.
+    """
+    if isinstance(valor, float):
+        entero = int(valor) if math.isfinite(valor) else None
+        return entero if entero == valor else valor
+    if isinstance(valor, date) and not isinstance(valor, datetime):
+        return datetime(valor.year, valor.month, valor.day)
+    if isinstance(valor, timedelta):
+        return pd.Timedelta(valor)
+    return valor
+
+def es_nulo(valor):
+    """True si pd.read_excel leería la celda como nulo (vacía, error de Excel o texto de VALORES_NULOS)."""
+    if valor is None:
+        return True
+    if isinstance(valor, float):
+        return math.isnan(valor)
+    return isinstance(valor, str) and valor in VALORES_NULOS
+
+class LibroExcel():
+    """
+    Libro Excel abierto una sola vez por archivo, compartido entre la detección del tipo
+    (deteccion_auto) y la transformación de las clases ETL:
+    - el archivo se abre al primer uso con el motor de motor_excel() (openpyxl lo abre pandas en
+      modo sólo lectura); si calamine falla se vuelve a abrir con el motor de siempre,
+    - cada hoja se lee una sola vez como filas crudas (sin conversión de nulos) y queda en caché,
+    - leer() arma el DataFrame sobre esas filas con las mismas reglas que pd.read_excel
+      (encabezado, skiprows, valores nulos e inferencia de tipos), sin volver al archivo,
+    - iterar_filas() recorre una hoja fila a fila (openpyxl o calamine) sin armar DataFrame ni caché,
+    - cerrar() (o salir del bloque 'with') cierra el archivo y libera las hojas de memoria.
+    """
+    def __init__(self, ruta_excel, config=None):
+        self.ruta = ruta_excel
+        self.motor = motor_excel(ruta_excel, config)
+        self.__excel = None
+        self.__filas = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.cerrar()
+        return False
+
+    @property
+    def hojas(self):
+        """Nombres de las hojas del libro."""
+        return self.__abrir().sheet_names
+
+    def filas(self, hoja=0):
+        """
+        Filas crudas de la hoja (nombre o posición): listas de valores tal como los entrega
+        el motor, con '' en las celdas vacías. Se leen del archivo sólo la primera vez.
+        """
+        nombre_hoja = self.hojas[hoja] if isinstance(hoja, int) else hoja
+        if nombre_hoja not in self.__filas:
+            try:
+                df_crudo = self.__abrir().parse(nombre_hoja, header=None, dtype=object, na_filter=False)
+            except Exception as e:
+                if self.motor != MOTOR_CALAMINE:
+                    raise
+                self.__usar_respaldo(e)
+                return self.filas(nombre_hoja)
+            filas = df_crudo.values.tolist()
+            if self.motor == MOTOR_CALAMINE:
+                # calamine entrega las fechas como Timestamp; openpyxl y xlrd, como datetime
+                filas = [[valor.to_pydatetime() if isinstance(valor, pd.Timestamp) else valor for valor in fila]
+                         for fila in filas]
+            self.__filas[nombre_hoja] = filas
+        return self.__filas[nombre_hoja]
+
+    def leer(self, hoja=0, header=0, nrows=None, **kwargs):
+        """Equivalente a pd.read_excel(ruta, sheet_name=hoja, header=header, nrows=nrows, **kwargs)."""
+        filas = self.filas(hoja)
+        if not filas:
+            return pd.DataFrame()
+        return TextParser(filas, header=header, **kwargs).read(nrows)
+
+    def iterar_filas(self, hoja, desde_fila=0, max_columnas=None):
+        """
+        Recorre las filas crudas de la hoja desde 'desde_fila' (base 0) sin armar un DataFrame.
+        Con openpyxl la hoja se lee en streaming (modo sólo lectura, sólo las primeras
+        'max_columnas' columnas) y con calamine se recorre la hoja que mantiene calamine (en
+        Rust, sin pasarla entera a objetos de Python); en ambos casos no queda en caché. Si la
+        hoja ya está en caché, o el motor es xlrd, se recorren las filas en caché. Las filas
+        llegan con los mismos valores que filas(), hasta 'max_columnas' columnas, con '' en
+        las celdas vacías y NaN (openpyxl) o '' (calamine) en los errores de Excel.
+        """
+        nombre_hoja = self.hojas[hoja] if isinstance(hoja, int) else hoja
+        if nombre_hoja in self.__filas or self.motor not in ('openpyxl', MOTOR_CALAMINE):
+            for fila in self.filas(nombre_hoja)[desde_fila:]:
+                yield fila[:max_columnas]
+            return
+
+        if self.motor == MOTOR_CALAMINE:
+            try:
+                hoja_calamine = self.__abrir().book.get_sheet_by_name(nombre_hoja)
+            except Exception as e:
+                self.__usar_respaldo(e)
+                yield from self.iterar_filas(nombre_hoja, desde_fila, max_columnas)
+                return
+            # iter_rows parte en la primera columna con datos: se rellena hasta la columna A
+            relleno = [''] * (hoja_calamine.start[1] if hoja_calamine.start else 0)
+            for numero, fila in enumerate(hoja_calamine.iter_rows()):
+                if numero >= desde_fila:
+                    yield [valor_calamine(valor) for valor in (relleno + fila)[:max_columnas]]
+            return
+
+        hoja_excel = self.__abrir().book[nombre_hoja]
+        for fila in hoja_excel.iter_rows(min_row=desde_fila + 1, max_col=max_columnas, values_only=True):
+            yield ['' if valor is None else math.nan if isinstance(valor, str) and valor in ERROR_CODES else valor
+                   for valor in fila]
+
+    def cerrar(self):
+        """Cierra el archivo y descarta las hojas en caché."""
+        if self.__excel is not None:
+            self.__excel.close()
+            self.__excel = None
+        self.__filas.clear()
+
+    # --- Métodos privados ---
+    def __abrir(self):
+        if self.__excel is None:
+            try:
+                self.__excel = pd.ExcelFile(self.ruta, engine=self.motor)
+            except Exception as e:
+                if self.motor != MOTOR_CALAMINE:
+                    raise
+                self.__usar_respaldo(e)
+                return self.__abrir()
+        return self.__excel
+
+    def __usar_respaldo(self, error):
+        """Pasa al motor de siempre del tipo de archivo cuando calamine no puede leerlo."""
+        motor = MOTORES_POR_DEFECTO[tipo_excel(self.ruta)]
+        print(f"Advertencia: calamine no pudo leer '{os.path.basename(self.ruta)}' ({error}). Se usará {motor}.")
+        if self.__excel is not None:
+            self.__excel.close()
+            self.__excel = None
+        self.motor = motor
@@ -0,0 +1,256 @@
+import os
+import json
+import hashlib
+import tempfile
+import unicodedata
+import numpy as np
+import pandas as pd
+
+# --- Reglas de limpieza de Patente y Marca (Ficha 1) ---
+# El resultado de cada celda depende sólo de su propio texto (str del valor leído), así que la
+# cadena de reglas se aplica una vez por valor distinto y se guarda en un caché en disco.
+
+# Valores que se reemplazan por 0 (paso 11 de ETLVehiculos) y luego pasan a SIN-ANTECEDENTES
+VALORES_A_CERO = [
+    "SINPATENTE", "SIN PATENTE", "No registra", "NoRegistra", "Sin datos", "Sindatos","NO REGISTRA", "NOREGISTRA",
+    "Sinantecedentes", "Sin antecedentes", "SINANTEDECENTES", "SIN ANTECEDENTES",
+    "NAN", "nan", "None", "S/I", "-", "","N°0575902","NRO", None, np.nan
+    # Añadir mas si es necesario
+]
+
+# Valores a reemplazar por SIN-ANTECEDENTES (incluye 0 numérico y "0" string)
+VALORES_A_SIN_ANTECEDENTES = ["S/PPU", "S/I", "0", 0]
+
+# Diccionario de correcciones de Marca (sin espacios internos ni tildes)
+CORRECCIONES_MARCAS = {
+     "SINANTECEDENTES":"SIN-ANTECEDENTES", "SINMARCA" : "SIN-ANTECEDENTES",
+     "RANDON(REMOLQUE)":"RANDON", "MACK(CAMABAJA)":"MACK", # Corregido Mack
+     "MITSUBICHI":"MITSUBISHI", "MITSUVISHI":"MITSUBISHI", "MITZUBISHI":"MITSUBISHI",
+     "KIAMOTORS": "KIA", "KIAMOTOR": "KIA", "KÍAMOTORS": "KIA", "KIAFRONTIER" : "KIA",
+     "CHEBROLET": "CHEVROLET", "CARROHECHIZO": "REMOLQUE", "CARRODEREMOLQUE": "REMOLQUE",
+     "CHEROKEE": "JEEP", "INTER": "INTERNATIONAL", "MASDA": "MAZDA",
+     "DAFCL":"DAF", "MAC":"MACK", "FOR": "FORD", "BWW": "BMW",
+     "SAMGUN": "SAMSUNG", "TOYTA": "TOYOTA", "HYUNDAY":"HYUNDAI",
+     "SUSUKI.":"SUZUKI", "VW": "VOLKSWAGEN", "CAWASAKI": "KAWASAKI",
+     "WOLKSWAGEN": "VOLKSWAGEN", "GREALWALL": "GREAT-WALL", "GREATWALL": "GREAT-WALL",
+     "GREATWAL": "GREAT-WALL", "GREATWALT": "GREAT-WALL",
+     "THERMOKINGRAMPLA": "RAMPLA", "TERMOKINGRAMPLA": "RAMPLA",
+     "TERMOKINRAMPLA": "RAMPLA", "MERCEDEZ": "MERCEDES-BENZ",
+     "MERCEDES": "MERCEDES-BENZ", "MERCEDESBENZ": "MERCEDES-BENZ",
+     "MERCEDEZBENZ": "MERCEDES-BENZ", "PEUGEOTPARTNER":"PEUGEOT",
+     "HARLEYDAVIDSON": "HARLEY-DAVIDSON",
+     "MORRIS GARAGE": "MORRIS-GARAGE",
+     "MORRISGARAGE": "MORRIS-GARAGE",
+     "MITSUBICHIMONTERO":"MITSUBISHI", "HYUNDAI.": "HYUNDAI",
+     "CHEVROLET.": "CHEVROLET", "SUZUKI.": "SUZUKI", "KIA.": "KIA",
+     "PEUGEOT.": "PEUGEOT", "NISSAM":"NISSAN", "NISAN":"NISSAN",
+     "NISSNA":"NISSAN", "NISSSAN":"NISSAN", "TOYOTTA":"TOYOTA",
+     "TOYOTAYARIS":"TOYOTA", "HONDA.":"HONDA", "HODA":"HONDA",
+     "HYNDAI":"HYUNDAI", "HYUDAI":"HYUNDAI", "HYUDAHI":"HYUNDAI",
+     "HYUNDAIACCENT":"HYUNDAI", "ISUZU.":"ISUZU", "DAIHATSU.":"DAIHATSU",
+     "DAEWOO.":"DAEWOO", "DAEWU":"DAEWOO", "DODGE.":"DODGE", "JAC.":"JAC",
+     "JEEP.":"JEEP", "JPE":"JEEP", "JEEPCHEROKEE":"JEEP-CHEROKEE",
+     "RENAULT.":"RENAULT", "RENO":"RENAULT", "RENAUL":"RENAULT",
+     "REANULT":"RENAULT", "FIAT.":"FIAT", "FIA":"FIAT", "FOD":"FORD",
+     "FORDMOTOR":"FORD", "FORD.":"FORD", "CHEVROLE":"CHEVROLET",
+     "CHEVORLET":"CHEVROLET", "CHEVROLETE":"CHEVROLET",
+     "CHEVROLETSAIL":"CHEVROLET-SAIL", "SUZUK":"SUZUKI", "SUSUKI":"SUZUKI",
+     "SUZIKI":"SUZUKI", "MITSUBI":"MITSUBISHI", "PEUJEOT":"PEUGEOT",
+     "VOLSWAGEN":"VOLKSWAGEN", "VOLKS":"VOLKSWAGEN", "VOLV":"VOLVO",
+     "VOLV.":"VOLVO", "VOLVO.":"VOLVO",
+     "FREIGTHLINER": "FREIGHTLINER", "FREIGTLINER": "FREIGHTLINER",
+     "FREIGTLINER.": "FREIGHTLINER", "FREIGHTLINER.": "FREIGHTLINER",
+     "FORDD":"FORD","OXFORD":"FORD", "VOLKWAGEN":"VOLKSWAGEN", "VOLKSAWAGEN":"VOLKSWAGEN",
+     "HYUNDAYGETZ":"HYUNDAI", "HYUNDAPORTER":"HYUNDAI",
+     "SUZUKY": "SUZUKI", "ZUZUKI": "SUZUKI", "SUSUKY": "SUZUKI",
+     "ZUBARU": "SUBARU", "SAMSUM": "SAMSUNG","SAMNSUNG": "SAMSUNG",
+     "GRANCHEROKEE": "JEEP", "GRANDCHEROKEE": "JEEP",
+     "NOREGISTRA":"SIN-ANTECEDENTES",
+     "INO":"HINO", "GACGONOW": "GAC-GONOW", "SSANYONG": "SSANGYONG","SSAINGYONG":"SSANGYONG",
+     "NISSANNAVARA":"NISSAN", "NISSANCOROLA":"NISSAN",
+     "SCANNIA": "SCANIA", "SECANIA": "SCANIA", "SCANIA.": "SCANIA",
+     "DAEWO": "DAEWOO", "TOYOTAHILUX":"TOYOTA", "TOYOTARUNNER":"TOYOTA",
+     "TOYOTAURBAN": "TOYOTA", "MERCEDESACTRON":"MERCEDES-BENZ","MERCEDESACTROS":"MERCEDES-BENZ",
+     "DOGDE": "DODGE","BRILLANCE":"BRILLIANCE", "DUCATE": "DUCATI", "FREIGHLINER":"FREIGHTLINER",
+     "FORDCARGO":"FORD", "FORDFIESTA":"FORD", "FORDRANGER":"FORD",
+     "SINANTEDECENTES":"SIN-ANTECEDENTES", "HIARIO": "SIN-ANTECEDENTES", "HILUX":"TOYOTA",
+     "HIUNDAYELANTRA":"HYUNDAI", "HIUNDAI": "HYUNDAI","HYNDAY": "HYUNDAI",
+     "KEMBORT": "KENWORTH","KENWORK":"KENWORTH","KIACERATO":"KIA","KIAMORNING":"KIA",
+     "KIARIO":"KIA","KIASOLUTO": "KIA","KIASPORTAGE": "KIA","MAXUX":"MAXUS",
+     "MISUBISHI": "MITSUBISHI", "MITSHUBISHI": "MITSUBISHI","CHEVROLETAVEOLS1.4 ":"CHEVROLET",
+     "MINICOOPER": "MINI", "MINICOOOPER": "MINI", "MINICOOOPER.": "MINI",
+     "OPELCORSA":"OPEL", "OPELCORSAS":"OPEL", "OPELCORSAS.":"OPEL",
+     "PEUGOT": "PEUGEOT", "PEUGOT.":"PEUGEOT", "PEUGEOT.":"PEUGEOT",
+     "PORSHE":"PORSCHE", "RANDOMRAMPLA": "RANDON", "RANDONREMOLQUE": "RANDON", "RENEGATE": "JEEP",
+     "SANGYONG": "SSANGYONG", "SANSJONG": "SSANGYONG", "SORENTO": "KIA", "STATIONWAGON": "SIN-ANTECEDENTES",
+     "TOYOYA":"TOYOTA", "TSR": "ZENVO", "WOKSWAGEN": "VOLKSWAGEN", "WOLSVAGEN": "VOLKSWAGEN",
+     "ZNADONGFENG": "DONGFENG", "CHEVY": "CHEVROLET", "FORESTER": "SUBARU",
+     "FRONTIER": "NISSAN", "FVR": "CHEVROLET", "GOREN": "GOREN", "GRAND-CHEROKEE": "JEEP",
+     "HIUNDAY": "HYUNDAI", "HOMAN": "SINOTRUK", "OMAN": "SINOTRUK", "KENWOOD": "KENWORTH",
+     "KONECT": "BRILLIANCE",  "MG": "MORRIS-GARAGE", "NAVARA": "NISSAN",
+     "OPELL": "OPEL", "OOPEL": "OPEL", "PULSAR": "BAJAJ", "RENEGADE": "JEEP", "SPRINTER": "MERCEDES-BENZ",
+     "KGM": "SSANGYONG", "STATION-WAGON": "SIN-ANTECEDENTES", "TROOPERS": "ISUZU", "TROOPER": "ISUZU",
+     "ZENVOTSR": "ZENVO", "ZUMI": "SIN-ANTECEDENTES", "PUGEOT": "PEUGEOT", "BENZ": "MERCEDES-BENZ",
+     "SINOTRUKHOMAN": "SINOTRUK", "SINOTRUKOMAN": "SINOTRUK", "NISSANMP300": "NISSAN",
+     "HYUNDAITUCSON":"HYUNDAI", "ZX": "ZX-AUTO", "ZXAUTO": "ZX-AUTO",
+     #"PÈUGEOT": "PEUGEOT",
+}
+
+# Listado de valores que deben convertirse a SIN-ANTECEDENTES (unificación final)
+VALORES_INVALIDOS_GLOBAL = [
+    "-", "SINANTECEDENTES", "SINANTECEDENTE", "SINPPU", "SINPATENTE", "SINANTEDECENTES",
+    "SINDATOS", "DESCONOCIDA", "N°0575902", "N°", "NRO", "NONE",
+    "0", 0, "", None, np.nan
+]
+
+# Marcas muy largas como CHEVROLETAVEOLS1.4 -> CHEVROLET (patrón, reemplazo)
+PREFIJOS_MARCAS = [
+    (r"^(CHEVROLET).*", "CHEVROLET"),
+    (r"^(MERCEDESBENZ).*", "MERCEDES-BENZ"),
+    (r"^(HYUNDAI).*", "HYUNDAI"),
+    (r"^(SUZUKI).*", "SUZUKI"),
+]
+
+# Subir al cambiar las reglas de forma que no se note en las tablas de arriba (ej. el orden de la cadena)
+VERSION_REGLAS = 1
+
+def sin_tildes(txt):
+    if pd.isna(txt):
+        return txt
+    # Normaliza y remueve diacríticos (tildes/¨/´)
+    return unicodedata.normalize("NFKD", txt).encode("ASCII", "ignore").decode("ASCII")
+
+# --- Cadenas de reglas (sobre los valores distintos de la columna) ---
+# Reciben los textos tal como quedan tras astype(str) y aplican, en el mismo orden, los pasos
+# de ETLVehiculos.__transformar_excel. La serie se mantiene como object: con pocos valores
+# (ej. sólo 'nan') replace() la convertiría a float y .str dejaría de funcionar.
+
+def _texto_o_nulo(serie):
+    """Paso 5: quitar espacios y dejar 'nan', 'None' y '' como nulo."""
+    serie = serie.str.strip()
+    return serie.replace(['nan', 'None', ''], np.nan, regex=False).astype(object)
+
+def _sin_antecedentes(serie):
+    """Pasos 11 y 12: valores nulos o representativos de nulo -> SIN-ANTECEDENTES, en mayúsculas."""
+    serie = serie.replace(VALORES_A_CERO, 0)
+    serie = serie.replace(VALORES_A_SIN_ANTECEDENTES, "SIN-ANTECEDENTES")
+    return serie.astype(str).str.upper().str.strip()
+
+def _unificar(serie):
+    """Paso 16: sólo A-Z, 0-9 y '-', valores inválidos o de menos de 2 caracteres -> SIN-ANTECEDENTES."""
+    serie = serie.astype(str).str.upper().str.strip()
+    serie = serie.str.replace(r"[^A-Z0-9\-]", "", regex=True)
+    serie = serie.replace(VALORES_INVALIDOS_GLOBAL, "SIN-ANTECEDENTES")
+    serie.loc[serie.str.len() < 2] = "SIN-ANTECEDENTES"
+    return serie
+
+def _marca_con_numeros(serie):
+    """Si la marca contiene números -> probablemente es error -> SIN-ANTECEDENTES."""
+    serie.loc[serie.str.contains(r"\d", regex=True)] = "SIN-ANTECEDENTES"
+    return serie
+
+def cadena_patente(textos):
+    serie = _texto_o_nulo(textos)
+    # Paso 9: quitar guiones y espacios
+    serie = serie.str.replace("-", "", regex=False).str.replace(" ", "", regex=False)
+    serie = serie.replace(['nan', 'None'], np.nan, regex=False).astype(object)
+    serie = _sin_antecedentes(serie)
+    return _unificar(serie)
+
+def cadena_marca(textos):
+    serie = _sin_antecedentes(_texto_o_nulo(textos))
+    # Paso 13: sin espacios internos ni tildes, diccionario de correcciones
+    serie = serie.str.replace(" ", "", regex=False)
+    serie = serie.apply(sin_tildes)
+    serie = serie.replace(CORRECCIONES_MARCAS)
+    serie = serie.astype(str).str.upper()
+    # Paso 16 (el control de números corre también al unificar Patente, antes que el de Marca)
+    serie = _marca_con_numeros(serie)
+    serie = _marca_con_numeros(_unificar(serie))
+    # Paso 17
+    for patron, reemplazo in PREFIJOS_MARCAS:
+        serie = serie.str.replace(patron, reemplazo, regex=True)
+    return serie
+
+CADENAS = {
+    'Patente': cadena_patente,
+    'Marca': cadena_marca,
+}
+
+def huella_reglas():
+    """Hash de las reglas y de la versión de pandas: si cambian, el caché en disco se descarta."""
+    reglas = [VERSION_REGLAS, pd.__version__, VALORES_A_CERO, VALORES_A_SIN_ANTECEDENTES,
+              sorted(CORRECCIONES_MARCAS.items()), VALORES_INVALIDOS_GLOBAL, PREFIJOS_MARCAS]
+    return hashlib.blake2b(json.dumps(reglas, default=repr).encode('utf-8'), digest_size=16).hexdigest()
+
+class NormalizadorVehiculos():
+    """
+    Limpia Patente y Marca aplicando la cadena de reglas una sola vez por valor distinto
+    (cientos de marcas frente a decenas de miles de filas) y devuelve la columna como
+    category (un código por fila). Los resultados se memorizan en un caché JSON en disco
+    ('ruta_cache_normalizacion'), compartido entre ejecuciones y procesos del ETL; se
+    descarta solo si cambian las reglas (ver huella_reglas()).
+    """
+    def __init__(self, ruta_cache=None):
+        self.ruta_cache = ruta_cache
+        self.__huella = huella_reglas()
+        self.__memo = {columna: {} for columna in CADENAS}
+        self.__nuevos = {columna: {} for columna in CADENAS}
+        documento = self.__leer()
+        if documento.get('huella') == self.__huella:
+            for columna in CADENAS:
+                self.__memo[columna].update(documento.get(columna, {}))
+
+    def normalizar(self, serie, columna):
+        """Serie limpia (category) de la columna 'Patente' o 'Marca', con el mismo índice."""
+        # Las reglas parten del texto de cada celda (paso 5: astype(str))
+        codigos, textos = pd.factorize(serie.astype(str))
+        memo = self.__memo[columna]
+        faltantes = [texto for texto in textos if texto not in memo]
+        if faltantes:
+            resultados = CADENAS[columna](pd.Series(faltantes, dtype=object)).tolist()
+            nuevos = dict(zip(faltantes, resultados))
+            memo.update(nuevos)
+            self.__nuevos[columna].update(nuevos)
+
+        codigos_limpios, categorias = pd.factorize(np.array([memo[texto] for texto in textos], dtype=object))
+        limpia = pd.Categorical.from_codes(codigos_limpios[codigos], categories=categorias)
+        return pd.Series(limpia, index=serie.index, name=serie.name)
+
+    def guardar(self):
+        """
+        Agrega al caché en disco los valores calculados por esta instancia (escritura atómica;
+        si otro proceso guardó entre medio se conservan también sus valores).
+        """
+        if self.ruta_cache is None or not any(self.__nuevos.values()):
+            return
+        documento = self.__leer()
+        if documento.get('huella') != self.__huella:
+            documento = {'huella': self.__huella}
+        for columna, nuevos in self.__nuevos.items():
+            documento.setdefault(columna, {}).update(nuevos)
+
+        carpeta = os.path.dirname(os.path.abspath(self.ruta_cache))
+        os.makedirs(carpeta, exist_ok=True)
+        descriptor, ruta_temporal = tempfile.mkstemp(dir=carpeta, suffix='.tmp')
+        try:
+            with os.fdopen(descriptor, 'w', encoding='utf-8') as f:
+                json.dump(documento, f, ensure_ascii=False)
+            os.replace(ruta_temporal, self.ruta_cache)
+        except Exception:
+            if os.path.exists(ruta_temporal):
+                os.remove(ruta_temporal)
+            raise
+        self.__nuevos = {columna: {} for columna in CADENAS}
+
+    # --- Métodos privados ---
+    def __leer(self):
+        if self.ruta_cache is None or not os.path.exists(self.ruta_cache):
+            return {}
+        try:
+            with open(self.ruta_cache, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            # Un caché dañado sólo obliga a recalcular: no debe detener el ETL
+            print(f"Advertencia: no se pudo leer el caché de normalización '{self.ruta_cache}' ({e}). Se usará uno vacío.")
+            return {}
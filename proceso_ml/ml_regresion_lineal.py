@@ -1,5 +1,4 @@
 import os
-import sqlite3
 import numpy as np
 import pandas as pd
 import matplotlib
@@ -10,6 +9,77 @@ from sklearn.linear_model import LinearRegression
 from sklearn.metrics import root_mean_squared_error, mean_absolute_error, r2_score
 from datetime import datetime
 from config_manager import obtener_ruta
+from proceso_db.scripts.conexion import conectar
+
+# Datos diarios (tráfico + siniestros) para el modelo. También la usa el benchmark de optimizar_bd.
+QUERY_DATOS_DIARIOS = """
+WITH DiarioTrafico AS (
+    SELECT 
+        DT.Date,
+        SUM(FT.trafficVolume) as TotalTrafico
+    FROM factTraffic FT
+    JOIN dim_DateTime DT ON FT.idDateTime = DT.idDateTime
+    GROUP BY DT.Date
+),
+DiarioSiniestros AS (
+    SELECT 
+        DT.Date,
+        COUNT(DISTINCT FA.idAccident) as TotalAccidentes,
+        COUNT(FVA.idVehicleAccident) as TotalVehiculosInvolucrados
+    FROM factAccident FA
+    JOIN dim_DateTime DT ON FA.idDateTime = DT.idDateTime
+    LEFT JOIN factVehicleAccident FVA ON FA.idAccident = FVA.idAccident
+    GROUP BY DT.Date
+)
+SELECT 
+    DT.Date as Fecha,
+    DT.WeekDay,
+    DT.Month,
+    COALESCE(T.TotalTrafico, 0) as Contar,
+    COALESCE(S.TotalAccidentes, 0) as Cantidad_Accidentes,
+    COALESCE(S.TotalVehiculosInvolucrados, 0) as Cantidad_Vehiculos
+FROM dim_DateTime DT
+LEFT JOIN DiarioTrafico T ON DT.Date = T.Date
+LEFT JOIN DiarioSiniestros S ON DT.Date = S.Date
+WHERE DT.Hour = 12 AND DT.Minute = 0 
+  AND DT.Date <= DATE('now')
+  AND (T.TotalTrafico > 0 OR S.TotalAccidentes > 0)
+ORDER BY DT.Date ASC;
+"""
+
+# Misma consulta leyendo los siniestros de summary_AccidentDaily (opción 'resumen_diario_siniestros'),
+# sin unir factAccident con factVehicleAccident
+QUERY_DATOS_DIARIOS_RESUMEN = """
+WITH DiarioTrafico AS (
+    SELECT 
+        DT.Date,
+        SUM(FT.trafficVolume) as TotalTrafico
+    FROM factTraffic FT
+    JOIN dim_DateTime DT ON FT.idDateTime = DT.idDateTime
+    GROUP BY DT.Date
+)
+SELECT 
+    DT.Date as Fecha,
+    DT.WeekDay,
+    DT.Month,
+    COALESCE(T.TotalTrafico, 0) as Contar,
+    COALESCE(S.totalAccidents, 0) as Cantidad_Accidentes,
+    COALESCE(S.totalVehicles, 0) as Cantidad_Vehiculos
+FROM dim_DateTime DT
+LEFT JOIN DiarioTrafico T ON DT.Date = T.Date
+LEFT JOIN summary_AccidentDaily S ON DT.Date = S.Date
+WHERE DT.Hour = 12 AND DT.Minute = 0 
+  AND DT.Date <= DATE('now')
+  AND (T.TotalTrafico > 0 OR S.totalAccidents > 0)
+ORDER BY DT.Date ASC;
+"""
+
+def resumen_diario_vigente(conn):
+    """True si existe summary_AccidentDaily y no hay accidentes con el conteo pendiente."""
+    existe = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'summary_AccidentDaily'").fetchone()
+    if not existe:
+        return False
+    return conn.execute("SELECT 1 FROM factAccident WHERE totalVehicles IS NULL LIMIT 1").fetchone() is None
 
 class MLRegressionLineal():
     def __init__(self):
@@ -57,42 +127,10 @@ class MLRegressionLineal():
 
     def __cargar_datos_desde_db(self):
         """Carga datos agregados por día."""
-        conn = sqlite3.connect(self.ruta_db)
-        query = """
-        WITH DiarioTrafico AS (
-            SELECT 
-                DT.Date,
-                SUM(FT.trafficVolume) as TotalTrafico
-            FROM factTraffic FT
-            JOIN dim_DateTime DT ON FT.idDateTime = DT.idDateTime
-            GROUP BY DT.Date
-        ),
-        DiarioSiniestros AS (
-            SELECT 
-                DT.Date,
-                COUNT(DISTINCT FA.idAccident) as TotalAccidentes,
-                COUNT(FVA.idVehicleAccident) as TotalVehiculosInvolucrados
-            FROM factAccident FA
-            JOIN dim_DateTime DT ON FA.idDateTime = DT.idDateTime
-            LEFT JOIN factVehicleAccident FVA ON FA.idAccident = FVA.idAccident
-            GROUP BY DT.Date
-        )
-        SELECT 
-            DT.Date as Fecha,
-            DT.WeekDay,
-            DT.Month,
-            COALESCE(T.TotalTrafico, 0) as Contar,
-            COALESCE(S.TotalAccidentes, 0) as Cantidad_Accidentes,
-            COALESCE(S.TotalVehiculosInvolucrados, 0) as Cantidad_Vehiculos
-        FROM dim_DateTime DT
-        LEFT JOIN DiarioTrafico T ON DT.Date = T.Date
-        LEFT JOIN DiarioSiniestros S ON DT.Date = S.Date
-        WHERE DT.Hour = 12 AND DT.Minute = 0 
-          AND DT.Date <= DATE('now')
-          AND (T.TotalTrafico > 0 OR S.TotalAccidentes > 0)
-        ORDER BY DT.Date ASC;
-        """
+        conn = conectar(self.ruta_db, foreign_keys=False)
         try:
+            # Con el resumen diario al día se evita agregar factVehicleAccident
+            query = QUERY_DATOS_DIARIOS_RESUMEN if resumen_diario_vigente(conn) else QUERY_DATOS_DIARIOS
             df = pd.read_sql_query(query, conn)
             df["Fecha"] = pd.to_datetime(df["Fecha"])
             
@@ -0,0 +1,32 @@
+import os
+import sys
+import tempfile
+import pytest
+
+# config_manager arma su carpeta de usuario con %APPDATA% al importarse (Windows)
+os.environ.setdefault("APPDATA", tempfile.mkdtemp(prefix="appdata_"))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config_manager
+from proceso_db.scripts import crear_tablas
+from proceso_db.scripts.contexto_carga import ContextoCarga
+from proceso_db.scripts.dim import cargar_dimensiones
+
+
+@pytest.fixture
+def carpeta_base(tmp_path, monkeypatch):
+    """Carpeta principal temporal (en lugar de la elegida en el menú principal)."""
+    monkeypatch.setattr(config_manager, "cargar_ruta_base", lambda: str(tmp_path))
+    return tmp_path
+
+
+@pytest.fixture
+def base_con_dimensiones(carpeta_base):
+    """Base de datos con las tablas creadas y las dimensiones cargadas. Devuelve la carpeta de CSV limpios."""
+    ctx = ContextoCarga()
+    try:
+        crear_tablas.run(print, ctx)
+        cargar_dimensiones.run(print, ctx)
+        return ctx.ruta("ruta_csv_limpio")
+    finally:
+        ctx.cerrar()
@@ -0,0 +1,96 @@
+import os
+from proceso_db.scripts.contexto_carga import ContextoCarga
+from proceso_db.scripts.fact import cargar_factAccident, cargar_factAccident_conteo
+from utils.formato_limpio import ruta_tabla
+
+COLUMNAS_FICHA0 = ['ID Accidente', 'Tramo', 'Tipo Accidente', 'Ubicación Relativa', 'Condición calzada',
+                   'Luminosidad', 'Estado Atmosférico', 'Luz artificial',
+                   'Daños Ocasionados a la Infraestructura vial', 'Descripción del Accidente', 'FECHA/HORA']
+TABLAS = {
+    'Entorno': ['Condiciones del Entorno', 'Valor Condiciones del Entorno'],
+    'Concurrencia': ['Concurrencia', 'Valor Concurrencia'],
+    'Afectados': ['Consecuencia', 'Afectado', 'Cantidad Afectados'],
+    'Causas': ['Causa Probable', 'Valor Causa Probable'],
+    'Pistas': ['Pista'],
+    'Km': ['Km'],
+}
+
+
+def escribir(ruta, columnas, filas):
+    with open(ruta, 'w', encoding='utf-8') as f:
+        f.write("sep=|\n" + "|".join(columnas) + "\n")
+        for fila in filas:
+            f.write("|".join(str(valor) for valor in fila) + "\n")
+
+
+def escribir_ficha0(ruta_csv, *accidentes):
+    """ Cada accidente es (ID Accidente, FECHA/HORA); las tablas relacionadas quedan vacías. """
+    os.makedirs(os.path.dirname(ruta_csv), exist_ok=True)
+    escribir(ruta_csv, COLUMNAS_FICHA0, [[id_accidente, 0, 0, 0, 0, 0, 0, 0, 'No', 'Prueba', fecha_hora]
+                                         for id_accidente, fecha_hora in accidentes])
+    for tabla, columnas in TABLAS.items():
+        escribir(ruta_tabla(ruta_csv, tabla), ['ID Accidente'] + columnas, [])
+
+
+def test_archivo_fallido_no_revierte_los_anteriores(base_con_dimensiones, monkeypatch):
+    carpeta = os.path.join(base_con_dimensiones, "Siniestralidad", "Ficha 0", "2020")
+    ruta_mayo = os.path.join(carpeta, "Mayo_Limpio.csv")
+    ruta_junio = os.path.join(carpeta, "Junio_Limpio.csv")
+    escribir_ficha0(ruta_mayo, ('ACC-202005-001', '01/05/2020 10:30'))
+    escribir_ficha0(ruta_junio, ('ACC-202006-001', '01/06/2020 11:45'))
+
+    cargar_archivo = cargar_factAccident.cargar_archivo
+    def cargar_o_fallar(ctx, registro, archivo, *args):
+        resultado = cargar_archivo(ctx, registro, archivo, *args)
+        if archivo['nombre'] == "Junio_Limpio.csv":
+            raise RuntimeError("falla simulada después de insertar")
+        return resultado
+    monkeypatch.setattr(cargar_factAccident, "cargar_archivo", cargar_o_fallar)
+
+    mensajes = []
+    ctx = ContextoCarga()
+    cargar_factAccident.run(mensajes.append, ctx, [ruta_mayo, ruta_junio])
+    conn = ctx.conexion()
+    accidentes = conn.execute("SELECT idAccident FROM factAccident").fetchall()
+    cargas = conn.execute("SELECT FileName, Status FROM etl_log_cargas").fetchall()
+    ctx.cerrar()
+
+    assert any("falla simulada" in m for m in mensajes)
+    assert accidentes == [('ACC-202005-001',)]
+    assert cargas == [("Mayo_Limpio.csv", 'cargado')]
+
+
+def cargar_y_contar(archivos_csv, mensajes):
+    """ Carga Ficha 0 y los conteos con el resumen diario activado; devuelve el resumen. """
+    ctx = ContextoCarga()
+    ctx.config['resumen_diario_siniestros'] = True
+    try:
+        cargar_factAccident.run(mensajes.append, ctx, archivos_csv)
+        cargar_factAccident_conteo.run(mensajes.append, ctx)
+        return ctx.conexion().execute(
+            "SELECT Date, totalAccidents, totalVehicles FROM summary_AccidentDaily ORDER BY Date").fetchall()
+    finally:
+        ctx.cerrar()
+
+
+def test_resumen_diario_incremental(base_con_dimensiones):
+    carpeta = os.path.join(base_con_dimensiones, "Siniestralidad", "Ficha 0", "2020")
+    ruta_mayo = os.path.join(carpeta, "Mayo_Limpio.csv")
+    ruta_junio = os.path.join(carpeta, "Junio_Limpio.csv")
+    mensajes = []
+
+    # Sin resumen previo se arma completo
+    escribir_ficha0(ruta_mayo, ('ACC-1', '01/05/2020 10:30'), ('ACC-2', '01/05/2020 18:00'),
+                    ('ACC-3', '02/05/2020 08:15'))
+    assert cargar_y_contar([ruta_mayo], mensajes) == [('2020-05-01', 2, 0), ('2020-05-02', 1, 0)]
+    assert any("rehecho (2 días)" in m for m in mensajes)
+
+    # Un mes nuevo sólo recalcula sus días
+    escribir_ficha0(ruta_junio, ('ACC-4', '01/06/2020 11:45'))
+    assert cargar_y_contar([ruta_junio], mensajes) == [('2020-05-01', 2, 0), ('2020-05-02', 1, 0),
+                                                       ('2020-06-01', 1, 0)]
+    assert any("(1 días recalculados)" in m for m in mensajes)
+
+    # Reemplazar mayo: el día que pierde un accidente y el que se queda sin accidentes se corrigen
+    escribir_ficha0(ruta_mayo, ('ACC-1', '01/05/2020 10:30'))
+    assert cargar_y_contar([ruta_mayo], mensajes) == [('2020-05-01', 1, 0), ('2020-06-01', 1, 0)]
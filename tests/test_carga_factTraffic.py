@@ -0,0 +1,79 @@
+import os
+import pandas as pd
+from config_manager import obtener_ruta
+from proceso_db.scripts import crear_tablas, optimizar_bd
+from proceso_db.scripts.conexion import conectar
+from proceso_db.scripts.contexto_carga import ContextoCarga
+from proceso_db.scripts.clave_datetime import DateTimeKey
+from proceso_db.scripts.fact import cargar_factTraffic
+
+
+def escribir_trafico(ruta_csv, fecha, horas):
+    filas = [{'Plaza': 'Cachiyuyo', 'Categoria': 'Auto/Camioneta', 'Fecha': fecha,
+              'Hora': hora, 'Direccion': 'ASCENDENTE', 'Contar': 10 + hora} for hora in horas]
+    os.makedirs(os.path.dirname(ruta_csv), exist_ok=True)
+    pd.DataFrame(filas).to_csv(ruta_csv, index=False)
+
+
+def indices_factTraffic():
+    conn = conectar(obtener_ruta("ruta_database"))
+    nombres = {fila[0] for fila in conn.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'factTraffic' AND name LIKE 'idx_%'")}
+    conn.close()
+    return nombres
+
+
+def test_carga_incremental_mantiene_indices(base_con_dimensiones):
+    carpeta = os.path.join(base_con_dimensiones, "Tráfico Mensual", "2020")
+    mensajes = []
+
+    # Primera carga (tabla vacía): masiva, los índices se recrean en optimizar_bd
+    for mes in ('03', '04', '05'):
+        escribir_trafico(os.path.join(carpeta, f"{mes}.csv"), f'2020-{mes}-01', range(24))
+    cargar_factTraffic.run(mensajes.append)
+    assert indices_factTraffic() == set()
+    optimizar_bd.run(mensajes.append)
+    indices = indices_factTraffic()
+    assert "idx_factTraffic_idDateTime" in indices
+
+    # Un archivo pequeño respecto de lo cargado, en una nueva ejecución: los índices se mantienen
+    escribir_trafico(os.path.join(carpeta, "06.csv"), '2020-06-01', range(2))
+    crear_tablas.run(print)
+    cargar_factTraffic.run(mensajes.append)
+    assert indices_factTraffic() == indices
+    assert any("se mantienen los índices de factTraffic" in m for m in mensajes)
+
+
+def test_recarga_fallida_conserva_version_anterior(base_con_dimensiones, monkeypatch):
+    ruta_csv = os.path.join(base_con_dimensiones, "Tráfico Mensual", "2020", "mayo.csv")
+    mensajes = []
+    escribir_trafico(ruta_csv, '2020-05-01', range(3))
+    cargar_factTraffic.run(mensajes.append)
+
+    ctx = ContextoCarga()
+    conn = ctx.conexion()
+    antes = conn.execute("SELECT idDateTime, trafficVolume, idCarga FROM factTraffic ORDER BY idTraffic").fetchall()
+    rango_antes = conn.execute("SELECT MIN(idDateTime), MAX(idDateTime) FROM dim_DateTime").fetchone()
+    ctx.cerrar()
+    assert len(antes) == 3
+
+    # Versión corregida con fechas anteriores: extiende dim_DateTime hacia atrás y luego falla
+    escribir_trafico(ruta_csv, '2019-01-01', range(12))
+    def fallar(cursor, df_cargable):
+        raise RuntimeError("falla simulada al insertar")
+    monkeypatch.setattr(cargar_factTraffic, "insertar_lotes", fallar)
+    cargar_factTraffic.run(mensajes.append)
+    assert any("Extendiendo dim_DateTime" in m for m in mensajes)
+    assert any("falla simulada" in m for m in mensajes)
+
+    ctx = ContextoCarga()
+    conn = ctx.conexion()
+    despues = conn.execute("SELECT idDateTime, trafficVolume, idCarga FROM factTraffic ORDER BY idTraffic").fetchall()
+    cargas = conn.execute("SELECT idCarga, Status FROM etl_log_cargas").fetchall()
+    rango_despues = conn.execute("SELECT MIN(idDateTime), MAX(idDateTime) FROM dim_DateTime").fetchone()
+    DateTimeKey().verificar(conn) # Sigue siendo una secuencia densa
+    ctx.cerrar()
+
+    assert despues == antes
+    assert cargas == [(antes[0][2], 'cargado')]
+    assert rango_despues == rango_antes
@@ -0,0 +1,101 @@
+import math
+from datetime import datetime
+import pytest
+from proceso_etl.libro_excel import LibroExcel, MOTOR_CALAMINE, es_nulo
+
+pytest.importorskip("python_calamine")
+
+
+def motores(motor):
+    return {'motores_excel': {'xls': motor, 'xlsx': motor}}
+
+
+def normalizar(filas):
+    """Celdas nulas (vacías, errores de Excel) como None para comparar motores."""
+    return [[None if es_nulo(valor) or valor == '' else valor for valor in fila] for fila in filas]
+
+
+def sin_filas_vacias_al_final(filas):
+    filas = list(filas)
+    while filas and all(valor is None for valor in filas[-1]):
+        filas.pop()
+    return filas
+
+
+@pytest.fixture
+def libro_xlsx(tmp_path):
+    """Libro con la forma de las hojas de Tráfico Mensual y tipos mezclados, desde la fila 3 y la columna B."""
+    openpyxl = pytest.importorskip("openpyxl")
+    wb = openpyxl.Workbook()
+    hoja = wb.active
+    hoja.title = "Autos"
+    hoja["B3"] = "Tráfico Mensual"
+    hoja.append([])
+    hoja.append([None, "Día", "Dirección"] + [f"{h:02d}:00" for h in range(24)])
+    for dia in range(1, 4):
+        for direccion in ("ASCENDENTE", "DESCENDENTE"):
+            hoja.append([None, datetime(2020, 5, dia) if direccion == "ASCENDENTE" else None, direccion]
+                        + [h * dia + 0.5 * (h % 3 == 0) for h in range(24)])
+    hoja.append([None, "Total", "NA", "N/A", True, False, "texto", 7.0, None, "#DIV/0!"])
+    otra = wb.create_sheet("Vacía")
+    otra["A1"] = None
+    ruta = tmp_path / "libro.xlsx"
+    wb.save(ruta)
+    return str(ruta)
+
+
+def test_calamine_filas_y_leer_coinciden_con_openpyxl(libro_xlsx):
+    with LibroExcel(libro_xlsx, motores('openpyxl')) as base, LibroExcel(libro_xlsx, motores(MOTOR_CALAMINE)) as calamine:
+        assert base.motor == 'openpyxl' and calamine.motor == MOTOR_CALAMINE
+        assert calamine.hojas == base.hojas
+        assert normalizar(calamine.filas("Autos")) == normalizar(base.filas("Autos"))
+        df_base = base.leer("Autos", header=4)
+        df_calamine = calamine.leer("Autos", header=4)
+        assert list(df_calamine.columns) == list(df_base.columns)
+        assert df_calamine.astype(object).where(df_calamine.notna(), None).values.tolist() == \
+            df_base.astype(object).where(df_base.notna(), None).values.tolist()
+
+
+@pytest.mark.parametrize("motor", ['openpyxl', MOTOR_CALAMINE])
+def test_iterar_filas_coincide_con_filas_en_cache(libro_xlsx, motor):
+    with LibroExcel(libro_xlsx, motores(motor)) as libro:
+        transmitidas = normalizar(libro.iterar_filas("Autos", desde_fila=5, max_columnas=27))
+    with LibroExcel(libro_xlsx, motores(motor)) as libro:
+        en_cache = normalizar(fila[:27] for fila in libro.filas("Autos")[5:])
+    ancho = max(len(fila) for fila in en_cache)
+    transmitidas = [fila + [None] * (ancho - len(fila)) for fila in transmitidas]
+    assert sin_filas_vacias_al_final(transmitidas) == sin_filas_vacias_al_final(en_cache)
+
+
+def test_iterar_filas_calamine_no_deja_la_hoja_en_cache(libro_xlsx):
+    with LibroExcel(libro_xlsx, motores(MOTOR_CALAMINE)) as libro:
+        filas = list(libro.iterar_filas("Autos", desde_fila=5, max_columnas=27))
+        assert filas[0][1] == datetime(2020, 5, 1)
+        assert filas[0][3] == 0.5 and filas[0][4] == 1 and isinstance(filas[0][4], int)
+        assert not libro._LibroExcel__filas
+        assert list(libro.iterar_filas("Vacía")) in ([], [['']])
+
+
+def test_calamine_coincide_con_xlrd(tmp_path):
+    xlwt = pytest.importorskip("xlwt")
+    pytest.importorskip("xlrd")
+    wb = xlwt.Workbook()
+    hoja = wb.add_sheet("Ficha")
+    formato_fecha = xlwt.easyxf(num_format_str='DD/MM/YYYY')
+    for fila, valores in enumerate([["ID", "Fecha", "Valor", "Texto"],
+                                    ["A1", datetime(2020, 5, 1), 3, "NA"],
+                                    ["A2", datetime(2020, 5, 2), 2.5, ""],
+                                    ["A3", None, 0, "Sin dato"]]):
+        for columna, valor in enumerate(valores):
+            if isinstance(valor, datetime):
+                hoja.write(fila + 1, columna, valor, formato_fecha)
+            elif valor is not None:
+                hoja.write(fila + 1, columna, valor)
+    ruta = str(tmp_path / "libro.xls")
+    wb.save(ruta)
+
+    with LibroExcel(ruta, motores('xlrd')) as base, LibroExcel(ruta, motores(MOTOR_CALAMINE)) as calamine:
+        assert base.motor == 'xlrd' and calamine.motor == MOTOR_CALAMINE
+        assert normalizar(calamine.filas(0)) == normalizar(base.filas(0))
+        assert normalizar(calamine.iterar_filas(0)) == normalizar(base.filas(0))
+        assert calamine.leer(0, header=1).equals(base.leer(0, header=1))
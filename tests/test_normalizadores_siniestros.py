@@ -0,0 +1,89 @@
+"""
+Paridad de los normalizadores vectorizados de ETLSiniestralidad (__normalizar_km,
+__normalizar_hora, __normalizar_fecha y __combinar_fecha_hora) con las funciones escalares
+celda a celda (__fix_km, __fix_time, __fix_fecha y la combinación fila a fila original).
+"""
+from datetime import date, datetime, time
+import numpy as np
+import pandas as pd
+import pytest
+from proceso_etl.etl_siniestros import ETLSiniestralidad
+
+ANIO_ARCHIVO = 2020
+
+VALORES_KM = [
+    1234.5, 12, 12.0, 0.5, 1e-4, 1e-05, 0, 0.0, -3.0, -0.2, 1e14, 1e15, 1e20, np.int64(7), np.float64(98.7),
+    '12+300', '12+', '12+3+4', '+3', ' 45+7 ', '12–300', '12-5', '12,5', '12.5', ' 101 ', '1e3', '12.3.4',
+    'abc', 'km 12', '', ' ', True, None, np.nan, float('inf'), '-', ',',
+]
+
+VALORES_HORA = [
+    14.3, 14.30, 14.05, 9, 9.0, 0, 0.0, 23.59, 24.5, 25.0, 48.15, 14.75, 14.6, 14.599, -1.5, -0.3, 1e12, 1e8,
+    np.int64(5), np.float64(7.45), float('inf'), True,
+    datetime(2020, 5, 1, 14, 30), pd.Timestamp('2020-05-01 08:15:45'),
+    time(14, 30), time(7, 5, 9), '14:30', '14:30:15', '7:05', '07:05:00', ' 8:00 ', '24:00', '12:75',
+    '2 PM', '14.30', '1430', 'abc', '', None, np.nan, pd.NaT,
+]
+
+VALORES_FECHA = [
+    datetime(2020, 1, 2, 3, 4), date(2020, 1, 2), pd.Timestamp('2020-03-04'),
+    43831, 43831.5, 13.01, 1, 0, -5, 1e10, np.int64(44000), np.float64(44000.25), True,
+    '13.01', '13-01', '13/01', '1/1', ' 5 / 6 ', '13/01/16', '13-01-16', '13.01.16', '13/1/99', '13/01/2016',
+    '31/02/2020', '31/02', '0/0', '13/13', '2020-01-13', '2020/01/13', '13/01/2016 10:30', '01-may',
+    'abc', '', ' ', None, np.nan, pd.NaT,
+]
+
+
+@pytest.fixture
+def etl(carpeta_base):
+    return ETLSiniestralidad()
+
+
+def iguales(a, b):
+    if pd.isna(a) or pd.isna(b):
+        return pd.isna(a) and pd.isna(b)
+    return type(a) is type(b) and a == b
+
+
+def diferencias(serie, vectorizado, escalar):
+    return [(valor, v, e) for valor, v, e in zip(serie, vectorizado, escalar) if not iguales(v, e)]
+
+
+def test_normalizar_km_igual_a_fix_km(etl):
+    serie = pd.Series(VALORES_KM, dtype=object)
+    vectorizado = etl._ETLSiniestralidad__normalizar_km(serie)
+    escalar = serie.apply(etl._ETLSiniestralidad__fix_km)
+    assert len(vectorizado) == len(serie)
+    assert diferencias(serie, vectorizado, escalar) == []
+
+
+def test_normalizar_hora_igual_a_fix_time(etl):
+    serie = pd.Series(VALORES_HORA, dtype=object)
+    vectorizado = etl._ETLSiniestralidad__normalizar_hora(serie)
+    escalar = serie.apply(etl._ETLSiniestralidad__fix_time)
+    assert diferencias(serie, vectorizado, escalar) == []
+
+
+def test_normalizar_fecha_igual_a_fix_fecha(etl):
+    serie = pd.Series(VALORES_FECHA, dtype=object)
+    vectorizado = etl._ETLSiniestralidad__normalizar_fecha(serie, ANIO_ARCHIVO)
+    escalar = serie.apply(etl._ETLSiniestralidad__fix_fecha, anio_default=ANIO_ARCHIVO)
+    assert diferencias(serie, vectorizado, escalar) == []
+
+
+def test_combinar_fecha_hora_igual_a_fila_a_fila(etl):
+    fechas = etl._ETLSiniestralidad__normalizar_fecha(pd.Series(VALORES_FECHA, dtype=object), ANIO_ARCHIVO)
+    horas = etl._ETLSiniestralidad__normalizar_hora(pd.Series(VALORES_HORA[:len(VALORES_FECHA)], dtype=object))
+    horas[0] = time(10, 30, 15, 500000) # Segundos con decimales: formato no estándar
+    df = pd.DataFrame({'Fecha': fechas.to_numpy(), 'Hora': horas.to_numpy()})
+
+    def combinar(fila):
+        # Combinación fila a fila anterior a la versión vectorizada
+        f, h = fila.get("Fecha"), fila.get("Hora")
+        if pd.isna(f) or pd.isna(h): return pd.NaT
+        try: return pd.to_datetime(f"{f} {h}")
+        except Exception: return pd.NaT
+
+    vectorizado = etl._ETLSiniestralidad__combinar_fecha_hora(df)
+    escalar = df.apply(combinar, axis=1)
+    assert diferencias(df.index, vectorizado, escalar) == []
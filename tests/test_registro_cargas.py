@@ -0,0 +1,53 @@
+import os
+import pandas as pd
+import pytest
+from proceso_db.scripts.contexto_carga import ContextoCarga
+from proceso_db.scripts.registro_cargas import RegistroCargas
+from proceso_db.scripts.esquemas_csv import ESQUEMAS
+from utils.gestion_archivos import hash_archivo
+from utils.formato_limpio import ruta_tabla, guardar_columnar, TABLAS_FICHA0
+
+
+def test_ficha0_planifica_hash_propio_para_la_copia_columnar(base_con_dimensiones):
+    ruta_csv = os.path.join(base_con_dimensiones, "Siniestralidad", "Ficha 0", "2020_Limpio.csv")
+    os.makedirs(os.path.dirname(ruta_csv))
+    with open(ruta_csv, 'w', encoding='utf-8') as f:
+        f.write("sep=|\nID Accidente|FECHA/HORA\nA1|01/05/2020 10:30\n")
+    for tabla in TABLAS_FICHA0:
+        with open(ruta_tabla(ruta_csv, tabla), 'w', encoding='utf-8') as f:
+            f.write(f"sep=|\nID Accidente|{tabla}\nA1|1\n")
+
+    ctx = ContextoCarga()
+    plan = RegistroCargas(ctx, 'ficha0').planificar([ruta_csv], print)
+    ctx.cerrar()
+
+    archivo, = plan
+    # El libro de cargas usa el hash del conjunto; la copia columnar, el del CSV solo
+    assert archivo['hash_csv'] == hash_archivo(ruta_csv)
+    assert archivo['hash'] != archivo['hash_csv']
+    for tabla, info in archivo['tablas'].items():
+        assert info['hash_csv'] == hash_archivo(ruta_tabla(ruta_csv, tabla))
+
+
+def test_ficha0_lee_la_copia_columnar_vigente(base_con_dimensiones):
+    pytest.importorskip("pyarrow")
+    ruta_csv = os.path.join(base_con_dimensiones, "Siniestralidad", "Ficha 0", "2020_Limpio.csv")
+    os.makedirs(os.path.dirname(ruta_csv))
+    df = pd.DataFrame([{columna: 0 for columna in ESQUEMAS['ficha0'].columnas}])
+    df = df.drop(columns=['Fecha', 'Hora']).assign(**{
+        'ID Accidente': 'A1', 'Daños Ocasionados a la Infraestructura vial': 'No',
+        'Descripción del Accidente': 'desde el CSV', 'FECHA/HORA': '01/05/2020 10:30'})
+    with open(ruta_csv, 'w', encoding='utf-8') as f:
+        f.write("sep=|\n" + df.to_csv(sep='|', index=False))
+    for tabla in TABLAS_FICHA0:
+        with open(ruta_tabla(ruta_csv, tabla), 'w', encoding='utf-8') as f:
+            f.write(f"sep=|\nID Accidente|{tabla}\nA1|1\n")
+    # Copia con el hash del CSV pero otro contenido, para saber de dónde se leyó
+    guardar_columnar(df.assign(**{'Descripción del Accidente': 'desde la copia'}), ruta_csv, 'parquet')
+
+    ctx = ContextoCarga()
+    archivo, = RegistroCargas(ctx, 'ficha0').planificar([ruta_csv], print)
+    df_leido = ctx.leer_limpio(archivo, ESQUEMAS['ficha0'])
+    ctx.cerrar()
+
+    assert df_leido['Descripción del Accidente'].tolist() == ['desde la copia']
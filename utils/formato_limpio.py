@@ -0,0 +1,162 @@
+import os
+import numpy as np
+import pandas as pd
+from config_manager import obtener_opcion
+from utils.gestion_archivos import hash_archivo
+
+# Formato de la capa limpia ('formato_limpio' en config.json).
+# El CSV _Limpio se escribe siempre (lectura humana y libro de cargas); con 'parquet' o
+# 'feather' se agrega al lado una copia tipada que los cargadores leen sin re-parsear.
+FORMATO_CSV = 'csv'
+EXTENSIONES_COLUMNARES = {
+    'parquet': '.parquet',
+    'feather': '.feather',
+}
+
+# Metadato de la copia columnar con el hash del CSV escrito junto a ella
+CLAVE_HASH_CSV = b'hash_csv'
+
+# Ficha 0 normalizada: el CSV _Limpio trae un accidente por fila y cada relación va en su propio
+# CSV al lado ('<nombre>_Limpio_<Tabla>.csv', ver ruta_tabla). Se escriben y cargan juntos.
+TABLAS_FICHA0 = ('Entorno', 'Concurrencia', 'Afectados', 'Causas', 'Pistas', 'Km')
+
+# Textos que pandas convierte en nulo por defecto (na_values de read_csv / read_excel)
+VALORES_NULOS = frozenset([
+    '', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan', '1.#IND', '1.#QNAN',
+    '<NA>', 'N/A', 'NA', 'NULL', 'NaN', 'None', 'n/a', 'nan', 'null',
+])
+
+def pyarrow_disponible():
+    try:
+        import pyarrow # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+def obtener_formato(config=None):
+    """
+    Formato de la capa limpia según config.json. Si el valor no se reconoce o pyarrow
+    no está instalado se usa sólo CSV.
+    """
+    formato = str(obtener_opcion('formato_limpio', FORMATO_CSV, config)).strip().lower()
+    if formato == FORMATO_CSV:
+        return FORMATO_CSV
+    if formato not in EXTENSIONES_COLUMNARES:
+        print(f"Advertencia: formato_limpio '{formato}' no reconocido. Se usará sólo CSV.")
+        return FORMATO_CSV
+    if not pyarrow_disponible():
+        print(f"Advertencia: formato_limpio '{formato}' requiere pyarrow (no instalado). Se usará sólo CSV.")
+        return FORMATO_CSV
+    return formato
+
+def ruta_columnar(ruta_csv, formato):
+    """Ruta de la copia columnar de un CSV limpio (mismo nombre, otra extensión)."""
+    return os.path.splitext(ruta_csv)[0] + EXTENSIONES_COLUMNARES[formato]
+
+def ruta_tabla(ruta_csv, tabla):
+    """Ruta de una tabla relacionada de un CSV limpio normalizado (ej. TABLAS_FICHA0)."""
+    base, extension = os.path.splitext(ruta_csv)
+    return f"{base}_{tabla}{extension}"
+
+def tipar_columnas(df):
+    """
+    Columnas del DataFrame limpio tal como las ven los cargadores al leer el CSV, pero tipadas:
+    - numéricas y fechas (datetime64) se conservan; los enteros con nulos pasan a float,
+    - el resto se guarda como texto, igual que en el CSV, con nulo donde read_csv leería NaN.
+    """
+    tipado = pd.DataFrame(index=pd.RangeIndex(len(df)))
+    for columna in df.columns:
+        serie = df[columna].reset_index(drop=True)
+        if pd.api.types.is_bool_dtype(serie) or not (pd.api.types.is_numeric_dtype(serie) or pd.api.types.is_datetime64_dtype(serie)):
+            texto = serie.astype(str)
+            tipado[columna] = texto.where(serie.notna() & ~texto.isin(VALORES_NULOS), None)
+        elif pd.api.types.is_extension_array_dtype(serie):
+            tipado[columna] = serie.astype('float64')
+        else:
+            tipado[columna] = serie
+    return tipado
+
+def guardar_columnar(df, ruta_csv, formato):
+    """
+    Escribe la copia columnar del CSV limpio recién guardado (con el hash del CSV en sus
+    metadatos). Con formato 'csv' borra las copias columnares que hayan quedado de antes.
+    Devuelve la ruta escrita o None.
+    """
+    if formato not in EXTENSIONES_COLUMNARES:
+        for otro_formato in EXTENSIONES_COLUMNARES:
+            if os.path.exists(ruta_columnar(ruta_csv, otro_formato)):
+                os.remove(ruta_columnar(ruta_csv, otro_formato))
+        return None
+
+    import pyarrow as pa
+    tabla = pa.Table.from_pandas(tipar_columnas(df), preserve_index=False)
+    metadatos = dict(tabla.schema.metadata or {})
+    metadatos[CLAVE_HASH_CSV] = hash_archivo(ruta_csv).encode()
+    tabla = tabla.replace_schema_metadata(metadatos)
+
+    ruta = ruta_columnar(ruta_csv, formato)
+    if formato == 'parquet':
+        import pyarrow.parquet as pq
+        pq.write_table(tabla, ruta)
+    else:
+        import pyarrow.feather as feather
+        feather.write_feather(tabla, ruta)
+    return ruta
+
+def leer_columnar(ruta_csv, hash_csv):
+    """
+    Lee la copia columnar vigente de un CSV limpio: sólo si su metadato coincide con el hash
+    del CSV (si el CSV se reescribió o editó después, la copia se ignora).
+    Devuelve el DataFrame tipado, con los textos vacíos como NaN igual que read_csv, o None
+    si no hay copia vigente (o pyarrow no está instalado) y hay que leer el CSV.
+    """
+    tabla = _tabla_vigente(ruta_csv, hash_csv)
+    if tabla is None:
+        return None
+    return _nulos_como_nan(tabla.to_pandas())
+
+def leer_columnar_por_partes(ruta_csv, hash_csv, filas_por_parte):
+    """
+    Como leer_columnar, pero entrega la copia de a 'filas_por_parte' filas (iterador de
+    DataFrames): sólo una parte a la vez se convierte a pandas. None si no hay copia vigente.
+    """
+    tabla = _tabla_vigente(ruta_csv, hash_csv)
+    if tabla is None:
+        return None
+    return (_nulos_como_nan(lote.to_pandas()) for lote in tabla.to_batches(max_chunksize=filas_por_parte))
+
+def como_leido(df):
+    """
+    DataFrame limpio recién transformado tal como lo devolvería leer_columnar (columnas tipadas
+    y textos nulos como NaN), para cargarlo sin pasar por el disco (carga en línea).
+    """
+    return _nulos_como_nan(tipar_columnas(df))
+
+def _tabla_vigente(ruta_csv, hash_csv):
+    """Tabla pyarrow de la copia columnar cuyo metadato coincide con el hash del CSV (o None)."""
+    if not pyarrow_disponible():
+        return None
+    for formato in EXTENSIONES_COLUMNARES:
+        ruta = ruta_columnar(ruta_csv, formato)
+        if not os.path.exists(ruta):
+            continue
+        try:
+            if formato == 'parquet':
+                import pyarrow.parquet as pq
+                if (pq.read_schema(ruta).metadata or {}).get(CLAVE_HASH_CSV) != hash_csv.encode():
+                    continue
+                return pq.read_table(ruta)
+            import pyarrow.feather as feather
+            tabla = feather.read_table(ruta)
+            if (tabla.schema.metadata or {}).get(CLAVE_HASH_CSV) != hash_csv.encode():
+                continue
+            return tabla
+        except Exception as e:
+            print(f"Advertencia: no se pudo leer '{ruta}' ({e}). Se usará el CSV.")
+    return None
+
+def _nulos_como_nan(df):
+    """Nulos de las columnas de texto como NaN, igual que read_csv."""
+    for columna in df.columns[df.dtypes == object]:
+        df[columna] = df[columna].where(df[columna].notna(), np.nan)
+    return df
@@ -1 +1,145 @@
-# Cargar/guardar archivos
\ No newline at end of file
+import os
+import json
+import hashlib
+import tempfile
+import threading
+from datetime import datetime
+
+# Tamaño de bloque para calcular el hash (1 MB)
+TAMANO_BLOQUE_HASH = 1024 * 1024
+
+# Estados posibles de un archivo frente al manifiesto
+NUEVO = 'nuevo'
+MODIFICADO = 'modificado'
+SIN_CAMBIOS = 'sin_cambios'
+
+# Serializa el guardado entre instancias del mismo proceso (la carga en línea guarda
+# la sección 'etl' y la sección 'carga_db' desde hilos distintos)
+_BLOQUEO_GUARDADO = threading.Lock()
+
+def hash_archivo(ruta_archivo):
+    """
+    Hash de contenido rápido (BLAKE2b de 128 bits) leyendo el archivo por bloques.
+    Sirve para detectar archivos re-emitidos aunque conserven el mismo nombre.
+    """
+    hasher = hashlib.blake2b(digest_size=16)
+    with open(ruta_archivo, 'rb') as f:
+        for bloque in iter(lambda: f.read(TAMANO_BLOQUE_HASH), b''):
+            hasher.update(bloque)
+    return hasher.hexdigest()
+
+class ManifiestoArchivos():
+    """
+    Registro persistente (JSON) de los archivos fuente ya procesados en cada etapa
+    ('etl': Excel -> CSV, 'carga_db': CSV -> base de datos).
+    Por archivo guarda tamaño, mtime y hash de contenido. Si tamaño y mtime no cambiaron
+    se considera sin cambios sin leer el archivo (camino rápido, sólo os.stat); si cambiaron
+    se recalcula el hash y sólo un contenido distinto cuenta como modificado.
+    """
+    VERSION = 1
+
+    def __init__(self, ruta_manifiesto):
+        self.ruta_manifiesto = ruta_manifiesto
+        # Las rutas se guardan relativas a la carpeta del manifiesto (la carpeta base)
+        self.carpeta_base = os.path.dirname(os.path.abspath(ruta_manifiesto))
+        self.__secciones = self.__leer().get('secciones', {})
+        self.__modificadas = set()
+
+    # --- Consulta ---
+    def estado(self, seccion, ruta_archivo):
+        """
+        Compara el archivo con lo registrado en 'seccion'.
+        Devuelve (estado, hash): estado es NUEVO, MODIFICADO o SIN_CAMBIOS y hash es el hash
+        de contenido si fue necesario calcularlo (None en el camino rápido).
+        """
+        entrada = self.__secciones.get(seccion, {}).get(self.__clave(ruta_archivo))
+        if entrada is None:
+            return NUEVO, None
+
+        stat = os.stat(ruta_archivo)
+        if stat.st_size == entrada['tamano'] and stat.st_mtime_ns == entrada['mtime_ns']:
+            return SIN_CAMBIOS, None
+
+        hash_actual = hash_archivo(ruta_archivo)
+        if hash_actual != entrada['hash']:
+            return MODIFICADO, hash_actual
+
+        # Mismo contenido con otro mtime (copiado/tocado): se actualiza la huella sin reprocesar
+        entrada['tamano'] = stat.st_size
+        entrada['mtime_ns'] = stat.st_mtime_ns
+        self.__modificadas.add(seccion)
+        return SIN_CAMBIOS, hash_actual
+
+    def entrada(self, seccion, ruta_archivo):
+        """Datos registrados del archivo (o None si no está en el manifiesto)."""
+        return self.__secciones.get(seccion, {}).get(self.__clave(ruta_archivo))
+
+    # --- Registro ---
+    def registrar(self, seccion, ruta_archivo, hash_contenido=None, **datos_extra):
+        """
+        Registra (o actualiza) el archivo como procesado en 'seccion'.
+        'hash_contenido' evita volver a leer el archivo si ya se calculó en estado().
+        """
+        stat = os.stat(ruta_archivo)
+        entrada = {
+            'tamano': stat.st_size,
+            'mtime_ns': stat.st_mtime_ns,
+            'hash': hash_contenido or hash_archivo(ruta_archivo),
+            'procesado': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        }
+        entrada.update(datos_extra)
+        self.__secciones.setdefault(seccion, {})[self.__clave(ruta_archivo)] = entrada
+        self.__modificadas.add(seccion)
+
+    def olvidar(self, seccion, ruta_archivo):
+        """Quita el archivo de 'seccion' (se volverá a procesar como nuevo)."""
+        if self.__secciones.get(seccion, {}).pop(self.__clave(ruta_archivo), None) is not None:
+            self.__modificadas.add(seccion)
+
+    def guardar(self):
+        """
+        Escribe el manifiesto de forma atómica (archivo temporal + reemplazo).
+        Sólo se reescriben las secciones modificadas por esta instancia, así la etapa ETL
+        y la carga a la base de datos no se pisan los registros entre sí.
+        """
+        if not self.__modificadas:
+            return
+        with _BLOQUEO_GUARDADO:
+            documento = self.__leer()
+            secciones = documento.setdefault('secciones', {})
+            for seccion in self.__modificadas:
+                secciones[seccion] = self.__secciones.get(seccion, {})
+            documento['version'] = self.VERSION
+
+            os.makedirs(self.carpeta_base, exist_ok=True)
+            descriptor, ruta_temporal = tempfile.mkstemp(dir=self.carpeta_base, suffix='.tmp')
+            try:
+                with os.fdopen(descriptor, 'w', encoding='utf-8') as f:
+                    json.dump(documento, f, ensure_ascii=False, indent=1, sort_keys=True)
+                os.replace(ruta_temporal, self.ruta_manifiesto)
+            except Exception:
+                if os.path.exists(ruta_temporal):
+                    os.remove(ruta_temporal)
+                raise
+            self.__modificadas.clear()
+
+    # --- Métodos privados ---
+    def __leer(self):
+        if not os.path.exists(self.ruta_manifiesto):
+            return {}
+        try:
+            with open(self.ruta_manifiesto, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            # Un manifiesto dañado sólo provoca reprocesar: no debe detener el proceso
+            print(f"Advertencia: no se pudo leer el manifiesto '{self.ruta_manifiesto}' ({e}). Se usará uno vacío.")
+            return {}
+
+    def __clave(self, ruta_archivo):
+        ruta_absoluta = os.path.abspath(ruta_archivo)
+        try:
+            clave = os.path.relpath(ruta_absoluta, self.carpeta_base)
+        except ValueError:
+            # Otra unidad en Windows: se usa la ruta absoluta
+            clave = ruta_absoluta
+        return clave.replace(os.sep, '/')
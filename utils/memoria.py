@@ -0,0 +1,51 @@
+import sys
+
+def memoria_maxima_mb():
+    """
+    Pico de memoria residente (RSS) del proceso en MB desde que se inició, o None si el
+    sistema no lo informa. En Windows es el PeakWorkingSetSize de GetProcessMemoryInfo;
+    en Linux y macOS, ru_maxrss de getrusage.
+    """
+    try:
+        if sys.platform == 'win32':
+            return _pico_windows() / (1024 * 1024)
+        import resource
+        pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux informa KB y macOS bytes
+        return pico / (1024 * 1024) if sys.platform == 'darwin' else pico / 1024
+    except Exception:
+        return None
+
+def texto_memoria_maxima():
+    """Línea de log con el pico de memoria del proceso (vacía si no se puede medir)."""
+    pico = memoria_maxima_mb()
+    return "" if pico is None else f"Memoria máxima del proceso: {pico:.0f} MB"
+
+# --- Funciones privadas ---
+def _pico_windows():
+    import ctypes
+    from ctypes import wintypes
+
+    class CONTADORES_MEMORIA(ctypes.Structure): # PROCESS_MEMORY_COUNTERS
+        _fields_ = [
+            ('cb', wintypes.DWORD),
+            ('PageFaultCount', wintypes.DWORD),
+            ('PeakWorkingSetSize', ctypes.c_size_t),
+            ('WorkingSetSize', ctypes.c_size_t),
+            ('QuotaPeakPagedPoolUsage', ctypes.c_size_t),
+            ('QuotaPagedPoolUsage', ctypes.c_size_t),
+            ('QuotaPeakNonPagedPoolUsage', ctypes.c_size_t),
+            ('QuotaNonPagedPoolUsage', ctypes.c_size_t),
+            ('PagefileUsage', ctypes.c_size_t),
+            ('PeakPagefileUsage', ctypes.c_size_t),
+        ]
+
+    contadores = CONTADORES_MEMORIA()
+    contadores.cb = ctypes.sizeof(contadores)
+    kernel32 = ctypes.windll.kernel32
+    kernel32.GetCurrentProcess.restype = wintypes.HANDLE
+    psapi = ctypes.windll.psapi
+    psapi.GetProcessMemoryInfo.argtypes = [wintypes.HANDLE, ctypes.POINTER(CONTADORES_MEMORIA), wintypes.DWORD]
+    if not psapi.GetProcessMemoryInfo(kernel32.GetCurrentProcess(), ctypes.byref(contadores), contadores.cb):
+        raise ctypes.WinError()
+    return contadores.PeakWorkingSetSize
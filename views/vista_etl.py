@@ -9,7 +9,8 @@ from proceso_etl import deteccion_auto
 current_dir = os.path.dirname(__file__)
 project_root = os.path.abspath(os.path.join(current_dir, '..'))
 proceso_db_path = os.path.join(project_root, 'proceso_db')
-from proceso_db import cargar_bd
+from proceso_db import cargar_bd, carga_en_linea
+from config_manager import obtener_opcion
 
 class VistaETL(tk.Frame):
     def __init__(self, parent, controller):
@@ -127,6 +128,11 @@ class VistaETL(tk.Frame):
         proceso_cancelado = False
         try:
             callback_para_etl_1 = lambda msg, curr=None, tot=None: callback_original(msg, curr, tot, etapa=1)
+
+            if obtener_opcion('carga_en_linea', False):
+                self.ejecutar_en_linea(callback_original, cancel_event_recibido)
+                return
+
             callback_original("\n" + "="*30 + " INICIANDO FASE 1: EXCEL A CSV ...", etapa=1)
             
             resumen_etl1, _, proceso_cancelado = deteccion_auto.ejecutar_proceso_etl_completo(
@@ -161,6 +167,28 @@ class VistaETL(tk.Frame):
             error_msg = f"Error no capturado:\n{type(e).__name__}: {e}"
             self.after(0, self.finalizar_proceso_con_error, error_msg)
 
+    def ejecutar_en_linea(self, callback_original, cancel_event_recibido):
+        """Fases 1 y 2 a la vez: cada archivo transformado se carga mientras se transforma el siguiente."""
+        callback_para_etl_1 = lambda msg, curr=None, tot=None: callback_original(msg, curr, tot, etapa=1)
+        callback_para_etl_2 = lambda msg, curr=None, tot=None: callback_original(msg, curr, tot, etapa=2)
+        callback_original("\n" + "="*30 + " INICIANDO FASES 1 Y 2 EN LÍNEA: EXCEL A BASE DE DATOS ...", etapa=1)
+
+        resumen_etl1, resumen_etl2, proceso_cancelado = carga_en_linea.ejecutar_en_linea(
+            callback_para_etl_1,
+            callback_para_etl_2,
+            cancel_event_recibido
+        )
+
+        if proceso_cancelado:
+            self.after(0, self.finalizar_proceso, "Proceso cancelado durante la carga en línea.", True)
+            return
+
+        if "Errores: 0" not in resumen_etl1:
+            callback_para_etl_1("\nADVERTENCIA: Se detectaron errores en la fase 1.")
+
+        mensaje_resumen_final = f"ETL 1: {resumen_etl1}\nETL 2: {resumen_etl2}"
+        self.after(0, self.finalizar_proceso, mensaje_resumen_final, proceso_cancelado)
+
     def finalizar_proceso(self, mensaje_resumen, cancelado):
         self.progreso_callback("\n" + "="*40 + " PROCESO FINALIZADO " + "="*40)
         